@@ -162,3 +162,23 @@ STATIC_URL = 'static/'
 
 # added by me
 AUTH_USER_MODEL = 'users.User'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'locations': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'listing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Property
+from .models import Property, PropertyViewStats
 
 # Register your models here.
 
@@ -7,4 +7,13 @@ from .models import Property
 class PropertyAdmin(admin.ModelAdmin):
     list_display = ('title', 'price', 'is_featured')
     list_editable = ('is_featured',)  # Allows checking the box without opening the detail page
-    list_filter = ('is_featured',)    # Allows filtering the table to see only featured props
\ No newline at end of file
+    list_filter = ('is_featured',)    # Allows filtering the table to see only featured props
+
+
+@admin.register(PropertyViewStats)
+class PropertyViewStatsAdmin(admin.ModelAdmin):
+    list_display = ('property', 'views', 'unique_viewers', 'updated_at')
+    ordering = ('-views',)
+    exclude = ('unique_sketch',)  # Raw HyperLogLog registers
+    readonly_fields = ('property', 'views', 'unique_viewers', 'updated_at')
+    search_fields = ('property__title',)
@@ -0,0 +1,199 @@
+import time
+import hashlib
+import logging
+import threading
+import numpy as np
+
+# 2^12 one-byte registers: 4 KB per listing, about 1.6% standard error
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+FLUSH_INTERVAL_SECONDS = 5
+
+logger = logging.getLogger(__name__)
+
+
+class HyperLogLog:
+    """
+    Distinct-count sketch. Merging two sketches (register-wise max) counts the union,
+    so sketches from different workers combine without double counting.
+    Format: registers bytearray(HLL_REGISTERS), each the longest run of leading zeros seen + 1
+    """
+    def __init__(self, registers=None):
+        self.registers = bytearray(registers) if registers else bytearray(HLL_REGISTERS)
+
+    def add(self, value):
+        digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+        hashed = int.from_bytes(digest, 'big')
+        index = hashed >> (64 - HLL_PRECISION)
+        rest = hashed & ((1 << (64 - HLL_PRECISION)) - 1)
+        rank = (64 - HLL_PRECISION) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        merged = np.maximum(np.frombuffer(self.registers, dtype=np.uint8), np.frombuffer(other.registers, dtype=np.uint8))
+        self.registers = bytearray(merged.tobytes())
+        return self
+
+    def count(self):
+        registers = np.frombuffer(self.registers, dtype=np.uint8)
+        alpha = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+        estimate = alpha * HLL_REGISTERS ** 2 / float(np.sum(np.ldexp(1.0, -registers.astype(np.int64))))
+
+        # Small cardinalities: linear counting over the empty registers is more accurate
+        empty = int(np.count_nonzero(registers == 0))
+        if estimate <= 2.5 * HLL_REGISTERS and empty:
+            estimate = HLL_REGISTERS * np.log(HLL_REGISTERS / empty)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return bytes(self.registers)
+
+
+class ViewAnalytics:
+    """
+    Per-listing view counts and unique-viewer sketches, buffered in memory and
+    flushed to PropertyViewStats in one batched upsert every FLUSH_INTERVAL_SECONDS.
+    The flush runs on a background thread once a serving process starts it (listing.signals);
+    without one, record() flushes inline when the oldest buffered view is older than the interval.
+    Counts are added and sketches merged on flush under row locks, so several workers can write
+    the same rows (on SQLite the write lock serialises the flushes instead).
+    Format: pending {property_id: [views, HyperLogLog]}, pending_since: time of the oldest buffered view
+    """
+    def __init__(self):
+        self.pending = {}
+        self.pending_since = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def record(self, property_id, viewer):
+        now = time.time()
+        with self._lock:
+            entry = self.pending.get(property_id)
+            if entry is None:
+                entry = self.pending[property_id] = [0, HyperLogLog()]
+            entry[0] += 1
+            entry[1].add(viewer)
+            if self.pending_since is None:
+                self.pending_since = now
+            due = self._thread is None and now - self.pending_since >= FLUSH_INTERVAL_SECONDS
+
+        if due:
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("View analytics flush failed; the views stay buffered")
+
+    def _restore(self, batch):
+        with self._lock:
+            for prop_id, (views, sketch) in batch.items():
+                entry = self.pending.get(prop_id)
+                if entry is None:
+                    self.pending[prop_id] = [views, sketch]
+                else:
+                    entry[0] += views
+                    entry[1].merge(sketch)
+            if self.pending_since is None:
+                self.pending_since = time.time()
+
+    def flush(self):
+        """
+        Writes the buffered counts. Returns the number of listings written.
+        On failure (e.g. another worker holding the SQLite write lock) the batch is kept for the next flush.
+        """
+        from django.db import transaction
+        from django.utils import timezone
+        from .models import Property, PropertyViewStats
+
+        with self._lock:
+            batch, self.pending, self.pending_since = self.pending, {}, None
+        if not batch:
+            return 0
+
+        try:
+            with transaction.atomic():
+                # Views of listings deleted since are dropped
+                alive = set(Property.objects.filter(id__in=list(batch)).values_list('id', flat=True))
+
+                # Empty rows first, so every row exists to be locked: two workers flushing a listing's
+                # first views would otherwise both read nothing and the later upsert would overwrite the other
+                now = timezone.now()
+                PropertyViewStats.objects.bulk_create(
+                    [PropertyViewStats(property_id=prop_id, unique_sketch=bytes(HLL_REGISTERS), updated_at=now) for prop_id in alive],
+                    ignore_conflicts=True
+                )
+                rows = list(PropertyViewStats.objects.select_for_update().filter(property_id__in=alive))
+                for row in rows:
+                    views, sketch = batch[row.property_id]
+                    merged = HyperLogLog(sketch.registers).merge(HyperLogLog(row.unique_sketch))
+                    row.views += views
+                    row.unique_viewers = merged.count()
+                    row.unique_sketch = merged.to_bytes()
+                    row.updated_at = now
+
+                PropertyViewStats.objects.bulk_update(rows, ['views', 'unique_viewers', 'unique_sketch', 'updated_at'])
+        except Exception:
+            self._restore(batch)
+            raise
+        return len(rows)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='view-analytics-flush', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        from django.db import connection
+        while True:
+            time.sleep(FLUSH_INTERVAL_SECONDS)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("View analytics flush failed; retrying next interval")
+            finally:
+                connection.close()
+
+    def stats(self, prop_ids):
+        """
+        Stored totals plus what this worker has not flushed yet.
+        Returns {property_id: {"views", "unique_viewers", "updated_at"}} for every id in prop_ids.
+        """
+        from .models import PropertyViewStats
+
+        stored = {row.property_id: row for row in PropertyViewStats.objects.filter(property_id__in=prop_ids)}
+        with self._lock:
+            pending = {prop_id: self.pending[prop_id] for prop_id in prop_ids if prop_id in self.pending}
+
+        result = {}
+        for prop_id in prop_ids:
+            row = stored.get(prop_id)
+            views = row.views if row else 0
+            unique_viewers = row.unique_viewers if row else 0
+            if prop_id in pending:
+                pending_views, sketch = pending[prop_id]
+                views += pending_views
+                merged = HyperLogLog(sketch.registers)
+                if row:
+                    merged.merge(HyperLogLog(row.unique_sketch))
+                unique_viewers = merged.count()
+            result[prop_id] = {
+                "views": views,
+                "unique_viewers": unique_viewers,
+                "updated_at": row.updated_at if row else None
+            }
+        return result
+
+
+def viewer_key(request):
+    """
+    Signed-in users count by id; anonymous visitors by client address.
+    """
+    if request.user.is_authenticated:
+        return f"user:{request.user.id}"
+    return f"anon:{request.META.get('REMOTE_ADDR', '')}"
+
+
+view_analytics = ViewAnalytics()
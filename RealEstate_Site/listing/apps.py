@@ -8,6 +8,12 @@ class ListingsConfig(AppConfig):
         from .models import Property
         from .trees import property_tree,size_tree
         from .heap import cheap_heap,size_heap
+        from .clusters import property_clusters
+        from .geo_index import property_geo_index
+        from .co_occurrence import co_occurrence
+        from .minhash import description_index
+        from locations.graphs import recommendation_graph
+        from locations.feature_knn import property_features
         import sys
         import listing.signals
         
@@ -19,4 +25,10 @@ class ListingsConfig(AppConfig):
                 size_tree.insert(p)
                 cheap_heap.insert(p)
                 size_heap.insert(p)
-            
\ No newline at end of file
+
+            property_clusters.load()
+            property_geo_index.load()
+            recommendation_graph.load()
+            property_features.load()
+            co_occurrence.load()
+            description_index.load()
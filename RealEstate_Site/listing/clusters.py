@@ -0,0 +1,260 @@
+import math
+import itertools
+from .kdtree import KDTree
+
+MIN_ZOOM = 0
+MAX_ZOOM = 16
+# Points closer than this many screen pixels at a zoom level share a marker
+CLUSTER_RADIUS_PX = 60
+TILE_EXTENT_PX = 256
+
+
+def project(lat, lng):
+    """
+    Web Mercator, scaled to the unit square with (0, 0) at the north-west corner.
+    """
+    sin_lat = math.sin(math.radians(max(min(lat, 85.0511), -85.0511)))
+    x = lng / 360.0 + 0.5
+    y = 0.5 - 0.25 * math.log((1 + sin_lat) / (1 - sin_lat)) / math.pi
+    return x, y
+
+
+def unproject(x, y):
+    lng = (x - 0.5) * 360.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+    return lat, lng
+
+
+def zoom_radius(zoom):
+    return CLUSTER_RADIUS_PX / (TILE_EXTENT_PX * 2 ** zoom)
+
+
+class _Cluster:
+    __slots__ = ('x_sum', 'y_sum', 'members', 'price_range')
+
+    def __init__(self):
+        self.x_sum = 0.0
+        self.y_sum = 0.0
+        # {property_id: price}
+        self.members = {}
+        # (min_price, max_price), or None when a removal may have changed it
+        self.price_range = None
+
+    @property
+    def count(self):
+        return len(self.members)
+
+    @property
+    def center(self):
+        return self.x_sum / len(self.members), self.y_sum / len(self.members)
+
+    def add(self, prop_id, x, y, price):
+        self.x_sum += x
+        self.y_sum += y
+        self.members[prop_id] = price
+        if self.price_range is not None:
+            self.price_range = (min(self.price_range[0], price), max(self.price_range[1], price))
+        elif len(self.members) == 1:
+            self.price_range = (price, price)
+
+    def merge(self, other):
+        self.x_sum += other.x_sum
+        self.y_sum += other.y_sum
+        self.members.update(other.members)
+        self.price_range = None
+
+    def discard(self, prop_id, x, y):
+        self.x_sum -= x
+        self.y_sum -= y
+        price = self.members.pop(prop_id, None)
+        if self.price_range is not None and price in self.price_range:
+            self.price_range = None
+
+    def prices(self):
+        if self.price_range is None:
+            prices = self.members.values()
+            self.price_range = (min(prices), max(prices))
+        return self.price_range
+
+
+class _Level:
+    def __init__(self):
+        self.clusters = {}
+        self.owner = {}
+        self.tree = KDTree(2)
+
+
+class PropertyClusterIndex:
+    """
+    Supercluster-style marker clustering. Every zoom level from MIN_ZOOM to MAX_ZOOM
+    partitions the properties into clusters with a k-d tree over cluster centres;
+    above MAX_ZOOM every property is its own marker.
+    Format: points {property_id: (x, y, price)}, levels {zoom: _Level}
+    """
+    def __init__(self):
+        self.points = {}
+        self.levels = {}
+        self.point_tree = KDTree(2)
+        self.next_id = itertools.count(1)
+        self.loaded = False
+
+    def load(self):
+        from .models import Property
+
+        rows = Property.objects.values_list('id', 'location_id__latitude', 'location_id__longitude', 'price')
+        self.build(
+            (prop_id, lat, lng, float(price))
+            for prop_id, lat, lng, price in rows.iterator(chunk_size=5000)
+        )
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def build(self, rows):
+        """
+        Bottom-up pass: clusters at each zoom are formed by merging the
+        clusters of the zoom below that fall within the pixel radius.
+        """
+        self.points = {}
+        for prop_id, lat, lng, price in rows:
+            x, y = project(lat, lng)
+            self.points[prop_id] = (x, y, price)
+        self.point_tree = KDTree(2, ((prop_id, (x, y)) for prop_id, (x, y, _) in self.points.items()))
+
+        self.levels = {}
+        # Start from one singleton per property
+        previous = {}
+        for prop_id, (x, y, price) in self.points.items():
+            cluster = _Cluster()
+            cluster.add(prop_id, x, y, price)
+            previous[prop_id] = cluster
+        previous_tree = self.point_tree
+
+        for zoom in range(MAX_ZOOM, MIN_ZOOM - 1, -1):
+            radius = zoom_radius(zoom)
+            level = _Level()
+            merged = set()
+
+            for key, source in previous.items():
+                if key in merged:
+                    continue
+                cluster = _Cluster()
+                for neighbor_key in previous_tree.within(source.center, radius):
+                    if neighbor_key in merged:
+                        continue
+                    merged.add(neighbor_key)
+                    cluster.merge(previous[neighbor_key])
+
+                cluster_id = next(self.next_id)
+                level.clusters[cluster_id] = cluster
+                for prop_id in cluster.members:
+                    level.owner[prop_id] = cluster_id
+
+            level.tree.build((cluster_id, cluster.center) for cluster_id, cluster in level.clusters.items())
+            self.levels[zoom] = level
+            previous, previous_tree = level.clusters, level.tree
+
+        self.loaded = True
+
+    def insert_property(self, property_obj):
+        # Before the first load the DB is the source of truth, so there is nothing to keep current
+        if self.loaded:
+            location = property_obj.location_id
+            self.insert(property_obj.id, location.latitude, location.longitude, float(property_obj.price))
+
+    def insert(self, prop_id, lat, lng, price):
+        """
+        Joins the nearest cluster within the pixel radius at every zoom, or starts a new one.
+        """
+        if prop_id in self.points:
+            self.remove(prop_id)
+
+        x, y = project(lat, lng)
+        self.points[prop_id] = (x, y, price)
+        self.point_tree.insert(prop_id, (x, y))
+
+        for zoom, level in self.levels.items():
+            radius = zoom_radius(zoom)
+            nearby = level.tree.nearest((x, y), 1)
+
+            if nearby and nearby[0][0] <= radius * radius:
+                cluster_id = nearby[0][1]
+                cluster = level.clusters[cluster_id]
+            else:
+                cluster_id = next(self.next_id)
+                cluster = level.clusters[cluster_id] = _Cluster()
+
+            cluster.add(prop_id, x, y, price)
+            level.owner[prop_id] = cluster_id
+            level.tree.insert(cluster_id, cluster.center)
+
+    def remove(self, prop_id):
+        point = self.points.pop(prop_id, None)
+        if point is None:
+            return False
+        x, y, _ = point
+        self.point_tree.remove(prop_id)
+
+        for level in self.levels.values():
+            cluster_id = level.owner.pop(prop_id)
+            cluster = level.clusters[cluster_id]
+            cluster.discard(prop_id, x, y)
+
+            if cluster.count:
+                level.tree.insert(cluster_id, cluster.center)
+            else:
+                del level.clusters[cluster_id]
+                level.tree.remove(cluster_id)
+        return True
+
+    def _boxes(self, south, west, north, east):
+        """
+        Viewport as projected boxes; two of them when it crosses the antimeridian.
+        """
+        x1, y2 = project(south, west)
+        x2, y1 = project(north, east)
+        if west > east:
+            return [((x1, y1), (1.0, y2)), ((0.0, y1), (x2, y2))]
+        return [((x1, y1), (x2, y2))]
+
+    def clusters(self, south, west, north, east, zoom):
+        """
+        Markers whose centre lies in the viewport at this zoom.
+        Format: [{"id", "lat", "lng", "count", "min_price", "max_price", "property_id"?}, ...]
+        """
+        self.ensure_loaded()
+        zoom = max(MIN_ZOOM, zoom)
+        markers = []
+
+        if zoom > MAX_ZOOM:
+            for lo, hi in self._boxes(south, west, north, east):
+                for prop_id in self.point_tree.range(lo, hi):
+                    x, y, price = self.points[prop_id]
+                    lat, lng = unproject(x, y)
+                    markers.append({
+                        "id": f"p{prop_id}", "lat": lat, "lng": lng, "count": 1,
+                        "min_price": price, "max_price": price, "property_id": prop_id
+                    })
+            return markers
+
+        level = self.levels.get(zoom)
+        if level is None:
+            return markers
+
+        for lo, hi in self._boxes(south, west, north, east):
+            for cluster_id in level.tree.range(lo, hi):
+                cluster = level.clusters[cluster_id]
+                lat, lng = unproject(*cluster.center)
+                min_price, max_price = cluster.prices()
+                marker = {
+                    "id": f"c{cluster_id}", "lat": lat, "lng": lng, "count": cluster.count,
+                    "min_price": min_price, "max_price": max_price
+                }
+                if cluster.count == 1:
+                    marker["property_id"] = next(iter(cluster.members))
+                markers.append(marker)
+        return markers
+
+
+property_clusters = PropertyClusterIndex()
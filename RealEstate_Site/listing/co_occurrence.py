@@ -0,0 +1,191 @@
+import math
+import heapq
+import threading
+from collections import Counter
+
+# A favorite says more about taste than a passing view
+FAVORITE_WEIGHT = 3
+VIEW_WEIGHT = 1
+# Only a user's most recent favorites are paired, so one heavy user cannot add O(n^2) pairs
+MAX_ITEMS_PER_USER = 50
+# Each property keeps its strongest co-occurrences; the rest are pruned once it holds twice this many
+MAX_NEIGHBORS_KEPT = 100
+TOP_N = 20
+
+
+class CoOccurrenceIndex:
+    """
+    "People who liked this also liked": item-item co-occurrence built from favorites and recent views.
+    Built in one pass over Favorite at startup, then updated per favorite toggle and per new view.
+    Scores are co-occurrence weight / sqrt(occurrences(a) * occurrences(b)).
+    Format: counts {property_id: Counter({other_id: weight})}, top {property_id: [(other_id, score), ...]}
+    """
+    def __init__(self):
+        self.counts = {}
+        self.occurrences = Counter()
+        # {user_id: [property_id, ...]} favorites, oldest first
+        self.user_favorites = {}
+        # Cached top-N lists; dropped for every property an update touches
+        self.top = {}
+        self.loaded = False
+        # Views and favorites are applied from request threads; every read and write of the counters holds this
+        self._lock = threading.Lock()
+
+    def load(self):
+        from .models import Favorite
+        from .hash_map import recent_view
+
+        with self._lock:
+            self.counts = {}
+            self.occurrences = Counter()
+            self.user_favorites = {}
+            self.top = {}
+
+            rows = Favorite.objects.order_by('user_id', 'created_at', 'id').values_list('user_id', 'property_id')
+            for user_id, property_id in rows.iterator(chunk_size=5000):
+                self.user_favorites.setdefault(user_id, []).append(property_id)
+
+            for items in self.user_favorites.values():
+                recent = items[-MAX_ITEMS_PER_USER:]
+                for i, property_id in enumerate(recent):
+                    self.occurrences[property_id] += FAVORITE_WEIGHT
+                    self._pair(property_id, recent[:i], FAVORITE_WEIGHT)
+
+            for _, history in recent_view.histories():
+                history = [int(item) for item in history]
+                for i, property_id in enumerate(history):
+                    self.occurrences[property_id] += VIEW_WEIGHT
+                    self._pair(property_id, history[:i], VIEW_WEIGHT)
+
+            for property_id in self.counts:
+                self.top[property_id] = self._top(property_id)
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def _pair(self, property_id, others, weight):
+        for other_id in others:
+            if other_id == property_id:
+                continue
+            for a, b in ((property_id, other_id), (other_id, property_id)):
+                counter = self.counts.setdefault(a, Counter())
+                counter[b] += weight
+                if len(counter) > 2 * MAX_NEIGHBORS_KEPT:
+                    self.counts[a] = Counter(dict(counter.most_common(MAX_NEIGHBORS_KEPT)))
+                self.top.pop(a, None)
+        self.top.pop(property_id, None)
+
+    def _unpair(self, property_id, others, weight):
+        for other_id in others:
+            for a, b in ((property_id, other_id), (other_id, property_id)):
+                counter = self.counts.get(a)
+                # Pruned pairs are simply gone; counts never go below zero
+                if counter is not None and b in counter:
+                    counter[b] -= weight
+                    if counter[b] <= 0:
+                        del counter[b]
+                self.top.pop(a, None)
+        self.top.pop(property_id, None)
+
+    def _set_favorites(self, user_id, items):
+        """
+        Replaces a user's favorites and applies the change in their paired window
+        (the last MAX_ITEMS_PER_USER), so the counts stay exactly what load() would build.
+        Only ids entering or leaving the window are touched: O(window) per toggle.
+        """
+        old_window = self.user_favorites.get(user_id, [])[-MAX_ITEMS_PER_USER:]
+        new_window = items[-MAX_ITEMS_PER_USER:]
+        old_set, new_set = set(old_window), set(new_window)
+        left = [property_id for property_id in old_window if property_id not in new_set]
+        entered = [property_id for property_id in new_window if property_id not in old_set]
+        stayed = [property_id for property_id in new_window if property_id in old_set]
+
+        # Each pair is dropped or added once: against what stayed, and against the ids before it
+        for i, property_id in enumerate(left):
+            self._unpair(property_id, stayed + left[:i], FAVORITE_WEIGHT)
+            self.occurrences[property_id] -= FAVORITE_WEIGHT
+            if self.occurrences[property_id] <= 0:
+                del self.occurrences[property_id]
+        for i, property_id in enumerate(entered):
+            self._pair(property_id, stayed + entered[:i], FAVORITE_WEIGHT)
+            self.occurrences[property_id] += FAVORITE_WEIGHT
+
+        if items:
+            self.user_favorites[user_id] = items
+        else:
+            self.user_favorites.pop(user_id, None)
+
+    def add_favorite(self, user_id, property_id):
+        # Before the first load the DB is the source of truth, so there is nothing to keep current
+        if not self.loaded:
+            return
+        with self._lock:
+            items = self.user_favorites.get(user_id, [])
+            if property_id in items:
+                return
+            self._set_favorites(user_id, items + [property_id])
+
+    def remove_favorite(self, user_id, property_id):
+        if not self.loaded:
+            return
+        with self._lock:
+            items = self.user_favorites.get(user_id)
+            if not items or property_id not in items:
+                return
+            self._set_favorites(user_id, [item for item in items if item != property_id])
+
+    def add_view(self, history, property_id):
+        """
+        history: the user's recently viewed ids before this view. A property already
+        in it was counted when it entered, so re-viewing it adds nothing.
+        """
+        if not self.loaded:
+            return
+        # property_view stores ids as they were posted, so they may be strings
+        history = [int(item) for item in history]
+        if property_id in history:
+            return
+        with self._lock:
+            self._pair(property_id, history, VIEW_WEIGHT)
+            self.occurrences[property_id] += VIEW_WEIGHT
+
+    def remove_property(self, property_id):
+        with self._lock:
+            # An older favorite can slide into the window the deleted one leaves
+            for user_id, items in list(self.user_favorites.items()):
+                if property_id in items:
+                    self._set_favorites(user_id, [item for item in items if item != property_id])
+            for other_id in self.counts.pop(property_id, {}):
+                counter = self.counts.get(other_id)
+                if counter is not None:
+                    counter.pop(property_id, None)
+                self.top.pop(other_id, None)
+            self.occurrences.pop(property_id, None)
+            self.top.pop(property_id, None)
+
+    def _top(self, property_id):
+        counter = self.counts.get(property_id)
+        if not counter:
+            return []
+        base = self.occurrences[property_id] or 1
+        scored = (
+            (other_id, weight / math.sqrt(base * (self.occurrences[other_id] or 1)))
+            for other_id, weight in counter.items()
+        )
+        return heapq.nlargest(TOP_N, scored, key=lambda item: (item[1], -item[0]))
+
+    def neighbors(self, property_id, limit=TOP_N):
+        """
+        Returns [(property_id, score), ...] strongest first, at most TOP_N.
+        """
+        self.ensure_loaded()
+        with self._lock:
+            top = self.top.get(property_id)
+            if top is None:
+                top = self.top[property_id] = self._top(property_id)
+        return top[:limit]
+
+
+co_occurrence = CoOccurrenceIndex()
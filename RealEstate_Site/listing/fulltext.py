@@ -0,0 +1,57 @@
+import re
+from django.db import connection
+
+FTS_TABLE = 'listing_property_fts'
+# bm25 column weights: title, description, location name
+BM25_WEIGHTS = (10.0, 1.0, 5.0)
+SNIPPET_TOKENS = 12
+
+_available = False
+
+
+def available():
+    """
+    True once the FTS5 table exists (SQLite with migration 0013 applied).
+    """
+    global _available
+    if not _available and connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            _available = cursor.fetchone() is not None
+    return _available
+
+
+def to_match_query(text):
+    """
+    User text as an FTS5 query: every word must match, the last one as a prefix
+    so results show up while typing. Words are quoted, so FTS operators in the
+    input are treated as plain text.
+    Returns None when there is nothing searchable.
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search(text, limit=None):
+    """
+    Returns [(property_id, score, snippet), ...] best match first, every match when limit is None.
+    Higher score is better (bm25 is negated).
+    """
+    match = to_match_query(text)
+    if match is None:
+        return []
+
+    title_w, description_w, location_w = BM25_WEIGHTS
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, -bm25({FTS_TABLE}, %s, %s, %s) AS score, "
+            f"snippet({FTS_TABLE}, -1, '<mark>', '</mark>', '…', %s) "
+            f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY score DESC LIMIT %s",
+            # LIMIT -1 is SQLite for no limit
+            [title_w, description_w, location_w, SNIPPET_TOKENS, match, -1 if limit is None else limit]
+        )
+        return cursor.fetchall()
@@ -0,0 +1,67 @@
+from locations.spatial_index import GridIndex
+
+
+class PropertyGeoIndex(GridIndex):
+    """
+    Grid index over property coordinates for map viewport queries, loaded from the DB on first use.
+    Price and size ride along so filters never touch the DB.
+    Format: records {property_id: (lat, lng, price, size)}
+    """
+    def __init__(self, cell_size_deg=0.01):
+        super().__init__(cell_size_deg)
+        self.records = {}
+        self.loaded = False
+
+    def load(self):
+        from .models import Property
+
+        self.cells = {}
+        self.items = {}
+        self.records = {}
+        self.min_cell = None
+        self.max_cell = None
+
+        rows = Property.objects.values_list('id', 'location_id__latitude', 'location_id__longitude', 'price', 'size')
+        for prop_id, lat, lng, price, size in rows.iterator(chunk_size=5000):
+            self._add(prop_id, lat, lng, price, size)
+
+        self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def _add(self, prop_id, lat, lng, price, size):
+        super().insert(prop_id, lat, lng)
+        self.records[prop_id] = (lat, lng, float(price), size)
+
+    def insert_property(self, property_obj):
+        # Before the first load the DB is the source of truth, so there is nothing to keep current
+        if self.loaded:
+            location = property_obj.location_id
+            self._add(property_obj.id, location.latitude, location.longitude, property_obj.price, property_obj.size)
+
+    def remove_property(self, prop_id):
+        self.records.pop(prop_id, None)
+        return self.remove(prop_id)
+
+    def search(self, south, west, north, east, min_price=None, max_price=None, min_size=None, max_size=None):
+        """
+        Properties inside the box that pass the price/size filters, ordered by id.
+        Returns [(property_id, lat, lng, price), ...]
+        """
+        self.ensure_loaded()
+        results = []
+        for prop_id in self.within_bbox(south, west, north, east):
+            lat, lng, price, size = self.records[prop_id]
+            if min_price is not None and price < min_price: continue
+            if max_price is not None and price > max_price: continue
+            if min_size is not None and size < min_size: continue
+            if max_size is not None and size > max_size: continue
+            results.append((prop_id, lat, lng, price))
+
+        results.sort()
+        return results
+
+
+property_geo_index = PropertyGeoIndex()
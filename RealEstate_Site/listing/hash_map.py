@@ -98,6 +98,14 @@ class RecentlyViewedProperty:
             return user_stack.get_all()
         return []
 
+    def histories(self):
+        """
+        Yields (user_id, [property_id, ...]) for every user with a history, most recent first.
+        """
+        for bucket in self._storage:
+            for user_id, stack_obj in bucket:
+                yield user_id, stack_obj.get_all()
+
 class SearchCache:
     """
     Search query cache using Stack.
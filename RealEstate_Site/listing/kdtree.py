@@ -0,0 +1,182 @@
+import heapq
+
+
+class _Node:
+    __slots__ = ('item_id', 'point', 'axis', 'left', 'right', 'lo', 'hi', 'alive')
+
+    def __init__(self, item_id, point, axis):
+        self.item_id = item_id
+        self.point = point
+        self.axis = axis
+        self.left = None
+        self.right = None
+        # Bounding box of this subtree, used to prune range and nearest-neighbour searches
+        self.lo = list(point)
+        self.hi = list(point)
+        self.alive = True
+
+
+class KDTree:
+    """
+    k-d tree over (item_id, point) pairs. Supports insertions and lazy deletions,
+    and rebuilds itself balanced once enough of either has piled up.
+    Format: nodes {item_id: _Node}
+    """
+    def __init__(self, dims, items=()):
+        self.dims = dims
+        self.root = None
+        self.nodes = {}
+        self.dead = 0
+        self.inserted = 0
+        self.build(items)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, item_id):
+        return item_id in self.nodes
+
+    def build(self, items):
+        items = list(items)
+        self.nodes = {}
+        self.dead = 0
+        self.inserted = 0
+        self.root = self._build(items, 0)
+
+    def _build(self, items, depth):
+        if not items:
+            return None
+        axis = depth % self.dims
+        items.sort(key=lambda item: item[1][axis])
+        mid = len(items) // 2
+
+        item_id, point = items[mid]
+        node = _Node(item_id, point, axis)
+        self.nodes[item_id] = node
+        node.left = self._build(items[:mid], depth + 1)
+        node.right = self._build(items[mid + 1:], depth + 1)
+
+        for child in (node.left, node.right):
+            if child is not None:
+                node.lo = [min(a, b) for a, b in zip(node.lo, child.lo)]
+                node.hi = [max(a, b) for a, b in zip(node.hi, child.hi)]
+        return node
+
+    def items(self):
+        return [(item_id, node.point) for item_id, node in self.nodes.items()]
+
+    def _maybe_rebuild(self):
+        if self.dead > len(self.nodes) or self.inserted > max(len(self.nodes), 64):
+            self.build(self.items())
+
+    def insert(self, item_id, point):
+        if item_id in self.nodes:
+            self.remove(item_id)
+
+        point = tuple(point)
+        if self.root is None:
+            self.root = _Node(item_id, point, 0)
+            self.nodes[item_id] = self.root
+            return
+
+        node = self.root
+        while True:
+            node.lo = [min(a, b) for a, b in zip(node.lo, point)]
+            node.hi = [max(a, b) for a, b in zip(node.hi, point)]
+            side = 'left' if point[node.axis] < node.point[node.axis] else 'right'
+            child = getattr(node, side)
+            if child is None:
+                child = _Node(item_id, point, (node.axis + 1) % self.dims)
+                setattr(node, side, child)
+                break
+            node = child
+
+        self.nodes[item_id] = child
+        self.inserted += 1
+        self._maybe_rebuild()
+
+    def remove(self, item_id):
+        node = self.nodes.pop(item_id, None)
+        if node is None:
+            return False
+        node.alive = False
+        self.dead += 1
+        self._maybe_rebuild()
+        return True
+
+    def range(self, lo, hi):
+        """
+        Ids of all points inside the axis-aligned box [lo, hi].
+        """
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            if any(node.hi[d] < lo[d] or node.lo[d] > hi[d] for d in range(self.dims)):
+                continue
+            if node.alive and all(lo[d] <= node.point[d] <= hi[d] for d in range(self.dims)):
+                found.append(node.item_id)
+            if node.left is not None:
+                stack.append(node.left)
+            if node.right is not None:
+                stack.append(node.right)
+        return found
+
+    def within(self, center, radius):
+        """
+        Ids of all points within Euclidean radius of center.
+        """
+        limit = radius * radius
+        lo = [c - radius for c in center]
+        hi = [c + radius for c in center]
+        return [
+            item_id for item_id in self.range(lo, hi)
+            if sum((a - b) ** 2 for a, b in zip(self.nodes[item_id].point, center)) <= limit
+        ]
+
+    @staticmethod
+    def _box_distance_sq(node, point):
+        total = 0.0
+        for d, value in enumerate(point):
+            if value < node.lo[d]:
+                total += (node.lo[d] - value) ** 2
+            elif value > node.hi[d]:
+                total += (value - node.hi[d]) ** 2
+        return total
+
+    def iter_nearest(self, point):
+        """
+        Best-first search: yields (squared_distance, item_id) in increasing distance,
+        doing only as much work as the caller consumes.
+        """
+        if self.root is None:
+            return
+        counter = 0
+        # Entries are (distance_sq, tiebreak, is_point, payload)
+        heap = [(self._box_distance_sq(self.root, point), counter, False, self.root)]
+        while heap:
+            dist_sq, _, is_point, payload = heapq.heappop(heap)
+            if is_point:
+                yield dist_sq, payload
+                continue
+
+            node = payload
+            if node.alive:
+                counter += 1
+                exact = sum((a - b) ** 2 for a, b in zip(node.point, point))
+                heapq.heappush(heap, (exact, counter, True, node.item_id))
+            for child in (node.left, node.right):
+                if child is not None:
+                    counter += 1
+                    heapq.heappush(heap, (self._box_distance_sq(child, point), counter, False, child))
+
+    def nearest(self, point, k=1):
+        """
+        Returns [(squared_distance, item_id), ...] for the k closest points.
+        """
+        found = []
+        for entry in self.iter_nearest(point):
+            found.append(entry)
+            if len(found) == k:
+                break
+        return found
@@ -0,0 +1,70 @@
+from django.db import migrations
+
+FTS_TABLE = 'listing_property_fts'
+
+# Rows are keyed by property id (rowid); the location name is copied in so one MATCH covers all three fields
+CREATE_STATEMENTS = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE}
+        USING fts5(title, description, location_name, tokenize = 'unicode61 remove_diacritics 2')""",
+
+    f"""CREATE TRIGGER IF NOT EXISTS listing_property_fts_insert AFTER INSERT ON listing_property BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, title, description, location_name)
+        VALUES (new.id, new.title, COALESCE(new.description, ''),
+                (SELECT name FROM locations_location WHERE id = new.location_id_id));
+    END""",
+
+    f"""CREATE TRIGGER IF NOT EXISTS listing_property_fts_update AFTER UPDATE ON listing_property BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE} (rowid, title, description, location_name)
+        VALUES (new.id, new.title, COALESCE(new.description, ''),
+                (SELECT name FROM locations_location WHERE id = new.location_id_id));
+    END""",
+
+    f"""CREATE TRIGGER IF NOT EXISTS listing_property_fts_delete AFTER DELETE ON listing_property BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+
+    f"""CREATE TRIGGER IF NOT EXISTS listing_property_fts_location AFTER UPDATE OF name ON locations_location BEGIN
+        UPDATE {FTS_TABLE} SET location_name = new.name
+        WHERE rowid IN (SELECT id FROM listing_property WHERE location_id_id = new.id);
+    END""",
+
+    f"""INSERT INTO {FTS_TABLE} (rowid, title, description, location_name)
+        SELECT p.id, p.title, COALESCE(p.description, ''), l.name
+        FROM listing_property p JOIN locations_location l ON l.id = p.location_id_id""",
+]
+
+DROP_STATEMENTS = [
+    "DROP TRIGGER IF EXISTS listing_property_fts_insert",
+    "DROP TRIGGER IF EXISTS listing_property_fts_update",
+    "DROP TRIGGER IF EXISTS listing_property_fts_delete",
+    "DROP TRIGGER IF EXISTS listing_property_fts_location",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def create_fts(apps, schema_editor):
+    # FTS5 is an SQLite module; other backends keep the icontains search
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_STATEMENTS:
+        schema_editor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_STATEMENTS:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listing', '0012_alter_property_image'),
+        ('locations', '0007_location_rtree'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
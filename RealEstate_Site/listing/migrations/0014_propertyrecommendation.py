@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listing', '0013_property_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropertyRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('graph', 'Price/size graph'), ('knn_cosine', 'Feature kNN (cosine)'), ('knn_euclidean', 'Feature kNN (euclidean)'), ('description', 'Similar description')], max_length=20)),
+                ('recommended', models.JSONField(default=list)),
+                ('computed_at', models.DateTimeField()),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='listing.property')),
+            ],
+            options={
+                'unique_together': {('property', 'source')},
+            },
+        ),
+    ]
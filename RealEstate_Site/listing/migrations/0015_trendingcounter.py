@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listing', '0014_propertyrecommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(max_length=8)),
+                ('score', models.FloatField()),
+                ('error', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField()),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trending_counters', to='listing.property')),
+            ],
+            options={
+                'unique_together': {('window', 'property')},
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listing', '0015_trendingcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropertyViewStats',
+            fields=[
+                ('property', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='view_stats', serialize=False, to='listing.property')),
+                ('views', models.BigIntegerField(default=0)),
+                ('unique_viewers', models.IntegerField(default=0)),
+                ('unique_sketch', models.BinaryField()),
+                ('updated_at', models.DateTimeField()),
+            ],
+        ),
+    ]
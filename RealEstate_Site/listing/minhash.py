@@ -0,0 +1,149 @@
+import re
+import zlib
+import numpy as np
+
+NUM_PERM = 128
+# 32 bands of 4 rows: pairs above ~0.42 Jaccard almost always share a bucket
+BANDS = 32
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+# Estimated Jaccard similarity of the description shingles
+DUPLICATE_THRESHOLD = 0.8
+SIMILAR_THRESHOLD = 0.3
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+# Fixed seed so signatures stay comparable between processes and restarts
+_rng = np.random.default_rng(46)
+_A = _rng.integers(1, 1 << 32, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 32, NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text):
+    """
+    Word 3-grams of the normalised text; short texts fall back to single words.
+    """
+    words = re.findall(r"\w+", (text or '').lower())
+    if len(words) < SHINGLE_SIZE:
+        return set(words)
+    return {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def signature(text):
+    """
+    MinHash signature (NUM_PERM uint32 values), or None when the text has no words.
+    """
+    found = shingles(text)
+    if not found:
+        return None
+    hashes = np.fromiter((zlib.crc32(item.encode()) for item in found), dtype=np.uint64, count=len(found))
+    permuted = ((hashes[:, None] * _A[None, :]) % _MERSENNE_PRIME + _B[None, :]) % _MERSENNE_PRIME
+    return (permuted & _MAX_HASH).min(axis=0).astype(np.uint32)
+
+
+def similarity(sig1, sig2):
+    """
+    Estimated Jaccard similarity: the fraction of matching MinHash values.
+    """
+    return float(np.count_nonzero(sig1 == sig2)) / NUM_PERM
+
+
+class MinHashLSH:
+    """
+    Banded LSH over MinHash signatures; a query only compares against ids sharing a band bucket.
+    Format: buckets[band] = {band_bytes: {id, ...}}, signatures {id: signature}
+    """
+    def __init__(self):
+        self.buckets = [{} for _ in range(BANDS)]
+        self.signatures = {}
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def _keys(self, sig):
+        return [sig[i * ROWS_PER_BAND:(i + 1) * ROWS_PER_BAND].tobytes() for i in range(BANDS)]
+
+    def insert(self, item_id, sig):
+        if item_id in self.signatures:
+            self.remove(item_id)
+        self.signatures[item_id] = sig
+        for band, key in zip(self.buckets, self._keys(sig)):
+            band.setdefault(key, set()).add(item_id)
+
+    def remove(self, item_id):
+        sig = self.signatures.pop(item_id, None)
+        if sig is None:
+            return False
+        for band, key in zip(self.buckets, self._keys(sig)):
+            bucket = band[key]
+            bucket.discard(item_id)
+            if not bucket:
+                del band[key]
+        return True
+
+    def query(self, sig, threshold, exclude=None):
+        """
+        Returns [(id, estimated_similarity), ...] at or above threshold, most similar first.
+        """
+        candidates = set()
+        for band, key in zip(self.buckets, self._keys(sig)):
+            candidates.update(band.get(key, ()))
+        candidates.discard(exclude)
+
+        found = [(item_id, similarity(sig, self.signatures[item_id])) for item_id in candidates]
+        found = [item for item in found if item[1] >= threshold]
+        found.sort(key=lambda item: (-item[1], item[0]))
+        return found
+
+
+class DescriptionIndex(MinHashLSH):
+    """
+    LSH index over property descriptions, for near-duplicate checks at ingest
+    and "similar description" recommendations.
+    """
+    def __init__(self):
+        super().__init__()
+        self.loaded = False
+
+    def load(self):
+        from .models import Property
+
+        self.buckets = [{} for _ in range(BANDS)]
+        self.signatures = {}
+        for prop_id, description in Property.objects.values_list('id', 'description').iterator(chunk_size=5000):
+            sig = signature(description)
+            if sig is not None:
+                self.insert(prop_id, sig)
+        self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def insert_property(self, property_obj):
+        # Before the first load the DB is the source of truth, so there is nothing to keep current
+        if not self.loaded:
+            return
+        sig = signature(property_obj.description)
+        if sig is None:
+            self.remove(property_obj.id)
+        else:
+            self.insert(property_obj.id, sig)
+
+    def duplicates(self, sig, exclude=None):
+        self.ensure_loaded()
+        return self.query(sig, DUPLICATE_THRESHOLD, exclude)
+
+    def similar(self, prop_id, limit):
+        """
+        Returns [(property_id, estimated_similarity), ...] for the listings whose
+        description is most like this one's.
+        """
+        self.ensure_loaded()
+        sig = self.signatures.get(prop_id)
+        if sig is None:
+            return []
+        return self.query(sig, SIMILAR_THRESHOLD, exclude=prop_id)[:limit]
+
+
+description_index = DescriptionIndex()
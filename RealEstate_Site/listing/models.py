@@ -65,4 +65,52 @@ class SellPropertyDetail(models.Model):
     price = models.DecimalField(max_digits=15, decimal_places=2)
     
     def __str__(self):
-        return f"Sell Detail for Request #{self.request.id}: {self.title}"
\ No newline at end of file
+        return f"Sell Detail for Request #{self.request.id}: {self.title}"
+
+class PropertyRecommendation(models.Model):
+    """
+    Precomputed top-k similar listings for one property and one similarity source,
+    kept current by listing.recommendations.recommendation_refresher.
+    """
+    SOURCE_CHOICES = (
+        ('graph', 'Price/size graph'),
+        ('knn_cosine', 'Feature kNN (cosine)'),
+        ('knn_euclidean', 'Feature kNN (euclidean)'),
+        ('description', 'Similar description'),
+    )
+
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='recommendations')
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    # [[property_id, score], ...] best first; score is None for the graph source
+    recommended = models.JSONField(default=list)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('property', 'source')
+
+
+class TrendingCounter(models.Model):
+    """
+    Merged heavy-hitter counters for one trending window, written by listing.trending.
+    score and error are decayed counts as of updated_at.
+    """
+    window = models.CharField(max_length=8)
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='trending_counters')
+    score = models.FloatField()
+    error = models.FloatField(default=0)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('window', 'property')
+
+
+class PropertyViewStats(models.Model):
+    """
+    View totals per listing, flushed in batches by listing.analytics.
+    unique_sketch holds the HyperLogLog registers that unique_viewers is estimated from.
+    """
+    property = models.OneToOneField(Property, on_delete=models.CASCADE, primary_key=True, related_name='view_stats')
+    views = models.BigIntegerField(default=0)
+    unique_viewers = models.IntegerField(default=0)
+    unique_sketch = models.BinaryField()
+    updated_at = models.DateTimeField()
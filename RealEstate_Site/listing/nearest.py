@@ -0,0 +1,83 @@
+import math
+from locations.utilis import EARTH_RADIUS_KM
+from .kdtree import KDTree
+
+
+def to_unit_vector(lat, lng):
+    """
+    Point on the unit sphere; straight-line (chord) order between these matches great-circle order.
+    """
+    lat_rad, lng_rad = math.radians(lat), math.radians(lng)
+    cos_lat = math.cos(lat_rad)
+    return (cos_lat * math.cos(lng_rad), cos_lat * math.sin(lng_rad), math.sin(lat_rad))
+
+
+def chord_to_km(chord_sq):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(chord_sq) / 2))
+
+
+class PropertyKNNIndex:
+    """
+    k-d tree over properties as 3D unit vectors, for nearest-first listing.
+    Loaded from the DB on first use; the filter fields ride along so a cursor never touches the DB.
+    Format: records {property_id: (price, size, bedrooms)}
+    """
+    def __init__(self):
+        self.tree = KDTree(3)
+        self.records = {}
+        self.loaded = False
+
+    def load(self):
+        from .models import Property
+
+        self.records = {}
+        items = []
+        rows = Property.objects.values_list(
+            'id', 'location_id__latitude', 'location_id__longitude', 'price', 'size', 'bedrooms'
+        )
+        for prop_id, lat, lng, price, size, bedrooms in rows.iterator(chunk_size=5000):
+            items.append((prop_id, to_unit_vector(lat, lng)))
+            self.records[prop_id] = (float(price), size, bedrooms)
+
+        self.tree = KDTree(3, items)
+        self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def insert_property(self, property_obj):
+        # Before the first load the DB is the source of truth, so there is nothing to keep current
+        if self.loaded:
+            location = property_obj.location_id
+            self.tree.insert(property_obj.id, to_unit_vector(location.latitude, location.longitude))
+            self.records[property_obj.id] = (float(property_obj.price), property_obj.size, property_obj.bedrooms)
+
+    def remove_property(self, prop_id):
+        self.records.pop(prop_id, None)
+        return self.tree.remove(prop_id)
+
+    def cursor(self, lat, lng, min_price=0, max_price=float('inf'), min_size=0, max_size=float('inf'), min_bedrooms=0):
+        """
+        Yields (property_id, distance_km) nearest first, skipping properties that fail the filters.
+        """
+        self.ensure_loaded()
+        for chord_sq, prop_id in self.tree.iter_nearest(to_unit_vector(lat, lng)):
+            price, size, bedrooms = self.records[prop_id]
+            if min_price <= price <= max_price and min_size <= size <= max_size and bedrooms >= min_bedrooms:
+                yield prop_id, chord_to_km(chord_sq)
+
+    def nearest(self, lat, lng, k, offset=0, **filters):
+        """
+        Returns [(property_id, distance_km), ...] for ranks offset .. offset + k.
+        """
+        results = []
+        for rank, item in enumerate(self.cursor(lat, lng, **filters)):
+            if rank >= offset + k:
+                break
+            if rank >= offset:
+                results.append(item)
+        return results
+
+
+property_knn = PropertyKNNIndex()
@@ -0,0 +1,198 @@
+import time
+import logging
+import threading
+from django.db import connection, transaction
+from django.utils import timezone
+
+# Stored list length per property and source; requests can ask for fewer
+PRECOMPUTED_K = 50
+SOURCES = ('graph', 'knn_cosine', 'knn_euclidean', 'description')
+# Saves arrive in bursts (bulk uploads, edits); waiting a moment lets one pass cover the burst
+REFRESH_DELAY_SECONDS = 1.0
+REFRESH_BATCH = 500
+# After a failed pass (e.g. another process holding the SQLite write lock) the batch waits this long
+RETRY_DELAY_SECONDS = 5.0
+
+logger = logging.getLogger(__name__)
+
+
+def compute(source, prop_id, k=PRECOMPUTED_K):
+    """
+    Fresh [(property_id, score), ...] from the in-memory similarity source.
+    """
+    if source == 'graph':
+        from locations.graphs import recommendation_graph
+        recommendation_graph.ensure_loaded()
+        return [(other_id, None) for other_id in recommendation_graph.bfs_traversal(prop_id, k)]
+    if source in ('knn_cosine', 'knn_euclidean'):
+        from locations.feature_knn import property_features
+        return property_features.similar(prop_id, k, source.split('_', 1)[1])
+    if source == 'description':
+        from .minhash import description_index
+        return description_index.similar(prop_id, k)
+    raise ValueError(f"Unknown recommendation source {source}")
+
+
+class RecommendationRefresher:
+    """
+    Background worker that recomputes stored PropertyRecommendation rows.
+    Saving or deleting a property marks it and its neighbourhood (the ids in its
+    old and new lists) dirty; the worker refreshes dirty properties in batches.
+    Started on a serving process's first request (listing.signals), it first fills in
+    properties that have no stored lists. A failed batch is queued again.
+    Format: pending {property_id: expand_neighbourhood}
+    """
+    def __init__(self):
+        self.pending = {}
+        self.in_progress = set()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='recommendation-refresher', daemon=True)
+                self._thread.start()
+
+    def mark(self, prop_ids, expand=True):
+        with self._cond:
+            for prop_id in prop_ids:
+                self.pending[prop_id] = self.pending.get(prop_id, False) or expand
+            self._cond.notify()
+
+    def mark_all(self):
+        from .models import Property
+        self.mark(Property.objects.values_list('id', flat=True), expand=False)
+
+    def mark_missing(self):
+        """
+        Marks properties without a full set of stored lists. Run at start instead of mark_all,
+        so every serving process does not recompute the whole table.
+        """
+        from django.db.models import Count
+        from .models import Property
+        missing = Property.objects.annotate(stored=Count('recommendations')).filter(stored__lt=len(SOURCES))
+        self.mark(missing.values_list('id', flat=True), expand=False)
+
+    def mark_deleted(self, prop_id):
+        """
+        Called before the delete cascades, while the property's own lists still name its neighbours.
+        """
+        from .models import PropertyRecommendation
+        neighbours = set()
+        for recommended in PropertyRecommendation.objects.filter(property_id=prop_id).values_list('recommended', flat=True):
+            neighbours.update(other_id for other_id, _ in recommended)
+        neighbours.discard(prop_id)
+        self.mark(neighbours, expand=False)
+
+    def is_pending(self, prop_id):
+        return prop_id in self.pending or prop_id in self.in_progress
+
+    def _take(self):
+        with self._cond:
+            batch = dict(list(self.pending.items())[:REFRESH_BATCH])
+            for prop_id in batch:
+                del self.pending[prop_id]
+            self.in_progress = set(batch)
+            return batch
+
+    def _requeue(self, batch):
+        with self._cond:
+            for prop_id, expand in batch.items():
+                self.pending[prop_id] = self.pending.get(prop_id, False) or expand
+
+    def run_pending(self):
+        """
+        Refreshes everything currently marked. Returns the number of properties refreshed.
+        A batch whose refresh raises is queued again before the error propagates.
+        """
+        done = 0
+        while True:
+            batch = self._take()
+            if not batch:
+                return done
+            try:
+                neighbours = self.refresh(batch)
+            except Exception:
+                self._requeue(batch)
+                raise
+            finally:
+                self.in_progress = set()
+            self.mark(neighbours - set(batch), expand=False)
+            done += len(batch)
+
+    def refresh(self, batch):
+        """
+        batch: {property_id: expand}. Rewrites the stored lists of every property in it
+        and returns the neighbourhood of the expanded ones.
+        """
+        from .models import Property, PropertyRecommendation
+
+        existing = set(Property.objects.filter(id__in=list(batch)).values_list('id', flat=True))
+        old = {}
+        for prop_id, source, recommended in PropertyRecommendation.objects.filter(
+            property_id__in=[prop_id for prop_id, expand in batch.items() if expand]
+        ).values_list('property_id', 'source', 'recommended'):
+            old.setdefault(prop_id, set()).update(other_id for other_id, _ in recommended)
+
+        now = timezone.now()
+        rows, neighbours = [], set()
+        for prop_id in existing:
+            for source in SOURCES:
+                hits = compute(source, prop_id)
+                rows.append(PropertyRecommendation(
+                    property_id=prop_id, source=source, recommended=[list(hit) for hit in hits], computed_at=now
+                ))
+                if batch[prop_id]:
+                    neighbours.update(other_id for other_id, _ in hits)
+            if batch[prop_id]:
+                neighbours.update(old.get(prop_id, ()))
+
+        with transaction.atomic():
+            PropertyRecommendation.objects.bulk_create(
+                rows, update_conflicts=True, unique_fields=['property', 'source'],
+                update_fields=['recommended', 'computed_at']
+            )
+        return neighbours
+
+    def _run(self):
+        try:
+            self.mark_missing()
+        except Exception:
+            logger.exception("Could not list properties missing stored recommendations")
+        finally:
+            connection.close()
+
+        while True:
+            with self._cond:
+                while not self.pending:
+                    self._cond.wait()
+            time.sleep(REFRESH_DELAY_SECONDS)
+            try:
+                self.run_pending()
+            except Exception:
+                # The failed batch is back in pending; a locked database or an in-memory
+                # source changing under the pass usually clears up by the next attempt
+                logger.exception("Recommendation refresh failed; retrying in %s s", RETRY_DELAY_SECONDS)
+                time.sleep(RETRY_DELAY_SECONDS)
+            finally:
+                connection.close()
+
+
+def stored_recommendations(prop_id, source):
+    """
+    One indexed read. Returns ([(property_id, score), ...], computed_at), or (None, None) when never computed.
+    """
+    from .models import PropertyRecommendation
+    row = PropertyRecommendation.objects.filter(property_id=prop_id, source=source).values_list(
+        'recommended', 'computed_at'
+    ).first()
+    if row is None:
+        return None, None
+    recommended, computed_at = row
+    return [tuple(hit) for hit in recommended], computed_at
+
+
+recommendation_refresher = RecommendationRefresher()
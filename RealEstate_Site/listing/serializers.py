@@ -35,7 +35,23 @@ class PropertySerializer(serializers.ModelSerializer):
         if Property.objects.filter(location_id=location_obj, title=title).exists():
             raise serializers.ValidationError("This property listing already exists at this exact location!")
 
+        # Near-duplicates (same listing, lightly edited description) are flagged rather than rejected
+        from .minhash import description_index, signature, DUPLICATE_THRESHOLD
+        description_sig = signature(validated_data.get('description'))
+        possible_duplicates = []
+        batch_index = self.context.get('batch_index')
+        if description_sig is not None:
+            possible_duplicates = description_index.duplicates(description_sig)
+            if batch_index is not None:
+                # Rows of this batch are answered by batch_index alone, even if the shared index already saw them
+                possible_duplicates = [
+                    hit for hit in possible_duplicates if hit[0] not in batch_index.signatures
+                ] + batch_index.query(description_sig, DUPLICATE_THRESHOLD)
+
         property_obj = Property.objects.create(location_id=location_obj, **validated_data)
+        property_obj.possible_duplicates = list(dict.fromkeys(prop_id for prop_id, _ in possible_duplicates))
+        if batch_index is not None and description_sig is not None:
+            batch_index.insert(property_obj.id, description_sig)
         
         return property_obj
     
@@ -52,6 +68,14 @@ class PropertySerializer(serializers.ModelSerializer):
             representation['latitude'] = instance.location_id.latitude
             representation['longitude'] = instance.location_id.longitude
             representation['location_name'] = instance.location_id.name
+
+            # Opt-in (context nearest_facilities=True): one table lookup per row is wasted on bulk responses
+            if self.context.get('nearest_facilities'):
+                from locations.facility_table import nearest_facilities
+                representation['nearest_facilities'] = nearest_facilities.nearest_for(instance.location_id_id)
+
+        if getattr(instance, 'possible_duplicates', None):
+            representation['possible_duplicates'] = instance.possible_duplicates
             
         return representation
     
@@ -1,13 +1,78 @@
-from django.db.models.signals import post_save, post_delete
+import sys
+from django.core.signals import request_started
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from .models import Favorite
+from django.db import transaction
+from .models import Favorite, Property
+from locations.models import Location
 from .hash_map import favorites_map
+from .geo_index import property_geo_index
+from .clusters import property_clusters
+from .nearest import property_knn
+from .co_occurrence import co_occurrence
+from .minhash import description_index
+from .recommendations import recommendation_refresher
+from .trending import trending
+from .analytics import view_analytics
+from locations.graphs import recommendation_graph
+from locations.feature_knn import property_features
 
 @receiver(post_save, sender=Favorite)
 def update_hash_map_on_save(sender, instance, created, **kwargs):
     if created:
         favorites_map.add_favorite(instance.user_id, instance.property_id)
+        co_occurrence.add_favorite(instance.user_id, instance.property_id)
+        trending.record(instance.property_id, 'favorite')
 
 @receiver(post_delete, sender=Favorite)
 def update_hash_map_on_delete(sender, instance, **kwargs):
-    favorites_map.remove_favorite(instance.user_id, instance.property_id)
\ No newline at end of file
+    favorites_map.remove_favorite(instance.user_id, instance.property_id)
+    co_occurrence.remove_favorite(instance.user_id, instance.property_id)
+
+@receiver(post_save, sender=Property)
+def update_geo_index_on_save(sender, instance, **kwargs):
+    property_geo_index.insert_property(instance)
+    property_clusters.insert_property(instance)
+    property_knn.insert_property(instance)
+    recommendation_graph.upsert_property(instance)
+    property_features.upsert_property(instance)
+    # After commit, so a rolled-back batch never leaves phantom duplicates behind
+    transaction.on_commit(lambda: description_index.insert_property(instance))
+    transaction.on_commit(lambda: recommendation_refresher.mark([instance.id]))
+
+@receiver(post_save, sender=Location)
+def reindex_moved_properties(sender, instance, created, **kwargs):
+    # Listings take their coordinates from their Location, so editing it moves them in every geo index
+    coordinate_indexes = (property_geo_index, property_clusters, property_knn, property_features)
+    if created or not any(index.loaded for index in coordinate_indexes):
+        return
+    for property_obj in Property.objects.filter(location_id=instance):
+        property_obj.location_id = instance
+        property_geo_index.insert_property(property_obj)
+        property_clusters.insert_property(property_obj)
+        property_knn.insert_property(property_obj)
+        property_features.upsert_property(property_obj)
+
+@receiver(post_delete, sender=Property)
+def remove_from_geo_index(sender, instance, **kwargs):
+    property_geo_index.remove_property(instance.id)
+    property_clusters.remove(instance.id)
+    property_knn.remove_property(instance.id)
+    recommendation_graph.remove_property(instance.id)
+    property_features.remove_property(instance.id)
+    co_occurrence.remove_property(instance.id)
+    description_index.remove(instance.id)
+
+@receiver(pre_delete, sender=Property)
+def refresh_recommendations_on_delete(sender, instance, **kwargs):
+    recommendation_refresher.mark_deleted(instance.id)
+
+@receiver(request_started, dispatch_uid='listing.start_background_workers')
+def start_background_workers(sender, **kwargs):
+    # Started by the first request so they run under any server, once per serving process
+    # (never in runserver's autoreloader parent, which serves nothing), and not under the test runner
+    if 'test' in sys.argv:
+        return
+    recommendation_refresher.start()
+    trending.start()
+    view_analytics.start()
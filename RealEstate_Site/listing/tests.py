@@ -1,3 +1,663 @@
+import json
+import math
+import random
+import threading
+from unittest import mock
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from . import minhash
+from .minhash import MinHashLSH, description_index
+from .co_occurrence import CoOccurrenceIndex
+from .trending import DecayedSpaceSaving, TrendingEngine
+from .kdtree import KDTree
+from .clusters import MAX_ZOOM, MIN_ZOOM, PropertyClusterIndex
+from .geo_index import PropertyGeoIndex
+from .nearest import PropertyKNNIndex
+from .analytics import FLUSH_INTERVAL_SECONDS, HLL_REGISTERS, HyperLogLog, ViewAnalytics
+from .models import Favorite, Property, PropertyViewStats, TrendingCounter
+from users.models import User
+from .serializers import PropertySerializer
+from locations.models import Facility, Location
+from locations.utilis import calculate_haversine
+from .views import KNN_DEFAULT_LIMIT, SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT
+
+VOCABULARY = [f"word{i}" for i in range(3000)]
+
+
+def listing_payload(index, description=''):
+    return {
+        'title': f"Listing {index}", 'price': 100000, 'size': 100, 'bedrooms': 1, 'bathrooms': 1,
+        'description': description, 'location_name': f"Location {index}",
+        'latitude': 31.4 + index * 1e-3, 'longitude': 74.3
+    }
+
+
+def edited(text, rng, changes):
+    words = text.split()
+    for _ in range(changes):
+        words[rng.randrange(len(words))] = rng.choice(VOCABULARY)
+    return ' '.join(words)
+
+
+class MinHashTests(TestCase):
+    def test_estimate_within_error_bound(self):
+        rng = random.Random(46)
+        for changes in (0, 2, 5, 10, 20, 60):
+            text = ' '.join(rng.choices(VOCABULARY, k=60))
+            other = edited(text, rng, changes)
+            first, second = minhash.shingles(text), minhash.shingles(other)
+            exact = len(first & second) / len(first | second)
+            estimate = minhash.similarity(minhash.signature(text), minhash.signature(other))
+            # Standard error is at most 0.5 / sqrt(NUM_PERM) ~ 0.044
+            self.assertLess(abs(estimate - exact), 0.15, changes)
+
+    def test_signature_edge_cases(self):
+        self.assertIsNone(minhash.signature(''))
+        self.assertIsNone(minhash.signature('  ,.  '))
+        self.assertEqual(minhash.shingles('Two Words'), {'two', 'words'})
+        self.assertEqual(minhash.similarity(minhash.signature('A b c d'), minhash.signature('a B c D!')), 1.0)
+
+    def test_lsh_finds_near_duplicates_only(self):
+        rng = random.Random(7)
+        index = MinHashLSH()
+        texts = [' '.join(rng.choices(VOCABULARY, k=60)) for _ in range(500)]
+        for item_id, text in enumerate(texts):
+            index.insert(item_id, minhash.signature(text))
+
+        for item_id in range(0, 500, 50):
+            hits = index.query(minhash.signature(edited(texts[item_id], rng, 1)), minhash.DUPLICATE_THRESHOLD)
+            self.assertEqual([hit_id for hit_id, _ in hits], [item_id])
+
+        self.assertTrue(index.remove(0))
+        self.assertFalse(index.remove(0))
+        self.assertEqual(index.query(minhash.signature(texts[0]), minhash.DUPLICATE_THRESHOLD), [])
+        self.assertEqual(len(index), 499)
+
+
+class DuplicateFlagTests(TestCase):
+    def setUp(self):
+        # The index outlives each test's rolled-back rows; make the next use load from this test's data
+        description_index.loaded = False
+
+    def test_bulk_batch_reports_each_duplicate_once(self):
+        rng = random.Random(1)
+        text = ' '.join(rng.choices(VOCABULARY, k=60))
+        client = APIClient()
+
+        # The shared index is updated on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/properties/create/', listing_payload(0, text), format='json')
+        original_id = response.json()['data']['id']
+        self.assertNotIn('possible_duplicates', response.json()['data'])
+
+        copy = edited(text, rng, 1)
+        response = client.post(
+            '/api/properties/create-bulk/',
+            [listing_payload(1, copy), listing_payload(2, 'Nothing alike'), listing_payload(3, copy.upper())],
+            format='json'
+        )
+        data = response.json()['data']
+        self.assertEqual(data[0]['possible_duplicates'], [original_id])
+        self.assertNotIn('possible_duplicates', data[1])
+        self.assertCountEqual(data[2]['possible_duplicates'], [original_id, data[0]['id']])
+
+
+class SpaceSavingTests(TestCase):
+    def test_new_item_evicts_the_smallest_counter(self):
+        sketch = DecayedSpaceSaving(lifetime=3600, capacity=3, now=0)
+        for item, weight in (('a', 5.0), ('b', 2.0), ('c', 3.0)):
+            sketch.add(item, weight, now=0)
+
+        sketch.add('d', 1.0, now=0)
+        counts = sketch.decayed(now=0)
+        self.assertNotIn('b', counts)
+        # The newcomer inherits the evicted count as its error bound
+        self.assertEqual(counts['d'], (3.0, 2.0))
+        self.assertEqual(len(sketch), 3)
+
+        sketch.add('e', 1.0, now=0)
+        self.assertEqual(set(sketch.decayed(now=0)), {'a', 'd', 'e'})
+
+    def test_heavy_hitters_survive_a_long_tail(self):
+        rng = random.Random(48)
+        sketch = DecayedSpaceSaving(lifetime=1e9, capacity=50, now=0)
+        exact = {}
+        for step in range(20000):
+            item = rng.randrange(10) if rng.random() < 0.5 else 10 + rng.randrange(5000)
+            exact[item] = exact.get(item, 0) + 1
+            sketch.add(item, 1.0, now=step * 1e-3)
+
+        counts = sketch.decayed(now=20)
+        for item in range(10):
+            count, error = counts[item]
+            self.assertGreaterEqual(count + 1e-6, exact[item] * math.exp(-20 / 1e9))
+            self.assertLessEqual(count - error, exact[item] + 1e-6)
+
+    def test_counts_decay_and_survive_rescaling(self):
+        sketch = DecayedSpaceSaving(lifetime=10, capacity=5, now=0)
+        sketch.add('a', 1.0, now=0)
+        self.assertAlmostEqual(sketch.decayed(now=10)['a'][0], math.exp(-1))
+
+        # Far enough past the landmark that the forward-decay weights are rescaled
+        sketch.add('b', 1.0, now=1000)
+        self.assertEqual(sketch.landmark, 1000)
+        counts = sketch.decayed(now=1000)
+        self.assertAlmostEqual(counts['b'][0], 1.0)
+        self.assertAlmostEqual(counts['a'][0], math.exp(-100))
+
+    def test_failed_merge_keeps_local_counts(self):
+        engine = TrendingEngine()
+        for _ in range(3):
+            engine.record(1)
+        engine.record(2, 'favorite')
+
+        with mock.patch.object(engine, '_merge_into_table', side_effect=RuntimeError("database is locked")):
+            with self.assertRaises(RuntimeError):
+                engine.merge()
+
+        counts = engine.local['24h'].decayed()
+        self.assertAlmostEqual(counts[1][0], 3.0, places=3)
+        self.assertAlmostEqual(counts[2][0], 3.0, places=3)
+        self.assertIsNone(engine.merged_at)
+
+
+class TrendingMergeTests(TestCase):
+    def setUp(self):
+        APIClient().post('/api/properties/create-bulk/', [listing_payload(index) for index in range(3)], format='json')
+        self.prop_ids = sorted(Property.objects.values_list('id', flat=True))
+
+    def test_merges_from_several_workers_add_up(self):
+        first, second = TrendingEngine(), TrendingEngine()
+        for _ in range(5):
+            first.record(self.prop_ids[0])
+        first.record(self.prop_ids[1])
+        for _ in range(3):
+            second.record(self.prop_ids[1])
+        second.record(999999)
+
+        first.merge()
+        second.merge()
+        scores = dict(TrendingCounter.objects.filter(window='24h').values_list('property_id', 'score'))
+        self.assertEqual(scores.keys(), {self.prop_ids[0], self.prop_ids[1]})
+        self.assertAlmostEqual(scores[self.prop_ids[0]], 5.0, places=2)
+        self.assertAlmostEqual(scores[self.prop_ids[1]], 4.0, places=2)
+        self.assertEqual([prop_id for prop_id, _ in second.top('24h', 5)], [self.prop_ids[0], self.prop_ids[1]])
+
+    def test_failed_merge_serves_local_counts(self):
+        engine = TrendingEngine()
+        engine.record(self.prop_ids[2], 'favorite')
+        engine.record(self.prop_ids[1])
+
+        with mock.patch('listing.trending.trending', engine), \
+                mock.patch.object(engine, '_merge_into_table', side_effect=RuntimeError("database is locked")), \
+                self.assertLogs('listing.trending', 'ERROR'):
+            response = APIClient().get('/api/properties/trending/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.json()['results']], [self.prop_ids[2], self.prop_ids[1]])
+        self.assertIsNone(response.json()['as_of'])
+
+
+class HyperLogLogTests(TestCase):
+    def test_count_within_error_bound(self):
+        # Standard error is 1.04 / sqrt(HLL_REGISTERS) ~ 1.6%; allow four of them
+        bound = 4 * 1.04 / math.sqrt(HLL_REGISTERS)
+        for distinct in (1, 10, 100, 1000, 10000, 100000):
+            sketch = HyperLogLog()
+            for viewer in range(distinct):
+                sketch.add(f"user:{viewer}")
+                sketch.add(f"user:{viewer}")
+            self.assertLessEqual(abs(sketch.count() - distinct), max(1, bound * distinct), distinct)
+
+    def test_merge_counts_the_union(self):
+        first, second = HyperLogLog(), HyperLogLog()
+        for viewer in range(5000):
+            first.add(viewer)
+        for viewer in range(2500, 7500):
+            second.add(viewer)
+
+        union = HyperLogLog(first.registers).merge(second)
+        self.assertLess(abs(union.count() - 7500), 7500 * 0.05)
+        self.assertEqual(HyperLogLog(union.to_bytes()).count(), union.count())
+        self.assertEqual(HyperLogLog().count(), 0)
+
+
+class ViewAnalyticsTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            APIClient().post('/api/properties/create/', listing_payload(0), format='json')
+        self.prop_id = Property.objects.get().id
+
+    def test_flushes_from_several_workers_add_up(self):
+        first, second = ViewAnalytics(), ViewAnalytics()
+        for viewer in range(10):
+            first.record(self.prop_id, f"user:{viewer}")
+        for viewer in range(5, 20):
+            second.record(self.prop_id, f"user:{viewer}")
+        second.record(999999, "user:1")
+
+        self.assertEqual(first.flush(), 1)
+        self.assertEqual(second.flush(), 1)
+        self.assertEqual(first.flush(), 0)
+
+        row = PropertyViewStats.objects.get(property_id=self.prop_id)
+        self.assertEqual((row.views, row.unique_viewers), (25, 20))
+        self.assertEqual(len(row.unique_sketch), HLL_REGISTERS)
+        self.assertEqual(PropertyViewStats.objects.count(), 1)
+
+    def test_stats_include_unflushed_views(self):
+        analytics = ViewAnalytics()
+        analytics.record(self.prop_id, "user:1")
+        analytics.flush()
+        analytics.record(self.prop_id, "user:1")
+        analytics.record(self.prop_id, "user:2")
+
+        stats = analytics.stats([self.prop_id])[self.prop_id]
+        self.assertEqual((stats["views"], stats["unique_viewers"]), (3, 2))
+
+    def test_record_flushes_inline_without_a_flusher(self):
+        analytics = ViewAnalytics()
+        analytics.record(self.prop_id, "user:1")
+        self.assertFalse(PropertyViewStats.objects.exists())
+
+        analytics.pending_since -= FLUSH_INTERVAL_SECONDS
+        analytics.record(self.prop_id, "user:2")
+        self.assertEqual(PropertyViewStats.objects.get(property_id=self.prop_id).views, 2)
+        self.assertEqual(analytics.pending, {})
+
+
+class StreamingTests(TestCase):
+    def streamed(self, client, fmt):
+        response = client.get('/api/properties/get/', {'stream': fmt})
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_empty_catalogue(self):
+        client = APIClient()
+        self.assertEqual(json.loads(self.streamed(client, 'json')[1]), [])
+        self.assertEqual(self.streamed(client, 'ndjson')[1], '')
+
+    def test_streams_match_the_regular_response(self):
+        client = APIClient()
+        rows = [listing_payload(index, f'Description "{index}" with ünïcode') for index in range(7)]
+        client.post('/api/properties/create-bulk/', rows, format='json')
+        expected = sorted(client.get('/api/properties/get/').json(), key=lambda item: item['id'])
+        self.assertEqual(len(expected), 7)
+
+        # Small writes so rows are split across several chunks
+        with mock.patch('listing.views.STREAM_ROWS_PER_WRITE', 3):
+            response, body = self.streamed(client, 'json')
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertEqual(json.loads(body), expected)
+
+            response, body = self.streamed(client, 'ndjson')
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+            self.assertTrue(body.endswith('\n'))
+            self.assertEqual([json.loads(line) for line in body.splitlines()], expected)
+
+    def test_unknown_format(self):
+        response = APIClient().get('/api/properties/get/', {'stream': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_error_mid_stream_reaches_the_server(self):
+        client = APIClient()
+        client.post('/api/properties/create-bulk/', [listing_payload(index) for index in range(7)], format='json')
+        expected = sorted(client.get('/api/properties/get/').json(), key=lambda item: item['id'])
+        original = PropertySerializer.to_representation
+
+        for fmt, content_type in (('json', 'application/json'), ('ndjson', 'application/x-ndjson')):
+            calls = []
+
+            def failing(serializer, instance):
+                calls.append(instance.id)
+                if len(calls) == 5:
+                    raise RuntimeError("database went away")
+                return original(serializer, instance)
+
+            with mock.patch('listing.views.STREAM_ROWS_PER_WRITE', 3), \
+                    mock.patch.object(PropertySerializer, 'to_representation', failing):
+                response = client.get('/api/properties/get/', {'stream': fmt})
+                self.assertEqual(response['Content-Type'], content_type)
+                received = []
+                # The status line is already sent, so the error must escape and abort the connection
+                with self.assertRaisesMessage(RuntimeError, "database went away"):
+                    for chunk in response.streaming_content:
+                        received.append(chunk.decode())
+
+            body = ''.join(received)
+            if fmt == 'json':
+                # No closing bracket, so a client can never take the partial array for the whole catalogue
+                self.assertEqual(body, '[' + ','.join(json.dumps(item, ensure_ascii=False, separators=(',', ':')) for item in expected[:3]))
+                with self.assertRaises(ValueError):
+                    json.loads(body)
+            else:
+                self.assertEqual([json.loads(line) for line in body.splitlines()], expected[:3])
+
+
+class KeywordSearchTests(TestCase):
+    def setUp(self):
+        rows = [listing_payload(index, f"Corner house with a garden, plot {index}") for index in range(SEARCH_DEFAULT_LIMIT + 5)]
+        rows[0].update(title="Marble kitchen villa", location_name="Gulberg")
+        APIClient().post('/api/properties/create-bulk/', rows, format='json')
+
+    def search(self, **params):
+        return APIClient().get('/api/properties/search/', params)
+
+    def test_whole_words_with_prefix_on_the_last(self):
+        self.assertEqual([item['title'] for item in self.search(q='gulb').json()], ["Marble kitchen villa"])
+        self.assertEqual([item['title'] for item in self.search(q='kitchen marble').json()], ["Marble kitchen villa"])
+        # Text inside a word matched under icontains, but not as a token
+        self.assertEqual(self.search(q='ulberg').json(), [])
+        self.assertIn('<mark>', self.search(q='marble').json()[0]['snippet'])
+
+    def test_results_are_bounded(self):
+        self.assertEqual(len(self.search(q='garden').json()), SEARCH_DEFAULT_LIMIT)
+        self.assertEqual(len(self.search(q='garden', limit=SEARCH_MAX_LIMIT).json()), SEARCH_DEFAULT_LIMIT + 5)
+        self.assertEqual(len(self.search(q='garden', limit=3).json()), 3)
+        for limit in ('0', str(SEARCH_MAX_LIMIT + 1), 'x'):
+            self.assertEqual(self.search(q='garden', limit=limit).status_code, 400)
+
+
+def store_listings(points):
+    """
+    Location + Property rows for [(lat, lng, price, size), ...], without the save signals.
+    Returns the property ids in the same order.
+    """
+    locations = Location.objects.bulk_create([
+        Location(name=f"Location {index}", latitude=lat, longitude=lng) for index, (lat, lng, _, _) in enumerate(points)
+    ])
+    return [prop.id for prop in Property.objects.bulk_create([
+        Property(title=f"Listing {index}", price=price, size=size, bedrooms=1, bathrooms=1, location_id=location)
+        for index, (location, (_, _, price, size)) in enumerate(zip(locations, points))
+    ])]
+
+
+class KDTreeTests(TestCase):
+    def test_queries_match_brute_force_through_inserts_and_removals(self):
+        rng = random.Random(34)
+        points = {item_id: (rng.random(), rng.random()) for item_id in range(200)}
+        tree = KDTree(2, points.items())
+        # Enough churn to trigger the lazy-deletion and insertion rebuilds
+        for item_id in range(0, 200, 3):
+            tree.remove(item_id)
+            del points[item_id]
+        for item_id in range(200, 400):
+            points[item_id] = (rng.random(), rng.random())
+            tree.insert(item_id, points[item_id])
+        for item_id in range(200, 260):
+            points[item_id] = (rng.random(), rng.random())
+            tree.insert(item_id, points[item_id])
+        self.assertEqual(len(tree), len(points))
+
+        for _ in range(20):
+            center = (rng.random(), rng.random())
+            by_distance = sorted((sum((a - b) ** 2 for a, b in zip(point, center)), item_id) for item_id, point in points.items())
+            self.assertEqual(tree.nearest(center, 5), by_distance[:5])
+            self.assertEqual(sorted(tree.within(center, 0.1)), sorted(item_id for dist, item_id in by_distance if dist <= 0.01))
+
+            lo, hi = (center[0] - 0.2, center[1] - 0.1), (center[0] + 0.1, center[1] + 0.2)
+            expected = [item_id for item_id, (x, y) in points.items() if lo[0] <= x <= hi[0] and lo[1] <= y <= hi[1]]
+            self.assertEqual(sorted(tree.range(lo, hi)), sorted(expected))
+
+
+class PropertyClusterTests(TestCase):
+    def setUp(self):
+        rng = random.Random(39)
+        self.rows = {prop_id: (31.3 + rng.random() * 0.5, 74.1 + rng.random() * 0.5, float(rng.randrange(50, 500)) * 1000)
+                     for prop_id in range(1, 301)}
+        self.index = PropertyClusterIndex()
+        self.index.build((prop_id, lat, lng, price) for prop_id, (lat, lng, price) in self.rows.items())
+
+    def assertPartitions(self):
+        for zoom in range(MIN_ZOOM, MAX_ZOOM + 1):
+            level = self.index.levels[zoom]
+            members = [prop_id for cluster in level.clusters.values() for prop_id in cluster.members]
+            self.assertCountEqual(members, self.rows)
+            for cluster_id, cluster in level.clusters.items():
+                prices = [self.rows[prop_id][2] for prop_id in cluster.members]
+                self.assertEqual(cluster.prices(), (min(prices), max(prices)))
+                self.assertTrue(all(level.owner[prop_id] == cluster_id for prop_id in cluster.members))
+                self.assertIn(cluster_id, level.tree)
+
+    def test_every_zoom_partitions_the_properties(self):
+        self.assertPartitions()
+        self.assertEqual(sum(marker['count'] for marker in self.index.clusters(-90, -180, 90, 180, 0)), 300)
+        self.assertLess(len(self.index.levels[0].clusters), len(self.index.levels[MAX_ZOOM].clusters))
+
+    def test_inserts_and_removals_keep_the_partition(self):
+        rng = random.Random(40)
+        for prop_id in range(1, 301, 4):
+            self.assertTrue(self.index.remove(prop_id))
+            del self.rows[prop_id]
+        for prop_id in range(301, 341):
+            self.rows[prop_id] = (31.3 + rng.random() * 0.5, 74.1 + rng.random() * 0.5, float(rng.randrange(50, 500)) * 1000)
+            self.index.insert(prop_id, *self.rows[prop_id])
+        # Moving a property re-inserts it
+        self.rows[2] = (31.9, 74.9, 1.0)
+        self.index.insert(2, *self.rows[2])
+        self.assertPartitions()
+        self.assertFalse(self.index.remove(1))
+
+    def test_single_markers_and_antimeridian_boxes(self):
+        index = PropertyClusterIndex()
+        index.build([(1, 10.0, 179.5, 100.0), (2, 10.0, -179.5, 200.0), (3, 10.0, 0.0, 300.0)])
+        markers = index.clusters(0, 179, 20, -179, MAX_ZOOM + 1)
+        self.assertEqual(sorted(marker['property_id'] for marker in markers), [1, 2])
+        for marker in markers:
+            self.assertEqual(marker['count'], 1)
+            self.assertAlmostEqual(marker['lat'], 10.0)
+
+        clustered = index.clusters(0, 179, 20, -179, MAX_ZOOM)
+        self.assertEqual(sorted(marker['property_id'] for marker in clustered), [1, 2])
+        self.assertEqual(sum(marker['count'] for marker in index.clusters(0, -10, 20, 10, MAX_ZOOM)), 1)
+
+
+class MapEndpointTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.ids = store_listings([
+            (31.50, 74.30, 100000, 100), (31.51, 74.31, 200000, 150), (31.52, 74.32, 300000, 200),
+            (31.90, 74.90, 150000, 120), (10.0, 179.5, 120000, 90), (10.0, -179.5, 130000, 95)
+        ])
+        self.geo_index = PropertyGeoIndex()
+        self.cluster_index = PropertyClusterIndex()
+        for patcher in (mock.patch('listing.geo_index.property_geo_index', self.geo_index),
+                        mock.patch('listing.clusters.property_clusters', self.cluster_index)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.geo_index.ensure_loaded()
+
+    def viewport(self, **params):
+        return self.client.get('/api/properties/map/', params)
+
+    def test_viewport_filters_and_pages(self):
+        body = self.viewport(bbox='31.4,74.2,31.6,74.4').json()
+        self.assertEqual(body['count'], 3)
+        self.assertEqual([item['id'] for item in body['results']], self.ids[:3])
+        self.assertEqual(body['results'][0], {'id': self.ids[0], 'lat': 31.50, 'lng': 74.30, 'price': 100000.0})
+
+        filtered = self.viewport(bbox='31.4,74.2,31.6,74.4', min_price=150000, max_size=180).json()
+        self.assertEqual([item['id'] for item in filtered['results']], [self.ids[1]])
+
+        first = self.viewport(bbox='31.4,74.2,32,75', page_size=2).json()
+        second = self.viewport(bbox='31.4,74.2,32,75', page_size=2, page=2).json()
+        self.assertEqual((first['count'], first['next_page'], second['next_page']), (4, 2, None))
+        self.assertEqual([item['id'] for item in first['results'] + second['results']], self.ids[:4])
+
+    def test_viewport_across_the_antimeridian(self):
+        body = self.viewport(bbox='0,179,20,-179').json()
+        self.assertEqual([item['id'] for item in body['results']], self.ids[4:])
+
+    def test_viewport_tracks_inserts_and_removals(self):
+        self.geo_index.remove_property(self.ids[0])
+        self.geo_index._add(self.ids[3], 31.55, 74.35, 150000, 120)
+        body = self.viewport(bbox='31.4,74.2,31.6,74.4').json()
+        self.assertEqual([item['id'] for item in body['results']], self.ids[1:4])
+
+    def test_bad_viewport_parameters(self):
+        for params in ({'bbox': '31.4,74.2,31.6'}, {'bbox': '31.6,74.2,31.4,74.4'}, {'bbox': '0,0,91,1'},
+                       {'bbox': '0,0,1,1', 'page': 0}, {'bbox': '0,0,1,1', 'page_size': 5000}, {'bbox': '0,0,1,1', 'min_price': 'x'}):
+            self.assertEqual(self.viewport(**params).status_code, 400)
+
+    def test_clusters_endpoint(self):
+        body = self.client.get('/api/properties/map/clusters/', {'bbox': '-90,-180,90,180', 'zoom': 0}).json()
+        self.assertEqual(body['total'], 6)
+
+        body = self.client.get('/api/properties/map/clusters/', {'bbox': '0,179,20,-179', 'zoom': 20}).json()
+        self.assertEqual(sorted(marker['property_id'] for marker in body['markers']), self.ids[4:])
+        self.assertEqual(self.client.get('/api/properties/map/clusters/', {'bbox': '0,0,1,1'}).status_code, 400)
+
+
+class DistanceSortTests(TestCase):
+    def setUp(self):
+        rng = random.Random(40)
+        self.points = [(31.3 + rng.random() * 0.4, 74.1 + rng.random() * 0.4, rng.randrange(50, 500) * 1000, rng.randrange(50, 300))
+                       for _ in range(KNN_DEFAULT_LIMIT + 10)]
+        self.ids = store_listings(self.points)
+        patcher = mock.patch('listing.nearest.property_knn', PropertyKNNIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+
+    def ranked(self, lat, lng, keep=lambda point: True):
+        return sorted(
+            (calculate_haversine(lat, lng, point[0], point[1]), prop_id)
+            for prop_id, point in zip(self.ids, self.points) if keep(point)
+        )
+
+    def test_listing_is_nearest_first(self):
+        expected = self.ranked(31.5, 74.3)
+        body = self.client.get('/api/properties/get/', {'sort': 'distance', 'lat': 31.5, 'lng': 74.3}).json()
+        self.assertEqual([item['id'] for item in body], [prop_id for _, prop_id in expected[:KNN_DEFAULT_LIMIT]])
+        for item, (distance, _) in zip(body, expected):
+            self.assertAlmostEqual(item['distance_km'], distance, places=2)
+
+        page = self.client.get('/api/properties/get/', {'sort': 'distance', 'lat': 31.5, 'lng': 74.3, 'limit': 5, 'offset': 5}).json()
+        self.assertEqual([item['id'] for item in page], [prop_id for _, prop_id in expected[5:10]])
+
+    def test_advanced_search_filters_before_ranking(self):
+        keep = lambda point: 150000 <= point[2] <= 400000 and point[3] >= 100
+        expected = [prop_id for _, prop_id in self.ranked(31.4, 74.2, keep)]
+        body = self.client.get('/api/properties/search/advanced/', {
+            'sort': 'distance', 'lat': 31.4, 'lng': 74.2, 'min_price': 150000, 'max_price': 400000, 'min_size': 100, 'limit': 200
+        }).json()
+        self.assertEqual([item['id'] for item in body], expected)
+
+    def test_facility_origin(self):
+        location = Location.objects.bulk_create([Location(name="School", latitude=31.45, longitude=74.25, location_type='facility')])[0]
+        facility = Facility.objects.bulk_create([Facility(location=location, name="School", type='school')])[0]
+        body = self.client.get('/api/properties/get/', {'sort': 'distance', 'facility_id': facility.id, 'limit': 3}).json()
+        self.assertEqual([item['id'] for item in body], [prop_id for _, prop_id in self.ranked(31.45, 74.25)[:3]])
+        self.assertEqual(self.client.get('/api/properties/get/', {'sort': 'distance', 'facility_id': 999999}).status_code, 404)
+
+    def test_missing_or_bad_origin(self):
+        for url in ('/api/properties/get/', '/api/properties/search/advanced/'):
+            for params in ({}, {'lat': 31.5}, {'lat': 'x', 'lng': 74.3}, {'lat': 91, 'lng': 74.3},
+                           {'lat': 31.5, 'lng': 74.3, 'limit': 0}, {'lat': 31.5, 'lng': 74.3, 'offset': -1}):
+                response = self.client.get(url, {'sort': 'distance', **params})
+                self.assertEqual(response.status_code, 400, (url, params))
+                self.assertIn('error', response.json())
+
+
+class CoOccurrenceTests(TestCase):
+    WINDOW = 4
+
+    def setUp(self):
+        patcher = mock.patch('listing.co_occurrence.MAX_ITEMS_PER_USER', self.WINDOW)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.prop_ids = store_listings([(31.5, 74.3, 100000, 100)] * 12)
+        self.users = User.objects.bulk_create([User(username=f"user{index}") for index in range(3)])
+
+    @staticmethod
+    def state(index):
+        return {a: dict(counter) for a, counter in index.counts.items() if counter}, +index.occurrences
+
+    def rebuilt(self, favorites):
+        """
+        What load() builds from these favorites, stored oldest first.
+        """
+        Favorite.objects.all().delete()
+        Favorite.objects.bulk_create([
+            Favorite(user_id=user_id, property_id=property_id)
+            for user_id, items in favorites.items() for property_id in items
+        ])
+        index = CoOccurrenceIndex()
+        with mock.patch('listing.hash_map.recent_view.histories', return_value=[]):
+            index.load()
+        return index
+
+    def test_toggles_match_a_rebuild_as_the_window_slides(self):
+        rng = random.Random(45)
+        index = self.rebuilt({})
+        favorites = {user.id: [] for user in self.users}
+
+        for step in range(300):
+            user_id = rng.choice(list(favorites))
+            property_id = rng.choice(self.prop_ids)
+            if property_id in favorites[user_id] and rng.random() < 0.6:
+                favorites[user_id].remove(property_id)
+                index.remove_favorite(user_id, property_id)
+            elif property_id not in favorites[user_id]:
+                favorites[user_id].append(property_id)
+                index.add_favorite(user_id, property_id)
+
+            if step % 50 == 49:
+                # Lists longer than the window, so removals pull older favorites back into it
+                self.assertTrue(any(len(items) > self.WINDOW for items in favorites.values()))
+                self.assertEqual(self.state(index), self.state(self.rebuilt(favorites)))
+
+        # Deleting a property lets an older favorite slide into every window it leaves
+        removed = self.prop_ids[0]
+        index.remove_property(removed)
+        favorites = {user_id: [item for item in items if item != removed] for user_id, items in favorites.items()}
+        self.assertEqual(self.state(index), self.state(self.rebuilt(favorites)))
+
+    def test_window_diff_pairs_only_the_paired_favorites(self):
+        index = self.rebuilt({})
+        user_id = self.users[0].id
+        a, b, c, d, e = self.prop_ids[:5]
+        for property_id in (a, b, c, d, e):
+            index.add_favorite(user_id, property_id)
+        # a fell out of the window of four when e arrived
+        self.assertNotIn(a, index.counts.get(b, {}))
+        self.assertEqual(index.counts[b][e], 3)
+
+        index.remove_favorite(user_id, c)
+        # a is back in the window and paired with what stayed; c is unpaired from all of them
+        self.assertEqual({other: index.counts[a][other] for other in (b, d, e)}, {b: 3, d: 3, e: 3})
+        self.assertFalse(index.counts.get(c))
+        self.assertEqual(index.user_favorites[user_id], [a, b, d, e])
+        self.assertEqual(index.neighbors(a)[0][0], b)
+
+    def test_concurrent_views_and_reads(self):
+        index = self.rebuilt({})
+        rng = random.Random(46)
+        histories = [rng.sample(self.prop_ids, 6) for _ in range(400)]
+        errors = []
+
+        def record(batch):
+            for history in batch:
+                index.add_view(history[1:], history[0])
+
+        def read():
+            try:
+                for _ in range(300):
+                    for property_id in self.prop_ids[:4]:
+                        index.neighbors(property_id)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=record, args=(histories[i::4],)) for i in range(4)]
+        threads += [threading.Thread(target=read) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        expected = CoOccurrenceIndex()
+        expected.loaded = True
+        for history in histories:
+            expected.add_view(history[1:], history[0])
+        self.assertEqual(self.state(index), self.state(expected))
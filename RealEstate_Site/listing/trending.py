@@ -0,0 +1,256 @@
+import math
+import time
+import heapq
+import logging
+import threading
+
+# Events lose weight exponentially with a mean lifetime of the window, a smooth stand-in for a sliding window
+WINDOWS = {'1h': 3600, '24h': 24 * 3600, '7d': 7 * 24 * 3600}
+DEFAULT_WINDOW = '24h'
+EVENT_WEIGHTS = {'view': 1.0, 'favorite': 3.0}
+# Counters kept per window, locally and in the merged table
+CAPACITY = 500
+# How often each worker folds its local counts into TrendingCounter and reloads the ranking
+MERGE_INTERVAL_SECONDS = 30
+# Forward-decay weights are rescaled before exp() gets anywhere near overflow
+MAX_EXPONENT = 50.0
+
+logger = logging.getLogger(__name__)
+
+
+class DecayedSpaceSaving:
+    """
+    Space-Saving heavy hitters over exponentially decayed counts, in at most `capacity` counters.
+    Forward decay: an event at time t adds weight * exp((t - landmark) / lifetime), so counts
+    never need touching as time passes; they are rescaled only when the landmark moves.
+    A new item evicts the smallest counter and inherits its count as error (an overestimate bound).
+    Format: counts {item: [count, error]}
+    """
+    def __init__(self, lifetime, capacity=CAPACITY, now=None):
+        self.lifetime = lifetime
+        self.capacity = capacity
+        self.landmark = time.time() if now is None else now
+        self.counts = {}
+        # Lazy min-heap of (count, item); entries whose count is out of date are skipped
+        self._heap = []
+
+    def __len__(self):
+        return len(self.counts)
+
+    def _exponent(self, now):
+        return (now - self.landmark) / self.lifetime
+
+    def _rescale(self, now):
+        factor = math.exp(-self._exponent(now))
+        for counter in self.counts.values():
+            counter[0] *= factor
+            counter[1] *= factor
+        self.landmark = now
+        self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        self._heap = [(counter[0], item) for item, counter in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        while self._heap:
+            count, item = heapq.heappop(self._heap)
+            counter = self.counts.get(item)
+            if counter is not None and counter[0] == count:
+                return item
+        return None
+
+    def add(self, item, weight=1.0, now=None, error=0.0):
+        """
+        error: overestimate already carried by weight, when folding in counts from another sketch.
+        """
+        now = time.time() if now is None else now
+        if self._exponent(now) > MAX_EXPONENT:
+            self._rescale(now)
+        scale = math.exp(self._exponent(now))
+
+        counter = self.counts.get(item)
+        if counter is None:
+            if len(self.counts) >= self.capacity:
+                evicted = self._pop_min()
+                floor = self.counts.pop(evicted)[0]
+                counter = self.counts[item] = [floor, floor]
+            else:
+                counter = self.counts[item] = [0.0, 0.0]
+        counter[0] += weight * scale
+        counter[1] += error * scale
+        heapq.heappush(self._heap, (counter[0], item))
+
+        if len(self._heap) > 4 * self.capacity:
+            self._rebuild_heap()
+
+    def decayed(self, now=None):
+        """
+        Counts as of now. Returns {item: (count, error)}.
+        """
+        now = time.time() if now is None else now
+        factor = math.exp(-self._exponent(now))
+        return {item: (count * factor, error * factor) for item, (count, error) in self.counts.items()}
+
+    def absorb(self, counts, now=None):
+        """
+        Folds in {item: (count, error)} taken from decayed() of another sketch at the same `now`.
+        """
+        now = time.time() if now is None else now
+        for item, (count, error) in counts.items():
+            self.add(item, count, now, error)
+
+
+class TrendingEngine:
+    """
+    Per-worker decayed Space-Saving sketches (one per window) over view and favorite events.
+    Every MERGE_INTERVAL_SECONDS the local counts are merged into the TrendingCounter table,
+    which holds the combined top CAPACITY of every worker, and the ranking is reloaded from it.
+    The merge runs on a background thread when one is started and otherwise from top() once the
+    ranking is older than the interval; reads only slice the ranking.
+    Format: ranking {window: [(property_id, score), ...]} best first
+    """
+    def __init__(self):
+        self.local = self._empty_sketches()
+        self.ranking = {window: [] for window in WINDOWS}
+        self.merged_at = None
+        self._lock = threading.Lock()
+        # One merge at a time per process; record() only ever needs _lock
+        self._merge_lock = threading.Lock()
+        self._thread = None
+
+    @staticmethod
+    def _empty_sketches(now=None):
+        return {window: DecayedSpaceSaving(lifetime, now=now) for window, lifetime in WINDOWS.items()}
+
+    def record(self, property_id, event='view'):
+        weight = EVENT_WEIGHTS[event]
+        now = time.time()
+        with self._lock:
+            for sketch in self.local.values():
+                sketch.add(int(property_id), weight, now)
+
+    def merge(self, wait=True):
+        """
+        Folds the local counts into TrendingCounter (decaying what is stored there to now),
+        keeps the top CAPACITY per window and reloads the ranking.
+        The local sketches are swapped out first; if the transaction fails their counts are
+        folded back in for the next merge. With wait=False, returns False at once when
+        another merge is already running.
+        """
+        if not self._merge_lock.acquire(blocking=wait):
+            return False
+        try:
+            self._merge()
+        finally:
+            self._merge_lock.release()
+        return True
+
+    def _merge(self):
+        from django.utils import timezone
+
+        now = time.time()
+        with self._lock:
+            taken, self.local = self.local, self._empty_sketches(now)
+        local = {window: sketch.decayed(now) for window, sketch in taken.items()}
+
+        try:
+            stamp = timezone.now()
+            rankings = self._merge_into_table(local, stamp)
+        except Exception:
+            with self._lock:
+                for window, counts in local.items():
+                    self.local[window].absorb(counts, now)
+            raise
+
+        self.ranking = rankings
+        self.merged_at = stamp
+
+    def _merge_into_table(self, local, stamp):
+        """
+        Read-modify-write of each window's rows under row locks, as in ViewAnalytics.flush:
+        rows for this worker's listings are inserted empty first, so every row merged is locked
+        and a concurrent merge from another worker waits instead of being overwritten.
+        """
+        from django.db import transaction
+        from .models import TrendingCounter, Property
+
+        rankings = {}
+        with transaction.atomic():
+            # Counts for listings deleted since they were viewed are dropped here
+            seen = set().union(*(counts.keys() for counts in local.values()))
+            alive = set(Property.objects.filter(id__in=list(seen)).values_list('id', flat=True))
+
+            for window, lifetime in WINDOWS.items():
+                TrendingCounter.objects.bulk_create(
+                    [
+                        TrendingCounter(window=window, property_id=prop_id, score=0.0, error=0.0, updated_at=stamp)
+                        for prop_id in local[window] if prop_id in alive
+                    ],
+                    ignore_conflicts=True
+                )
+                rows = {row.property_id: row for row in TrendingCounter.objects.select_for_update().filter(window=window)}
+
+                for row in rows.values():
+                    factor = math.exp(-max(0.0, (stamp - row.updated_at).total_seconds()) / lifetime)
+                    score, error = local[window].get(row.property_id, (0.0, 0.0))
+                    row.score = row.score * factor + score
+                    row.error = row.error * factor + error
+                    row.updated_at = stamp
+
+                top = heapq.nlargest(CAPACITY, rows.values(), key=lambda row: row.score)
+                kept = {row.property_id for row in top}
+                TrendingCounter.objects.filter(
+                    window=window, property_id__in=[prop_id for prop_id in rows if prop_id not in kept]
+                ).delete()
+                TrendingCounter.objects.bulk_update(top, ['score', 'error', 'updated_at'])
+                rankings[window] = [(row.property_id, row.score) for row in top]
+        return rankings
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='trending-merge', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        from django.db import connection
+        while True:
+            time.sleep(MERGE_INTERVAL_SECONDS)
+            try:
+                self.merge()
+            except Exception:
+                logger.exception("Trending merge failed")
+            finally:
+                connection.close()
+
+    def top(self, window, k):
+        """
+        Returns [(property_id, score), ...] for the k hottest listings as of the last merge.
+        A ranking older than MERGE_INTERVAL_SECONDS is refreshed first; only the very first
+        read waits for a merge already running elsewhere, later ones serve the current ranking.
+        If no merge has ever succeeded, this worker's own counts are served instead.
+        """
+        from django.utils import timezone
+
+        try:
+            if self.merged_at is None:
+                self.merge()
+            elif (timezone.now() - self.merged_at).total_seconds() > MERGE_INTERVAL_SECONDS:
+                self.merge(wait=False)
+        except Exception:
+            logger.exception("Trending merge failed; serving the previous ranking")
+
+        if self.merged_at is None:
+            return self._local_top(window, k)
+        return self.ranking[window][:k]
+
+    def _local_top(self, window, k):
+        with self._lock:
+            counts = self.local[window].decayed()
+        return heapq.nlargest(k, ((prop_id, score) for prop_id, (score, _) in counts.items()), key=lambda item: item[1])
+
+
+trending = TrendingEngine()
@@ -8,6 +8,8 @@ urlpatterns = [
     path('create-bulk/', views.bulk_add_properties, name='add_properties'),
     path('get/', views.get_properties, name='get_properties'),
     path('all/', views.get_properties, name='get_all_properties'),
+    path('map/', views.get_properties_in_viewport, name='properties_in_viewport'),
+    path('map/clusters/', views.get_property_clusters, name='property_clusters'),
     path('get-featured/', views.get_featured_properties, name='get_featured_views.properties'),
     path('sorted/price/',views.get_sorted_by_price,name='sort_properties'),
     path('sorted/size/',views.get_sorted_by_size,name='sort_properties'),
@@ -16,6 +18,10 @@ urlpatterns = [
     path('favorites/toggle/', views.toggle_favorite, name='toggle_favorite'),
     path('view/<int:prop_id>/', views.get_single_property_detail, name='record_view'),
     path('recent/',views.get_recent_list, name='get_recent'),
+    path('also-liked/<int:prop_id>/', views.get_also_liked, name='also_liked'),
+    path('trending/', views.get_trending_properties, name='trending'),
+    path('analytics/', views.get_properties_analytics, name='properties_analytics'),
+    path('analytics/<int:prop_id>/', views.get_property_analytics, name='property_analytics'),
     path('all-requests/', views.get_all_requests, name='get_all_requests'),
     path('my-requests/', views.get_my_requests, name='get_my_requests'),    # User (NEW)
     path('submit-buy-request/', views.create_property_request, name='submit_request'),
@@ -1,9 +1,10 @@
 from django.shortcuts import render
+from django.http import StreamingHttpResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
-from users.permissions import IsAdminRole
+from users.permissions import IsAdminRole, IsAgentOrAdmin
 from .serializers import PropertySerializer, PropertyRequestSerializer
 from .models import Property, Favorite, PropertyRequest,SellPropertyDetail
 import locations.signals
@@ -14,6 +15,11 @@ from django.shortcuts import get_object_or_404
 from django.db import IntegrityError
 import copy
 
+
+def _facility_context(request):
+    # ?facilities=true adds the nearest-facility badges to every listing in a list response
+    return {'nearest_facilities': request.query_params.get('facilities') == 'true'}
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def add_property(request):
@@ -94,13 +100,20 @@ def bulk_add_properties(request):
     created_properties = []
     
     try:
+        from .minhash import MinHashLSH, description_index
+        # Loaded before the transaction: a first load inside it would read this batch's uncommitted rows
+        description_index.ensure_loaded()
+
         with transaction.atomic():
             
             from .trees import property_tree, size_tree
             from .heap import cheap_heap, size_heap
 
+            # The shared index only sees rows once the batch commits, so duplicates inside it are checked here
+            batch_index = MinHashLSH()
+
             for property_data in data:
-                serializer = PropertySerializer(data=property_data)
+                serializer = PropertySerializer(data=property_data, context={'batch_index': batch_index})
                 
                 if serializer.is_valid():
                     
@@ -129,12 +142,19 @@ def bulk_add_properties(request):
 def get_single_property_detail(request, prop_id):
     try:
         property_obj = get_object_or_404(Property, id=prop_id)
+
+        from .trending import trending
+        from .analytics import view_analytics, viewer_key
+        trending.record(prop_id, 'view')
+        view_analytics.record(property_obj.id, viewer_key(request))
         
         if request.user.is_authenticated:
             from .hash_map import recent_view
+            from .co_occurrence import co_occurrence
+            co_occurrence.add_view(recent_view.get_history(request.user.id), prop_id)
             recent_view.add_view(request.user.id, prop_id)
 
-        serializer = PropertySerializer(property_obj)
+        serializer = PropertySerializer(property_obj, context={'nearest_facilities': True})
         
         return Response({
             "status": "success",
@@ -144,27 +164,254 @@ def get_single_property_detail(request, prop_id):
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+SEARCH_DEFAULT_LIMIT = 50
+SEARCH_MAX_LIMIT = 500
+
+
 @api_view(['GET'])
 def property_keyword_search(request):
+    # With the FTS5 index this matches whole words (the last one as a prefix, so "gulb" finds "Gulberg")
+    # in title, description and location name, and returns the best SEARCH_DEFAULT_LIMIT by bm25
+    # (?limit up to SEARCH_MAX_LIMIT). Unlike the icontains fallback, text inside a word ("ulberg") does not match.
     query = request.query_params.get('q', '')
 
     if not query:
         return Response({"error": "Please provide a search keyword"}, status=400)
 
+    from . import fulltext
+    if fulltext.available():
+        # Bounded so common words do not serialise a large share of the catalogue
+        try:
+            limit = int(request.query_params.get('limit', SEARCH_DEFAULT_LIMIT))
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=400)
+        if not 1 <= limit <= SEARCH_MAX_LIMIT:
+            return Response({"error": f"limit must be between 1 and {SEARCH_MAX_LIMIT}"}, status=400)
+
+        # Ranked by bm25 over title, description and location name, with a highlighted snippet
+        hits = fulltext.search(query, limit)
+        properties = Property.objects.select_related('location_id').in_bulk([prop_id for prop_id, _, _ in hits])
+        ranked = [(properties[prop_id], score, snippet) for prop_id, score, snippet in hits if prop_id in properties]
+
+        data = PropertySerializer([prop for prop, _, _ in ranked], many=True, context=_facility_context(request)).data
+        for item, (_, score, snippet) in zip(data, ranked):
+            item['score'] = round(score, 4)
+            item['snippet'] = snippet
+        return Response(data)
+
     properties = Property.objects.filter(
         Q(title__icontains=query) | Q(description__icontains=query)
     )
 
-    serializer = PropertySerializer(properties, many=True)
+    serializer = PropertySerializer(properties, many=True, context=_facility_context(request))
     return Response(serializer.data)
 
+KNN_DEFAULT_LIMIT = 20
+KNN_MAX_LIMIT = 200
+
+
+def _distance_origin(params):
+    """
+    (lat, lng) from ?lat=&lng= or from the location of ?facility_id=.
+    Raises ValueError when neither is usable and Facility.DoesNotExist for an unknown facility.
+    """
+    facility_id = params.get('facility_id')
+    if facility_id:
+        from locations.models import Facility
+        return Facility.objects.values_list('location__latitude', 'location__longitude').get(id=int(facility_id))
+
+    lat, lng = float(params.get('lat')), float(params.get('lng'))
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("lat/lng out of range")
+    return lat, lng
+
+
+def _distance_sorted(request, **filters):
+    """
+    sort=distance mode shared by the listing endpoints: nearest first from the origin,
+    paged with ?limit=&offset=, each item carrying distance_km.
+    """
+    from locations.models import Facility
+    params = request.query_params
+    try:
+        lat, lng = _distance_origin(params)
+        limit = int(params.get('limit', KNN_DEFAULT_LIMIT))
+        offset = int(params.get('offset', 0))
+    except (TypeError, ValueError):
+        return Response(
+            {"error": "sort=distance needs lat and lng (or facility_id), and integer limit/offset"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except Facility.DoesNotExist:
+        return Response({"error": "Facility not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    if not 1 <= limit <= KNN_MAX_LIMIT or offset < 0:
+        return Response(
+            {"error": f"limit must be between 1 and {KNN_MAX_LIMIT} and offset >= 0"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    from .nearest import property_knn
+    ranked = property_knn.nearest(lat, lng, limit, offset, **filters)
+    properties = Property.objects.select_related('location_id').in_bulk([prop_id for prop_id, _ in ranked])
+
+    ordered = [(properties[prop_id], distance) for prop_id, distance in ranked if prop_id in properties]
+    serialized = PropertySerializer([prop for prop, _ in ordered], many=True).data
+    for item, (_, distance) in zip(serialized, ordered):
+        item['distance_km'] = round(distance, 3)
+
+    return Response(serialized, status=status.HTTP_200_OK)
+
+
+STREAM_FORMATS = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+# Rows fetched per DB round trip, and rows serialised into each chunk written to the client
+STREAM_CHUNK_SIZE = 2000
+STREAM_ROWS_PER_WRITE = 100
+
+
+def _stream_rows(queryset, fmt):
+    """
+    Serialises one row at a time and yields text chunks: a JSON array, or one object per line.
+    Memory stays flat however many rows the queryset has.
+    """
+    from rest_framework.utils.encoders import JSONEncoder
+    # Same compact output as the default JSON renderer
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    serializer = PropertySerializer()
+
+    if fmt == 'json':
+        yield '['
+    buffer = []
+    first = True
+    for prop in queryset.iterator(chunk_size=STREAM_CHUNK_SIZE):
+        item = encoder.encode(serializer.to_representation(prop))
+        if fmt == 'json':
+            buffer.append(item if first else ',' + item)
+        else:
+            buffer.append(item + '\n')
+        first = False
+
+        if len(buffer) >= STREAM_ROWS_PER_WRITE:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+    if fmt == 'json':
+        yield ']'
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_properties(request):
+    # ?sort=distance&lat=&lng= (or &facility_id=) lists nearest first instead of everything
+    if request.query_params.get('sort') == 'distance':
+        return _distance_sorted(request)
+
+    # ?stream=json|ndjson sends the whole catalogue row by row instead of building it in memory
+    fmt = request.query_params.get('stream')
+    if fmt:
+        if fmt not in STREAM_FORMATS:
+            return Response({"error": f"stream must be one of {', '.join(STREAM_FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = Property.objects.select_related('location_id').order_by('id')
+        return StreamingHttpResponse(_stream_rows(queryset, fmt), content_type=STREAM_FORMATS[fmt])
+
     data = Property.objects.all()
-    serializer = PropertySerializer(data,many=True)    
+    serializer = PropertySerializer(data, many=True, context=_facility_context(request))
     return Response(serializer.data, status=status.HTTP_200_OK)
 
+MAP_DEFAULT_PAGE_SIZE = 200
+MAP_MAX_PAGE_SIZE = 1000
+
+
+def _optional_float(params, name):
+    value = params.get(name)
+    return float(value) if value not in (None, '') else None
+
+
+def _parse_bbox(params):
+    """
+    Reads ?bbox=<south>,<west>,<north>,<east>; raises ValueError when malformed or out of range.
+    """
+    south, west, north, east = (float(v) for v in params.get('bbox', '').split(','))
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise ValueError("bbox is outside valid coordinates")
+    return south, west, north, east
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_properties_in_viewport(request):
+    """
+    ?bbox=<south>,<west>,<north>,<east>&min_price=&max_price=&min_size=&max_size=&page=1&page_size=200
+    Lightweight map markers for every listing inside the box, ordered by id.
+    """
+    params = request.query_params
+    try:
+        south, west, north, east = _parse_bbox(params)
+        filters = {name: _optional_float(params, name) for name in ('min_price', 'max_price', 'min_size', 'max_size')}
+        page = int(params.get('page', 1))
+        page_size = int(params.get('page_size', MAP_DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return Response(
+            {"error": "bbox must be 'south,west,north,east' within valid coordinates and filters/page must be numbers"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if page < 1 or not 1 <= page_size <= MAP_MAX_PAGE_SIZE:
+        return Response(
+            {"error": f"page must be >= 1 and page_size between 1 and {MAP_MAX_PAGE_SIZE}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    from .geo_index import property_geo_index
+    from locations import geo_rtree
+    if not property_geo_index.loaded and geo_rtree.available():
+        # Cold worker: answer from the DB-side R*Tree instead of loading the whole index
+        matches = geo_rtree.properties_in_bbox(south, west, north, east, **filters)
+    else:
+        matches = property_geo_index.search(south, west, north, east, **filters)
+
+    start = (page - 1) * page_size
+    results = [
+        {"id": prop_id, "lat": lat, "lng": lng, "price": price}
+        for prop_id, lat, lng, price in matches[start:start + page_size]
+    ]
+
+    return Response({
+        "count": len(matches),
+        "page": page,
+        "page_size": page_size,
+        "next_page": page + 1 if start + page_size < len(matches) else None,
+        "results": results
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_property_clusters(request):
+    """
+    ?bbox=<south>,<west>,<north>,<east>&zoom=<0-22>
+    Map markers for the viewport: clusters with counts and price ranges, or single
+    properties (with property_id) once zoomed in far enough.
+    """
+    try:
+        south, west, north, east = _parse_bbox(request.query_params)
+        zoom = int(request.query_params.get('zoom', ''))
+    except ValueError:
+        return Response(
+            {"error": "bbox must be 'south,west,north,east' within valid coordinates and zoom an integer"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    from .clusters import property_clusters
+    markers = property_clusters.clusters(south, west, north, east, zoom)
+
+    return Response({
+        "zoom": zoom,
+        "total": sum(marker["count"] for marker in markers),
+        "markers": markers
+    }, status=status.HTTP_200_OK)
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_featured_properties(request):
@@ -174,7 +421,7 @@ def get_featured_properties(request):
     if not featured_props.exists():
         return Response({"message": "No featured properties found"}, status=200)
 
-    serializer = PropertySerializer(featured_props, many=True)
+    serializer = PropertySerializer(featured_props, many=True, context=_facility_context(request))
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 @api_view(['GET']) 
@@ -190,7 +437,7 @@ def search_price_range(request):
     
     results = property_tree.search_by_price_range(min_p, max_p)
     
-    serializer = PropertySerializer(results, many=True)
+    serializer = PropertySerializer(results, many=True, context=_facility_context(request))
     return Response(serializer.data)
 
 @api_view(['GET'])
@@ -223,6 +470,12 @@ def advanced_search(request):
     
     min_bed = int(request.query_params.get('min_bedrooms', 0))
 
+    if request.query_params.get('sort') == 'distance':
+        return _distance_sorted(
+            request, min_price=min_p, max_price=max_p,
+            min_size=min_s, max_size=max_s, min_bedrooms=min_bed
+        )
+
     from .trees import property_tree
     initial_candidates = property_tree.search_by_price_range(min_p, max_p)
 
@@ -235,7 +488,7 @@ def advanced_search(request):
             filtered_results.append(prop)
 
     from .serializers import PropertySerializer
-    serializer = PropertySerializer(filtered_results, many=True)
+    serializer = PropertySerializer(filtered_results, many=True, context=_facility_context(request))
     return Response(serializer.data)
 
 
@@ -294,7 +547,7 @@ def get_user_favorites(request):
 
     properties = Property.objects.filter(id__in=fav_property_ids)
     
-    serializer = PropertySerializer(properties, many=True)
+    serializer = PropertySerializer(properties, many=True, context=_facility_context(request))
     return Response(serializer.data)
 
 @api_view(['POST'])
@@ -313,6 +566,12 @@ def property_view(request):
             return Response({"error": "Property not found"}, status=404)
 
         from .hash_map import recent_view
+        from .co_occurrence import co_occurrence
+        co_occurrence.add_view(recent_view.get_history(user_id), prop.id)
+        from .trending import trending
+        from .analytics import view_analytics, viewer_key
+        trending.record(prop.id, 'view')
+        view_analytics.record(prop.id, viewer_key(request))
         recent_view.add_view(user_id,property_id)
         
         serializer = PropertySerializer(prop)
@@ -324,6 +583,100 @@ def property_view(request):
     except Exception as e:
         return Response({"error": str(e)}, status=500)
     
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_also_liked(request, prop_id):
+    """
+    Properties most often favorited or viewed together with this one.
+    """
+    from .co_occurrence import co_occurrence, TOP_N
+
+    try:
+        target_property = Property.objects.get(id=prop_id)
+        limit = int(request.query_params.get('limit', TOP_N))
+    except Property.DoesNotExist:
+        return Response({"error": "Property not found"}, status=404)
+    except ValueError:
+        return Response({"error": "limit must be an integer"}, status=400)
+
+    neighbors = co_occurrence.neighbors(prop_id, max(1, limit))
+    found = Property.objects.select_related('location_id').in_bulk([other_id for other_id, _ in neighbors])
+    ranked = [(found[other_id], score) for other_id, score in neighbors if other_id in found]
+
+    data = PropertySerializer([prop for prop, _ in ranked], many=True).data
+    for item, (_, score) in zip(data, ranked):
+        item['score'] = round(score, 4)
+    return Response({
+        "target_property": target_property.title,
+        "recommendations": data
+    }, status=status.HTTP_200_OK)
+
+TRENDING_DEFAULT_LIMIT = 10
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_trending_properties(request):
+    """
+    Most viewed/favorited listings over ?window=1h|24h|7d, as of the last merge.
+    """
+    from .trending import trending, WINDOWS, DEFAULT_WINDOW, CAPACITY
+
+    window = request.query_params.get('window', DEFAULT_WINDOW)
+    if window not in WINDOWS:
+        return Response({"error": f"window must be one of {', '.join(WINDOWS)}"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = int(request.query_params.get('limit', TRENDING_DEFAULT_LIMIT))
+    except ValueError:
+        return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+    top = trending.top(window, max(1, min(limit, CAPACITY)))
+    found = Property.objects.select_related('location_id').in_bulk([prop_id for prop_id, _ in top])
+    ranked = [(found[prop_id], score) for prop_id, score in top if prop_id in found]
+
+    data = PropertySerializer([prop for prop, _ in ranked], many=True).data
+    for item, (_, score) in zip(data, ranked):
+        item['score'] = round(score, 4)
+    return Response({
+        "window": window,
+        "as_of": trending.merged_at,
+        "results": data
+    }, status=status.HTTP_200_OK)
+
+ANALYTICS_MAX_IDS = 200
+
+
+@api_view(['GET'])
+@permission_classes([IsAgentOrAdmin])
+def get_property_analytics(request, prop_id):
+    from .analytics import view_analytics
+
+    if not Property.objects.filter(id=prop_id).exists():
+        return Response({"error": "Property not found"}, status=404)
+    return Response({"property_id": prop_id, **view_analytics.stats([prop_id])[prop_id]}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAgentOrAdmin])
+def get_properties_analytics(request):
+    """
+    ?ids=1,2,3 -> views and unique viewers for each listing.
+    """
+    from .analytics import view_analytics
+
+    try:
+        prop_ids = [int(item) for item in request.query_params.get('ids', '').split(',') if item.strip()]
+    except ValueError:
+        return Response({"error": "ids must be a comma separated list of integers"}, status=400)
+    if not prop_ids:
+        return Response({"error": "Please provide ids"}, status=400)
+    if len(prop_ids) > ANALYTICS_MAX_IDS:
+        return Response({"error": f"At most {ANALYTICS_MAX_IDS} ids per request"}, status=400)
+
+    existing = set(Property.objects.filter(id__in=prop_ids).values_list('id', flat=True))
+    stats = view_analytics.stats([prop_id for prop_id in prop_ids if prop_id in existing])
+    return Response([{"property_id": prop_id, **values} for prop_id, values in stats.items()], status=status.HTTP_200_OK)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_recent_list(request):
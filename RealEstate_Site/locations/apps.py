@@ -5,20 +5,23 @@ class LocationsConfig(AppConfig):
     name = 'locations'
 
     def ready(self):
-        from .models import Location,Facility,Connection
         from .graphs import graph
+        from .facility_table import nearest_facilities
+        from .spatial_index import waypoint_index
+        from .loader import load_graph
         
         import sys
+        import logging
         if 'runserver' in sys.argv:
-            locations = Location.objects.all()
-            connections = Connection.objects.all()
-            
-            for location in locations:
-                graph.add_location(location)
-            
-            for conn in connections:
-                graph.add_edge(conn.from_location.id, conn.to_location.id, conn.distance)
-                graph.add_edge(conn.to_location.id,conn.from_location.id, conn.distance)
+            load_graph(graph)
+
+            stats = graph.contract()
+            logging.getLogger(__name__).info(
+                "Road graph contracted: %(nodes)s -> %(reduced_nodes)s nodes, %(edges)s -> %(reduced_edges)s edges", stats
+            )
+
+            nearest_facilities.build(graph)
+            waypoint_index.load()
                 
             #facilities_locations = Location.objects.filter(location_type='facility')
             
@@ -0,0 +1,271 @@
+import time
+import logging
+import numpy as np
+from django.db import transaction
+from .models import Location, Facility, Connection, WayPoint
+from .utilis import haversine_pairwise
+
+logger = logging.getLogger(__name__)
+
+# Stays under SQLite's bound-parameter limit for id__in lookups
+ID_CHUNK_SIZE = 900
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def fetch_endpoints(location_ids):
+    """
+    One values_list query per ID_CHUNK_SIZE ids.
+    Format: {location_id: (name, latitude, longitude, location_type)}
+    """
+    endpoints = {}
+    for chunk in chunked(list(location_ids), ID_CHUNK_SIZE):
+        rows = Location.objects.filter(id__in=chunk).values_list('id', 'name', 'latitude', 'longitude', 'location_type')
+        for loc_id, name, lat, lng, location_type in rows:
+            endpoints[loc_id] = (name, lat, lng, location_type)
+    return endpoints
+
+
+def fetch_facility_metadata(location_ids):
+    """
+    First facility (by id) of each location, matching LocationGraph.add_location.
+    Format: {location_id: (name, type)}
+    """
+    metadata = {}
+    for chunk in chunked(list(location_ids), ID_CHUNK_SIZE):
+        rows = Facility.objects.filter(location_id__in=chunk).order_by('id').values_list('location_id', 'name', 'type')
+        for location_id, name, category in rows:
+            metadata.setdefault(location_id, (name, category))
+    return metadata
+
+
+def register_nodes(graph, endpoints):
+    """
+    Adds locations the graph has not seen yet, with one facility query for the whole batch.
+    """
+    from .coordinates import coordinate_registry
+
+    missing = [loc_id for loc_id in endpoints if loc_id not in graph.nodes_data]
+    facilities = fetch_facility_metadata(missing)
+
+    for loc_id in missing:
+        name, lat, lng, location_type = endpoints[loc_id]
+        facility_name, category = facilities.get(loc_id, (name, ""))
+        graph.add_node(loc_id, facility_name, location_type, category)
+        coordinate_registry.add(loc_id, lat, lng)
+
+
+def _parse_pair(item):
+    errors = {}
+    ids = []
+    for field in ('from_location', 'to_location'):
+        value = item.get(field) if isinstance(item, dict) else None
+        if value is None:
+            errors[field] = ["This field is required."]
+            continue
+        try:
+            ids.append(int(value))
+        except (TypeError, ValueError):
+            errors[field] = [f"Incorrect type. Expected pk value, received {type(value).__name__}."]
+    return ids, errors
+
+
+def existing_pairs(pairs):
+    """
+    The (from_id, to_id) pairs that already have a Connection row, one query per ID_CHUNK_SIZE origins.
+    """
+    wanted = set(pairs)
+    found = set()
+    for chunk in chunked(sorted({from_id for from_id, _ in wanted}), ID_CHUNK_SIZE):
+        rows = Connection.objects.filter(from_location_id__in=chunk).values_list('from_location_id', 'to_location_id')
+        found.update(pair for pair in rows if pair in wanted)
+    return found
+
+
+def ingest_connections(data):
+    """
+    Bulk road-network upload: validates every row, prefetches all endpoints,
+    computes distances in one vectorised call, inserts with bulk_create and
+    applies the new edges to the live graph in one batch.
+    created_count is the number of rows actually inserted, so pairs that another upload
+    inserted first are not counted (exact on SQLite, where the transaction holds the write lock).
+    Returns (created_count, errors).
+    """
+    from .graphs import graph
+    from .facility_table import nearest_facilities
+
+    errors = []
+    parsed = []
+    for item in data:
+        ids, item_errors = _parse_pair(item)
+        if item_errors:
+            errors.append({"data": item, "error": item_errors})
+        else:
+            parsed.append((ids[0], ids[1], item))
+
+    endpoints = fetch_endpoints({loc_id for pair in parsed for loc_id in pair[:2]})
+
+    pairs = []
+    seen = set()
+    for from_id, to_id, item in parsed:
+        item_errors = {}
+        for field, loc_id in (('from_location', from_id), ('to_location', to_id)):
+            if loc_id not in endpoints:
+                item_errors[field] = [f'Invalid pk "{loc_id}" - object does not exist.']
+        if item_errors:
+            errors.append({"data": item, "error": item_errors})
+        elif (from_id, to_id) not in seen:
+            seen.add((from_id, to_id))
+            pairs.append((from_id, to_id))
+
+    if not pairs:
+        return 0, errors
+
+    existing = existing_pairs(pairs)
+    new_pairs = [pair for pair in pairs if pair not in existing]
+    created_count = 0
+    if new_pairs:
+        from_rows = [endpoints[from_id] for from_id, _ in new_pairs]
+        to_rows = [endpoints[to_id] for _, to_id in new_pairs]
+        distances = haversine_pairwise(
+            np.radians([row[1] for row in from_rows]), np.radians([row[2] for row in from_rows]),
+            np.radians([row[1] for row in to_rows]), np.radians([row[2] for row in to_rows])
+        )
+
+        with transaction.atomic():
+            # ignore_conflicts silently skips pairs inserted since the check above, so count before and after
+            before = len(existing_pairs(new_pairs))
+            Connection.objects.bulk_create(
+                [
+                    Connection(from_location_id=from_id, to_location_id=to_id, distance=float(dist))
+                    for (from_id, to_id), dist in zip(new_pairs, distances)
+                ],
+                ignore_conflicts=True,
+                batch_size=500
+            )
+            created_count = len(existing_pairs(new_pairs)) - before
+
+        register_nodes(graph, endpoints)
+        added = graph.add_edges(
+            (from_id, to_id, float(dist)) for (from_id, to_id), dist in zip(new_pairs, distances)
+        )
+        nearest_facilities.edges_added(added)
+
+    return created_count, errors
+
+
+def _validate_rows(serializer_class, data, label):
+    """
+    Validates every row before anything is written; raises ValueError on the first bad row.
+    """
+    rows = []
+    for item in data:
+        serializer = serializer_class(data=item)
+        if not serializer.is_valid():
+            name = item.get(label) if isinstance(item, dict) else None
+            raise ValueError(f"Error in {name}: {serializer.errors}")
+        rows.append(serializer.validated_data)
+
+    ids = [row['id'] for row in rows]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Duplicate location ids in upload")
+    return rows
+
+
+def _chunk_stats(index, rows, seconds):
+    stats = {
+        "chunk": index,
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "rows_per_second": round(rows / seconds) if seconds > 0 else None
+    }
+    logger.info("bulk load chunk %(chunk)s: %(rows)s rows in %(seconds)ss (%(rows_per_second)s rows/s)", stats)
+    return stats
+
+
+def load_waypoints(data, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Inserts Location + WayPoint rows with one bulk_create per table per chunk,
+    then registers the nodes in the graph and the waypoint index.
+    Returns per-chunk throughput stats.
+    """
+    from .serializers import BulkWayPointSerializer
+    from .graphs import graph
+    from .coordinates import coordinate_registry
+    from .spatial_index import waypoint_index
+    from . import geo_rtree
+
+    rows = _validate_rows(BulkWayPointSerializer, data, 'name')
+    chunks = []
+
+    with transaction.atomic():
+        for index, chunk in enumerate(chunked(rows, chunk_size)):
+            started = time.perf_counter()
+            Location.objects.bulk_create([
+                Location(id=row['id'], name=row['name'], latitude=row['lat'], longitude=row['long'], location_type='way_point')
+                for row in chunk
+            ])
+            # bulk_create skips the Location save hooks, so the R*Tree is fed here
+            geo_rtree.upsert_many([(row['id'], row['lat'], row['long']) for row in chunk])
+            WayPoint.objects.bulk_create([
+                WayPoint(location_id=row['id'], node_type=row['waypoint_type'])
+                for row in chunk
+            ])
+            chunks.append(_chunk_stats(index, len(chunk), time.perf_counter() - started))
+
+    for row in rows:
+        graph.add_node(row['id'], row['name'], 'way_point')
+        coordinate_registry.add(row['id'], row['lat'], row['long'])
+        waypoint_index.insert(row['id'], row['lat'], row['long'])
+
+    return chunks
+
+
+def load_facilities(data, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Inserts Location + Facility rows with one bulk_create per table per chunk,
+    then registers the nodes in the graph, the nearest-facility table and the
+    feature-kNN facility counts without the per-node Facility query of add_location.
+    Returns per-chunk throughput stats.
+    """
+    from .serializers import BulkFacilitySerializer
+    from .graphs import graph
+    from .coordinates import coordinate_registry
+    from .facility_table import nearest_facilities
+    from .feature_knn import property_features
+    from . import geo_rtree
+
+    rows = _validate_rows(BulkFacilitySerializer, data, 'name')
+    chunks = []
+
+    with transaction.atomic():
+        for index, chunk in enumerate(chunked(rows, chunk_size)):
+            started = time.perf_counter()
+            Location.objects.bulk_create([
+                Location(id=row['id'], name=row['location_name'], latitude=row['latitude'], longitude=row['longitude'], location_type='facility')
+                for row in chunk
+            ])
+            geo_rtree.upsert_many([(row['id'], row['latitude'], row['longitude']) for row in chunk])
+            Facility.objects.bulk_create([
+                Facility(location_id=row['id'], name=row['name'], type=row['type'])
+                for row in chunk
+            ])
+            chunks.append(_chunk_stats(index, len(chunk), time.perf_counter() - started))
+
+    for row in rows:
+        graph.add_node(row['id'], row['name'], 'facility', row['type'])
+        coordinate_registry.add(row['id'], row['latitude'], row['longitude'])
+        nearest_facilities.add_facility(row['id'], row['name'], row['type'])
+
+    # Keyed by Facility id like the post_save receiver, so a later delete removes them
+    if property_features.loaded:
+        by_location = {row['id']: row for row in rows}
+        for facility_id, location_id in Facility.objects.filter(location_id__in=list(by_location)).values_list('id', 'location_id'):
+            row = by_location[location_id]
+            property_features.add_facility(facility_id, row['latitude'], row['longitude'], row['type'])
+
+    return chunks
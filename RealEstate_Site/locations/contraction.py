@@ -0,0 +1,327 @@
+from .priority_queues import make_priority_queue
+
+
+class ContractedGraph:
+    """
+    Road graph with chains of degree-2 way_point nodes folded into single weighted edges.
+    Searches run on the reduced graph; chain interiors are only expanded for the final path.
+    An instance is never changed once searches can see it: new edges are applied to a copy()
+    that LocationGraph then swaps in, and after mark_dirty() it builds a new one (see contracted_view).
+    Format:
+        adj: {kept_id: {neighbor_kept_id: (distance, chain_id or None)}}
+        chains: {chain_id: (start_id, end_id, [interior ids], [distance from start to each interior], total)}
+        members: {interior_id: (chain_id, index)}
+    """
+    def __init__(self, base_graph):
+        self.base = base_graph
+        self.adj = {}
+        self.links = {}
+        self.chains = {}
+        self.members = {}
+        self.next_chain_id = 0
+        self.dirty = False
+
+    # ----- building -----
+
+    def _contractible(self, node_id):
+        neighbors = self.base.adj_list.get(node_id, [])
+        return (
+            self.base.nodes_data.get(node_id, {}).get('type') == 'way_point'
+            and len(neighbors) == 2
+            and neighbors[0][0] != neighbors[1][0]
+            and node_id not in (neighbors[0][0], neighbors[1][0])
+        )
+
+    def build(self):
+        self.adj = {}
+        self.links = {}
+        self.chains = {}
+        self.members = {}
+        self.next_chain_id = 0
+
+        adj_list = self.base.adj_list
+        contractible = {node_id for node_id in adj_list if self._contractible(node_id)}
+        kept = [node_id for node_id in adj_list if node_id not in contractible]
+
+        for node_id in kept:
+            self.adj.setdefault(node_id, {})
+
+        for start_id in kept:
+            for first_id, weight in adj_list[start_id]:
+                if first_id not in contractible:
+                    if start_id != first_id:
+                        self._add_link(start_id, first_id, weight, None)
+                    continue
+
+                if first_id in self.members:
+                    continue
+
+                prev_id, curr_id, dist = start_id, first_id, weight
+                interior, offsets = [], []
+                while curr_id in contractible:
+                    interior.append(curr_id)
+                    offsets.append(dist)
+                    (a, wa), (b, wb) = adj_list[curr_id]
+                    next_id, step = (b, wb) if a == prev_id else (a, wa)
+                    prev_id, curr_id = curr_id, next_id
+                    dist += step
+
+                self._add_chain(start_id, curr_id, interior, offsets, dist)
+
+        # Rings made only of degree-2 waypoints never meet a kept node; keep them uncontracted
+        for node_id in contractible:
+            if node_id not in self.members:
+                self.adj.setdefault(node_id, {})
+        for node_id in contractible:
+            if node_id not in self.members:
+                for neighbor_id, weight in adj_list[node_id]:
+                    if neighbor_id not in self.members:
+                        self._add_link(node_id, neighbor_id, weight, None)
+
+        self.dirty = False
+
+    def _add_chain(self, start_id, end_id, interior, offsets, total):
+        chain_id = self.next_chain_id
+        self.next_chain_id += 1
+        self.chains[chain_id] = (start_id, end_id, interior, offsets, total)
+        for index, node_id in enumerate(interior):
+            self.members[node_id] = (chain_id, index)
+        if start_id != end_id:
+            self._add_link(start_id, end_id, total, chain_id)
+
+    def _add_link(self, loc_id1, loc_id2, distance, chain_id):
+        key = (loc_id1, loc_id2) if loc_id1 < loc_id2 else (loc_id2, loc_id1)
+        self.links.setdefault(key, {})[chain_id] = distance
+        self._refresh_pair(key)
+
+    def _remove_link(self, loc_id1, loc_id2, chain_id):
+        key = (loc_id1, loc_id2) if loc_id1 < loc_id2 else (loc_id2, loc_id1)
+        options = self.links.get(key, {})
+        options.pop(chain_id, None)
+        if not options:
+            self.links.pop(key, None)
+        self._refresh_pair(key)
+
+    def _refresh_pair(self, key):
+        """
+        The reduced adjacency keeps only the shortest of any parallel chains between two kept nodes.
+        """
+        loc_id1, loc_id2 = key
+        options = self.links.get(key)
+        if not options:
+            self.adj.get(loc_id1, {}).pop(loc_id2, None)
+            self.adj.get(loc_id2, {}).pop(loc_id1, None)
+            return
+
+        chain_id = min(options, key=options.get)
+        self.adj.setdefault(loc_id1, {})[loc_id2] = (options[chain_id], chain_id)
+        self.adj.setdefault(loc_id2, {})[loc_id1] = (options[chain_id], chain_id)
+
+    # ----- incremental maintenance -----
+
+    def copy(self):
+        """
+        Copy that edge_added() can change while searches keep reading this instance.
+        Chain tuples and their lists are never modified in place, so they are shared.
+        """
+        clone = ContractedGraph(self.base)
+        clone.adj = {node_id: dict(neighbors) for node_id, neighbors in self.adj.items()}
+        clone.links = {key: dict(options) for key, options in self.links.items()}
+        clone.chains = dict(self.chains)
+        clone.members = dict(self.members)
+        clone.next_chain_id = self.next_chain_id
+        clone.dirty = self.dirty
+        return clone
+
+    def _uncontract(self, node_id):
+        """
+        Splits the chain holding node_id in two, so node_id becomes a kept node.
+        """
+        chain_id, index = self.members.pop(node_id)
+        start_id, end_id, interior, offsets, total = self.chains.pop(chain_id)
+        if start_id != end_id:
+            self._remove_link(start_id, end_id, chain_id)
+
+        for member_id in interior:
+            self.members.pop(member_id, None)
+
+        self.adj.setdefault(node_id, {})
+        split = offsets[index]
+
+        left = interior[:index]
+        self._add_chain_or_link(start_id, node_id, left, offsets[:index], split)
+
+        right = interior[index + 1:]
+        self._add_chain_or_link(node_id, end_id, right, [offset - split for offset in offsets[index + 1:]], total - split)
+
+    def _add_chain_or_link(self, start_id, end_id, interior, offsets, total):
+        if interior:
+            self._add_chain(start_id, end_id, interior, offsets, total)
+        elif start_id != end_id:
+            self._add_link(start_id, end_id, total, None)
+
+    def edge_added(self, loc_id1, loc_id2, distance):
+        if self.dirty:
+            return
+        for node_id in (loc_id1, loc_id2):
+            if node_id in self.members:
+                self._uncontract(node_id)
+            self.adj.setdefault(node_id, {})
+        if loc_id1 != loc_id2:
+            self._add_link(loc_id1, loc_id2, distance, None)
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    # ----- queries -----
+
+    def _chain_path(self, chain_id, from_id):
+        start_id, end_id, interior, _, _ = self.chains[chain_id]
+        return interior if start_id == from_id else interior[::-1]
+
+    def _virtual_edges(self, node_id, outgoing):
+        """
+        Edges that attach a chain interior node to its two chain ends (and the chain
+        ends to it, when outgoing is False). Each is (from, to, distance, interior path).
+        """
+        chain_id, index = self.members[node_id]
+        start_id, end_id, interior, offsets, total = self.chains[chain_id]
+        to_start = (start_id, offsets[index], interior[:index][::-1])
+        to_end = (end_id, total - offsets[index], interior[index + 1:])
+
+        edges = []
+        for end, dist, path in (to_start, to_end):
+            if outgoing:
+                edges.append((node_id, end, dist, path))
+            else:
+                edges.append((end, node_id, dist, path[::-1]))
+        return edges
+
+    def _overlay(self, from_id, to_id=None):
+        overlay = {}
+        if from_id in self.members:
+            for u, v, dist, path in self._virtual_edges(from_id, True):
+                overlay.setdefault(u, []).append((v, dist, path))
+
+        if to_id is not None and to_id in self.members:
+            for u, v, dist, path in self._virtual_edges(to_id, False):
+                overlay.setdefault(u, []).append((v, dist, path))
+
+            if from_id in self.members and self.members[from_id][0] == self.members[to_id][0]:
+                chain_id, i = self.members[from_id]
+                _, j = self.members[to_id]
+                _, _, interior, offsets, _ = self.chains[chain_id]
+                path = interior[i + 1:j] if i < j else interior[j + 1:i][::-1]
+                overlay.setdefault(from_id, []).append((to_id, abs(offsets[j] - offsets[i]), path))
+        return overlay
+
+    def _neighbors(self, node_id, overlay):
+        for neighbor_id, (weight, chain_id) in self.adj.get(node_id, {}).items():
+            yield neighbor_id, weight, chain_id
+        for neighbor_id, weight, path in overlay.get(node_id, ()):
+            yield neighbor_id, weight, path
+
+    def shortest_path(self, from_id, to_id):
+        if from_id == to_id:
+            return {"distance": 0, "path": [from_id]}
+
+        overlay = self._overlay(from_id, to_id)
+        pq = make_priority_queue(self.base.queue_kind)
+        pq.push(from_id, 0)
+
+        distances = {from_id: 0}
+        parent = {from_id: None}
+        visited = set()
+
+        while not pq.is_empty():
+            curr_id, curr_dist = pq.pop()
+
+            if curr_dist > distances[curr_id] or curr_id in visited:
+                continue
+
+            if curr_id == to_id:
+                return {
+                    "distance": round(curr_dist, 2),
+                    "path": self._expand(parent, to_id)
+                }
+            visited.add(curr_id)
+
+            for neighbor_id, weight, via in self._neighbors(curr_id, overlay):
+                new_dist = curr_dist + weight
+
+                if new_dist < distances.get(neighbor_id, float('inf')):
+                    distances[neighbor_id] = new_dist
+                    parent[neighbor_id] = (curr_id, via)
+                    pq.push(neighbor_id, new_dist)
+
+        return {"distance": float("inf"), "path": []}
+
+    def _expand(self, parent, to_id):
+        reversed_path = [to_id]
+        curr_id = to_id
+        while parent[curr_id] is not None:
+            prev_id, via = parent[curr_id]
+            if isinstance(via, list):
+                reversed_path.extend(reversed(via))
+            elif via is not None:
+                reversed_path.extend(reversed(self._chain_path(via, prev_id)))
+            reversed_path.append(prev_id)
+            curr_id = prev_id
+        return reversed_path[::-1]
+
+    def bfs_nearby_facilities(self, start_id, max_distance, remaining=None):
+        """
+        Facilities within max_distance by shortest road distance, nearest first.
+        A hop-order BFS cannot be reproduced once chains are folded into single edges, so this is a
+        Dijkstra bounded by max_distance: it matches LocationGraph.dijkstra_distances on the full
+        graph, and finds every facility the plain BFS finds, at a distance no longer than the BFS reports.
+        """
+        overlay = self._overlay(start_id)
+        nodes_data = self.base.nodes_data
+
+        pq = make_priority_queue(self.base.queue_kind)
+        pq.push(start_id, 0)
+
+        distances = {start_id: 0}
+        visited = set()
+        found_facilities = []
+
+        while not pq.is_empty():
+            curr_id, current_total_dist = pq.pop()
+
+            if curr_id in visited or current_total_dist > distances[curr_id]:
+                continue
+
+            visited.add(curr_id)
+
+            if nodes_data[curr_id]['type'] == 'facility' and curr_id != start_id:
+                found_facilities.append({
+                    "location_id": curr_id,
+                    "name": nodes_data[curr_id]['name'],
+                    "distance": current_total_dist,
+                    "category": nodes_data[curr_id]['category']
+                })
+
+                if remaining is not None:
+                    remaining.discard(curr_id)
+                    if not remaining:
+                        break
+
+            for neighbor_id, weight, _ in self._neighbors(curr_id, overlay):
+                new_dist = current_total_dist + weight
+
+                if new_dist <= max_distance and new_dist < distances.get(neighbor_id, float('inf')):
+                    distances[neighbor_id] = new_dist
+                    pq.push(neighbor_id, new_dist)
+
+        return found_facilities
+
+    def stats(self):
+        return {
+            "nodes": len(self.base.adj_list),
+            "edges": sum(len(neighbors) for neighbors in self.base.adj_list.values()) // 2,
+            "reduced_nodes": len(self.adj),
+            "reduced_edges": sum(len(neighbors) for neighbors in self.adj.values()) // 2,
+            "chains": len(self.chains),
+            "contracted_nodes": len(self.members)
+        }
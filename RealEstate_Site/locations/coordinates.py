@@ -0,0 +1,110 @@
+import math
+import threading
+import numpy as np
+from .utilis import haversine_one_to_many
+
+
+class CoordinateRegistry:
+    """
+    In-memory node table of location coordinates.
+    Radians are computed once on insert so batch distance kernels never convert.
+    Signal and request threads both write to it, so every access to the arrays holds the lock.
+    Format: {location_id: row} over parallel arrays (lat, lng, lat_rad, lng_rad)
+    """
+    def __init__(self, capacity=1024):
+        self.index = {}
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.lat = np.zeros(capacity)
+        self.lng = np.zeros(capacity)
+        self.lat_rad = np.zeros(capacity)
+        self.lng_rad = np.zeros(capacity)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, location_id):
+        return location_id in self.index
+
+    def _grow(self, needed):
+        capacity = len(self.ids)
+        if needed <= capacity:
+            return
+
+        while capacity < needed:
+            capacity *= 2
+
+        for name in ('ids', 'lat', 'lng', 'lat_rad', 'lng_rad'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def add(self, location_id, lat, lng):
+        with self._lock:
+            row = self.index.get(location_id)
+            if row is None:
+                self._grow(self.count + 1)
+                row = self.count
+                self.ids[row] = location_id
+                self.count += 1
+                self.index[location_id] = row
+
+            self.lat[row] = lat
+            self.lng[row] = lng
+            self.lat_rad[row] = math.radians(lat)
+            self.lng_rad[row] = math.radians(lng)
+
+    def add_many(self, rows):
+        """
+        rows: iterable of (location_id, lat, lng)
+        """
+        for location_id, lat, lng in rows:
+            self.add(location_id, lat, lng)
+
+    def get(self, location_id):
+        with self._lock:
+            row = self.index.get(location_id)
+            if row is None:
+                return None
+            return float(self.lat[row]), float(self.lng[row])
+
+    def rows_for(self, location_ids):
+        """
+        Array rows for the given ids; ids that are not registered are skipped.
+        """
+        return np.fromiter(
+            (self.index[loc_id] for loc_id in location_ids if loc_id in self.index),
+            dtype=np.int64
+        )
+
+    def radians_for(self, location_ids):
+        with self._lock:
+            rows = self.rows_for(location_ids)
+            return self.lat_rad[rows], self.lng_rad[rows]
+
+    def within_radius(self, lat, lng, radius_km, location_ids=None):
+        """
+        Registered locations within radius_km of (lat, lng), nearest first.
+        Returns [(location_id, distance_km), ...]
+        """
+        # Fancy indexing copies, so the kernel runs on a snapshot outside the lock
+        with self._lock:
+            if location_ids is None:
+                rows = np.arange(self.count)
+            else:
+                rows = self.rows_for(location_ids)
+            ids, lat_rad, lng_rad = self.ids[rows], self.lat_rad[rows], self.lng_rad[rows]
+
+        if len(rows) == 0:
+            return []
+
+        dists = haversine_one_to_many(math.radians(lat), math.radians(lng), lat_rad, lng_rad)
+        inside = np.nonzero(dists <= radius_km)[0]
+        inside = inside[np.argsort(dists[inside], kind='stable')]
+
+        return [(int(ids[i]), float(dists[i])) for i in inside]
+
+
+coordinate_registry = CoordinateRegistry()
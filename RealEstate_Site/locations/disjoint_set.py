@@ -0,0 +1,87 @@
+class DisjointSet:
+    """
+    Union-find over location ids with union by size and path halving.
+    Each root also counts the facilities in its component, so a nearby search
+    can tell up front that there is nothing to find.
+    Format: parent {location_id: parent_id}, size {root_id: member_count}, facilities {root_id: facility_count},
+            facility_ids {location_id, ...} (the members counted in facilities)
+    """
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+        self.facilities = {}
+        self.facility_ids = set()
+        self.dirty = False
+
+    def __contains__(self, node_id):
+        return node_id in self.parent
+
+    def add(self, node_id, is_facility=False):
+        """
+        A node first seen through union() is counted as a facility once add() says it is one.
+        """
+        if node_id not in self.parent:
+            self.parent[node_id] = node_id
+            self.size[node_id] = 1
+            self.facilities[node_id] = 0
+        if is_facility and node_id not in self.facility_ids:
+            self.facility_ids.add(node_id)
+            self.facilities[self.find(node_id)] += 1
+
+    def find(self, node_id):
+        parent = self.parent
+        while parent[node_id] != node_id:
+            parent[node_id] = parent[parent[node_id]]
+            node_id = parent[node_id]
+        return node_id
+
+    def union(self, node_id1, node_id2):
+        self.add(node_id1)
+        self.add(node_id2)
+        root1, root2 = self.find(node_id1), self.find(node_id2)
+        if root1 == root2:
+            return root1
+
+        if self.size[root1] < self.size[root2]:
+            root1, root2 = root2, root1
+        self.parent[root2] = root1
+        self.size[root1] += self.size.pop(root2)
+        self.facilities[root1] += self.facilities.pop(root2)
+        return root1
+
+    def build(self, graph):
+        self.parent = {}
+        self.size = {}
+        self.facilities = {}
+        self.facility_ids = set()
+        nodes_data = graph.nodes_data
+
+        for node_id in graph.adj_list:
+            self.add(node_id, nodes_data.get(node_id, {}).get('type') == 'facility')
+        for node_id, neighbors in graph.adj_list.items():
+            for neighbor_id, _ in neighbors:
+                self.union(node_id, neighbor_id)
+        self.dirty = False
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    def connected(self, node_id1, node_id2):
+        if node_id1 not in self.parent or node_id2 not in self.parent:
+            return node_id1 == node_id2
+        return self.find(node_id1) == self.find(node_id2)
+
+    def component_id(self, node_id):
+        return self.find(node_id) if node_id in self.parent else None
+
+    def facility_count(self, node_id):
+        return self.facilities[self.find(node_id)] if node_id in self.parent else 0
+
+    def components(self):
+        """
+        Format: {root_id: [location_id, ...]}
+        """
+        members = {}
+        for node_id in self.parent:
+            members.setdefault(self.find(node_id), []).append(node_id)
+        return members
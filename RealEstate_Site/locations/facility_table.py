@@ -0,0 +1,146 @@
+import threading
+from .models import Facility
+from .priority_queues import make_priority_queue
+
+
+class NearestFacilityTable:
+    """
+    Nearest facility of every category for every graph node.
+    Built with one multi-source Dijkstra per Facility.FACILITY_TYPES value.
+    Writers hold a lock; rebuilds fill a new dict and swap it in, so readers never see a partial category.
+    Format: {category: {location_id: (facility_location_id, distance)}}
+    """
+    def __init__(self):
+        self.labels = {category: {} for category, _ in Facility.FACILITY_TYPES}
+        self.sources = {category: set() for category, _ in Facility.FACILITY_TYPES}
+        self.facility_names = {}
+        self.stale_categories = set()
+        self.graph = None
+        self.built = False
+        self._lock = threading.RLock()
+
+    def build(self, graph):
+        sources = {category: set() for category, _ in Facility.FACILITY_TYPES}
+        facility_names = {}
+
+        for location_id, name, category in Facility.objects.values_list('location_id', 'name', 'type'):
+            if category in sources:
+                sources[category].add(location_id)
+                facility_names.setdefault(location_id, name)
+
+        with self._lock:
+            self.graph = graph
+            self.sources = sources
+            self.facility_names = facility_names
+            for category in self.labels:
+                self._rebuild_category(category)
+
+            self.stale_categories.clear()
+            self.built = True
+
+    def _rebuild_category(self, category):
+        labels = {}
+        seeds = [(loc_id, loc_id, 0) for loc_id in self.sources[category]]
+        self._propagate(labels, seeds)
+        self.labels[category] = labels
+
+    def _propagate(self, labels, seeds):
+        """
+        Dijkstra that only overwrites a label when it finds a strictly shorter distance,
+        so the same routine serves the full build and every incremental update.
+        """
+        pq = make_priority_queue()
+
+        for node_id, facility_id, dist in seeds:
+            current = labels.get(node_id)
+            if current is None or dist < current[1]:
+                labels[node_id] = (facility_id, dist)
+                pq.push(node_id, dist)
+
+        while not pq.is_empty():
+            curr_id, curr_dist = pq.pop()
+            facility_id, best_dist = labels[curr_id]
+
+            if curr_dist > best_dist:
+                continue
+
+            for neighbor_id, weight in self.graph.adj_list.get(curr_id, []):
+                new_dist = curr_dist + weight
+                current = labels.get(neighbor_id)
+
+                if current is None or new_dist < current[1]:
+                    labels[neighbor_id] = (facility_id, new_dist)
+                    pq.push(neighbor_id, new_dist)
+
+    def add_facility(self, location_id, name, category):
+        if not self.built or category not in self.sources:
+            return
+
+        with self._lock:
+            self.sources[category].add(location_id)
+            self.facility_names.setdefault(location_id, name)
+            self._propagate(self.labels[category], [(location_id, location_id, 0)])
+
+    def remove_facility(self, location_id, category, still_present=False):
+        if not self.built or category not in self.sources or still_present:
+            return
+
+        with self._lock:
+            self.sources[category].discard(location_id)
+            self.stale_categories.add(category)
+
+    def edges_added(self, edges):
+        """
+        Adding a road can only shorten distances, so relaxing the new edges
+        from their already-labelled endpoints is enough to stay exact.
+        """
+        if not self.built:
+            return
+
+        with self._lock:
+            for labels in self.labels.values():
+                seeds = []
+                for loc_id1, loc_id2, distance in edges:
+                    if loc_id1 in labels:
+                        facility_id, dist = labels[loc_id1]
+                        seeds.append((loc_id2, facility_id, dist + distance))
+                    if loc_id2 in labels:
+                        facility_id, dist = labels[loc_id2]
+                        seeds.append((loc_id1, facility_id, dist + distance))
+                if seeds:
+                    self._propagate(labels, seeds)
+
+    def edges_removed(self):
+        if self.built:
+            with self._lock:
+                self.stale_categories.update(self.labels.keys())
+
+    def _refresh_stale(self):
+        # Concurrent readers wait here for the first one's rebuild instead of reading a half-built table
+        with self._lock:
+            while self.stale_categories:
+                self._rebuild_category(self.stale_categories.pop())
+
+    def nearest_for(self, location_id):
+        if not self.built:
+            return {}
+
+        if self.stale_categories:
+            self._refresh_stale()
+
+        nearest = {}
+        for category, labels in self.labels.items():
+            label = labels.get(location_id)
+            if label is None:
+                continue
+
+            facility_id, dist = label
+            nearest[category] = {
+                "location_id": facility_id,
+                "name": self.facility_names.get(facility_id, ""),
+                "distance": round(dist, 2)
+            }
+        return nearest
+
+
+nearest_facilities = NearestFacilityTable()
@@ -0,0 +1,339 @@
+import math
+import numpy as np
+from .models import Facility
+from .spatial_index import GridIndex
+
+# Facilities of each category within this radius of a property are counted as features
+FACILITY_RADIUS_KM = 2.0
+FACILITY_CATEGORIES = [category for category, _ in Facility.FACILITY_TYPES]
+
+# Weight of each feature after standardisation; order is the column order of the matrix
+FEATURE_WEIGHTS = {
+    'price': 2.0,
+    'size': 2.0,
+    'bedrooms': 1.0,
+    'bathrooms': 1.0,
+    'floors': 0.5,
+    'lat': 1.5,
+    'lng': 1.5,
+    **{f'near_{category}': 0.5 for category in FACILITY_CATEGORIES},
+}
+FEATURES = list(FEATURE_WEIGHTS)
+METRICS = ('cosine', 'euclidean')
+
+# Below this many rows a full scan is already sub-millisecond; above it single queries go through IVF
+IVF_MIN_ROWS = 20_000
+IVF_NPROBE = 16
+# Upper bound on the (queries x rows) score block computed at once by a batched scan
+SCAN_BLOCK = 4_000_000
+
+
+def raw_features(price, size, bedrooms, bathrooms, floors, lat, lng, facility_counts):
+    """
+    One unscaled feature row. Price, size and facility counts are log-scaled so
+    that relative differences matter more than absolute ones.
+    """
+    return [
+        math.log1p(float(price)), math.log1p(size), bedrooms, bathrooms, floors, lat, lng,
+        *(math.log1p(count) for count in facility_counts)
+    ]
+
+
+def _squared_distances(queries, matrix, matrix_sq_norms):
+    """
+    (len(queries), len(matrix)) squared Euclidean distances via |q|^2 - 2 q.v + |v|^2.
+    """
+    query_sq_norms = np.einsum('ij,ij->i', queries, queries)[:, None]
+    dists = query_sq_norms - 2.0 * (queries @ matrix.T) + matrix_sq_norms[None, :]
+    return np.maximum(dists, 0.0, out=dists)
+
+
+class IVFIndex:
+    """
+    Inverted file: k-means centroids over the matrix, and for every centroid the rows closest to it.
+    A query is only compared with the rows of its nprobe closest centroids.
+    Format: lists[centroid] = np.ndarray of row numbers, extra[centroid] = rows added since the build
+    """
+    def __init__(self, n_lists, iterations=10, seed=0):
+        self.n_lists = n_lists
+        self.iterations = iterations
+        self.rng = np.random.default_rng(seed)
+        self.centroids = None
+        self.centroid_sq_norms = None
+        self.lists = []
+        self.extra = []
+
+    def _nearest_centroids(self, vectors):
+        labels = np.empty(len(vectors), dtype=np.int64)
+        step = max(1, SCAN_BLOCK // self.n_lists)
+        for first in range(0, len(vectors), step):
+            block = vectors[first:first + step]
+            labels[first:first + step] = np.argmin(
+                _squared_distances(block, self.centroids, self.centroid_sq_norms), axis=1
+            )
+        return labels
+
+    def build(self, matrix, rows):
+        """
+        Trains the centroids on a sample of matrix[rows], then files every row under its nearest one.
+        """
+        vectors = matrix[rows]
+        sample_size = min(len(rows), 64 * self.n_lists)
+        sample = vectors[self.rng.choice(len(rows), sample_size, replace=False)]
+
+        self.centroids = sample[self.rng.choice(sample_size, self.n_lists, replace=False)].copy()
+        for _ in range(self.iterations):
+            self.centroid_sq_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+            labels = self._nearest_centroids(sample)
+            counts = np.bincount(labels, minlength=self.n_lists)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, sample)
+            # A centroid that lost every point keeps its previous position
+            filled = counts > 0
+            self.centroids[filled] = sums[filled] / counts[filled, None]
+        self.centroid_sq_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+
+        labels = self._nearest_centroids(vectors)
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(self.n_lists + 1))
+        self.lists = [rows[order[bounds[i]:bounds[i + 1]]] for i in range(self.n_lists)]
+        self.extra = [[] for _ in range(self.n_lists)]
+
+    def add(self, row, vector):
+        label = int(self._nearest_centroids(vector[None, :])[0])
+        self.extra[label].append(row)
+
+    def candidates(self, vector, nprobe):
+        dists = _squared_distances(vector[None, :], self.centroids, self.centroid_sq_norms)[0]
+        nprobe = min(nprobe, self.n_lists)
+        probed = np.argpartition(dists, nprobe - 1)[:nprobe]
+
+        parts = [self.lists[i] for i in probed]
+        parts.extend(np.asarray(self.extra[i], dtype=np.int64) for i in probed if self.extra[i])
+        return np.concatenate(parts)
+
+
+class PropertyFeatureIndex:
+    """
+    Every property as a standardised, weighted feature vector in one NumPy matrix,
+    for "similar to X" queries by cosine or Euclidean distance.
+    Inserts append a row and removals tombstone one; the matrix is compacted once half of it is dead.
+    Scaling (mean/std per feature) is fixed at load time.
+    Format: ids[row] = property_id, rows {property_id: row}
+    """
+    def __init__(self):
+        self.mean = None
+        self.scale = None
+        self.weights = np.array([FEATURE_WEIGHTS[name] for name in FEATURES], dtype=np.float64)
+        self._reset(0)
+        self.facilities = GridIndex(cell_size_deg=0.02)
+        self.facility_types = {}
+        self.loaded = False
+
+    def _reset(self, capacity):
+        dims = len(FEATURES)
+        self.vectors = np.zeros((capacity, dims), dtype=np.float32)
+        # Unit-length copies for cosine, and squared norms for Euclidean
+        self.unit = np.zeros((capacity, dims), dtype=np.float32)
+        self.sq_norms = np.zeros(capacity, dtype=np.float32)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.size = 0
+        self.dead = 0
+        self.rows = {}
+        # {metric: IVFIndex}, built on first use once the catalogue is large enough
+        self.ivf = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def load(self):
+        from listing.models import Property
+
+        self.facilities = GridIndex(cell_size_deg=0.02)
+        self.facility_types = {}
+        for facility_id, lat, lng, category in Facility.objects.values_list(
+            'id', 'location__latitude', 'location__longitude', 'type'
+        ):
+            self.add_facility(facility_id, lat, lng, category)
+
+        ids, raw = [], []
+        rows = Property.objects.values_list(
+            'id', 'price', 'size', 'bedrooms', 'bathrooms', 'floors',
+            'location_id__latitude', 'location_id__longitude'
+        )
+        for prop_id, price, size, bedrooms, bathrooms, floors, lat, lng in rows.iterator(chunk_size=5000):
+            ids.append(prop_id)
+            raw.append(raw_features(price, size, bedrooms, bathrooms, floors, lat, lng, self.facility_counts(lat, lng)))
+
+        self.build(ids, np.array(raw, dtype=np.float64).reshape(len(ids), len(FEATURES)))
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def build(self, ids, raw):
+        """
+        ids: property ids, raw: (len(ids), len(FEATURES)) matrix of raw_features rows.
+        """
+        if len(ids):
+            self.mean = raw.mean(axis=0)
+            std = raw.std(axis=0)
+            self.scale = np.where(std > 0, std, 1.0)
+        else:
+            self.mean = np.zeros(len(FEATURES))
+            self.scale = np.ones(len(FEATURES))
+
+        self._reset(max(len(ids), 16))
+        self._store(np.arange(len(ids)), np.asarray(ids, dtype=np.int64), self._normalise(raw))
+        self.size = len(ids)
+        self.rows = {int(prop_id): row for row, prop_id in enumerate(ids)}
+        self.loaded = True
+
+    def _normalise(self, raw):
+        return ((np.asarray(raw, dtype=np.float64) - self.mean) / self.scale * self.weights).astype(np.float32)
+
+    def _store(self, rows, ids, vectors):
+        norms = np.sqrt(np.einsum('ij,ij->i', vectors, vectors))
+        self.vectors[rows] = vectors
+        self.unit[rows] = vectors / np.where(norms > 0, norms, 1.0)[:, None]
+        self.sq_norms[rows] = norms ** 2
+        self.ids[rows] = ids
+        self.alive[rows] = True
+
+    def add_facility(self, facility_id, lat, lng, category):
+        self.facilities.insert(facility_id, lat, lng)
+        self.facility_types[facility_id] = category
+
+    def remove_facility(self, facility_id):
+        self.facility_types.pop(facility_id, None)
+        self.facilities.remove(facility_id)
+
+    def facility_counts(self, lat, lng):
+        counts = dict.fromkeys(FACILITY_CATEGORIES, 0)
+        for facility_id, _ in self.facilities.within_radius(lat, lng, FACILITY_RADIUS_KM):
+            category = self.facility_types[facility_id]
+            if category in counts:
+                counts[category] += 1
+        return [counts[category] for category in FACILITY_CATEGORIES]
+
+    def upsert_property(self, property_obj):
+        # Before the first load the DB is the source of truth, so there is nothing to keep current
+        if not self.loaded:
+            return
+        location = property_obj.location_id
+        raw = raw_features(
+            property_obj.price, property_obj.size, property_obj.bedrooms, property_obj.bathrooms,
+            property_obj.floors, location.latitude, location.longitude,
+            self.facility_counts(location.latitude, location.longitude)
+        )
+        self.insert(property_obj.id, raw)
+
+    def insert(self, prop_id, raw):
+        self.remove_property(prop_id)
+
+        if self.size == len(self.ids):
+            self._grow()
+        row = self.size
+        self.size += 1
+        self._store(np.array([row]), np.array([prop_id]), self._normalise([raw]))
+        self.rows[prop_id] = row
+
+        for metric, ivf in self.ivf.items():
+            ivf.add(row, self._space(metric)[row])
+
+    def _grow(self):
+        capacity = max(16, 2 * len(self.ids))
+        for name in ('vectors', 'unit', 'sq_norms', 'ids', 'alive'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def remove_property(self, prop_id):
+        row = self.rows.pop(prop_id, None)
+        if row is None:
+            return False
+        self.alive[row] = False
+        self.dead += 1
+        if self.dead > self.size // 2:
+            self._compact()
+        return True
+
+    def _compact(self):
+        live = np.nonzero(self.alive[:self.size])[0]
+        vectors, ids = self.vectors[live], self.ids[live]
+        self._reset(max(len(live), 16))
+        self._store(np.arange(len(live)), ids, vectors)
+        self.size = len(live)
+        self.rows = {int(prop_id): row for row, prop_id in enumerate(ids)}
+
+    def _space(self, metric):
+        return self.unit if metric == 'cosine' else self.vectors
+
+    def _ivf(self, metric):
+        ivf = self.ivf.get(metric)
+        if ivf is None:
+            live = np.nonzero(self.alive[:self.size])[0]
+            ivf = self.ivf[metric] = IVFIndex(max(1, int(math.sqrt(len(live)))))
+            ivf.build(self._space(metric), live)
+        return ivf
+
+    def _distances(self, queries, rows, metric):
+        """
+        (len(queries), len(rows)) distances: 1 - cosine similarity, or Euclidean.
+        """
+        if metric == 'cosine':
+            return 1.0 - queries @ self.unit[rows].T
+        return np.sqrt(_squared_distances(queries, self.vectors[rows], self.sq_norms[rows]))
+
+    def _top_k(self, distances, rows, k):
+        k = min(k, len(rows))
+        if k <= 0:
+            return []
+        best = np.argpartition(distances, k - 1)[:k]
+        best = best[np.argsort(distances[best], kind='stable')]
+        return [(int(self.ids[rows[i]]), float(distances[i])) for i in best if np.isfinite(distances[i])]
+
+    def similar_batch(self, prop_ids, k, metric='cosine', exact=None, nprobe=IVF_NPROBE):
+        """
+        k most similar properties for each of prop_ids, closest first.
+        exact=None scans everything below IVF_MIN_ROWS and probes the IVF index above it.
+        Returns [[(property_id, distance), ...], ...]; an unknown id gets [].
+        """
+        self.ensure_loaded()
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {', '.join(METRICS)}")
+        if exact is None:
+            exact = len(self.rows) < IVF_MIN_ROWS
+
+        space = self._space(metric)
+        known = [(i, self.rows[prop_id]) for i, prop_id in enumerate(prop_ids) if prop_id in self.rows]
+        results = [[] for _ in prop_ids]
+
+        if not exact:
+            ivf = self._ivf(metric)
+            for i, row in known:
+                rows = ivf.candidates(space[row], nprobe)
+                rows = rows[self.alive[rows] & (rows != row)]
+                results[i] = self._top_k(self._distances(space[row][None, :], rows, metric)[0], rows, k)
+            return results
+
+        # One matrix product per block of queries over every row
+        all_rows = np.arange(self.size)
+        step = max(1, SCAN_BLOCK // max(self.size, 1))
+        for first in range(0, len(known), step):
+            block = known[first:first + step]
+            query_rows = np.array([row for _, row in block])
+            distances = self._distances(space[query_rows], all_rows, metric)
+            distances[:, ~self.alive[:self.size]] = np.inf
+            distances[np.arange(len(block)), query_rows] = np.inf
+            for (i, _), row_distances in zip(block, distances):
+                results[i] = self._top_k(row_distances, all_rows, k)
+        return results
+
+    def similar(self, prop_id, k, metric='cosine', exact=None):
+        return self.similar_batch([prop_id], k, metric, exact)[0]
+
+
+property_features = PropertyFeatureIndex()
@@ -0,0 +1,150 @@
+import math
+from django.db import connection
+from .utilis import EARTH_RADIUS_KM
+
+RTREE_TABLE = 'locations_location_rtree'
+
+_available = False
+
+
+def available():
+    """
+    True once the R*Tree table exists (SQLite with migration 0007 applied).
+    """
+    global _available
+    if not _available and connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [RTREE_TABLE])
+            _available = cursor.fetchone() is not None
+    return _available
+
+
+def upsert(location_id, lat, lng):
+    upsert_many([(location_id, lat, lng)])
+
+
+def upsert_many(rows):
+    """
+    rows: [(location_id, lat, lng), ...]
+    """
+    if not rows or not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO {RTREE_TABLE} (id, min_lat, max_lat, min_lng, max_lng) VALUES (%s, %s, %s, %s, %s)",
+            [(loc_id, lat, lat, lng, lng) for loc_id, lat, lng in rows]
+        )
+
+
+def delete(location_id):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {RTREE_TABLE} WHERE id = %s", [location_id])
+
+
+def bbox_around(lat, lng, radius_km):
+    """
+    (south, west, north, east) enclosing every point within radius_km; west > east when it wraps.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    lat_span = math.degrees(angle)
+    south, north = max(lat - lat_span, -90.0), min(lat + lat_span, 90.0)
+
+    ratio = math.sin(angle) / max(math.cos(math.radians(lat)), 1e-12)
+    if angle >= math.pi / 2 or ratio >= 1 or south == -90.0 or north == 90.0:
+        return south, -180.0, north, 180.0
+
+    lng_span = math.degrees(math.asin(ratio))
+    west = (lng - lng_span + 180.0) % 360.0 - 180.0
+    east = (lng + lng_span + 180.0) % 360.0 - 180.0
+    return south, west, north, east
+
+
+def _bbox_clause(south, west, north, east):
+    """
+    R*Tree boxes are float32 rounded outwards, so the index is probed for overlap
+    and the exact bounds are checked on the real columns.
+    """
+    if west > east:
+        return (
+            "r.max_lat >= %s AND r.min_lat <= %s AND (r.max_lng >= %s OR r.min_lng <= %s) "
+            "AND l.latitude BETWEEN %s AND %s AND (l.longitude >= %s OR l.longitude <= %s)",
+            [south, north, west, east, south, north, west, east]
+        )
+    return (
+        "r.max_lat >= %s AND r.min_lat <= %s AND r.max_lng >= %s AND r.min_lng <= %s "
+        "AND l.latitude BETWEEN %s AND %s AND l.longitude BETWEEN %s AND %s",
+        [south, north, west, east, south, north, west, east]
+    )
+
+
+def locations_in_bbox(south, west, north, east, location_type=None):
+    """
+    Returns [(location_id, lat, lng), ...] answered from the R*Tree.
+    """
+    clause, params = _bbox_clause(south, west, north, east)
+    sql = (
+        f"SELECT l.id, l.latitude, l.longitude FROM {RTREE_TABLE} r "
+        f"JOIN locations_location l ON l.id = r.id WHERE {clause}"
+    )
+    if location_type is not None:
+        sql += " AND l.location_type = %s"
+        params.append(location_type)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def within_radius(lat, lng, radius_km, location_type=None):
+    """
+    Indexed bbox prefilter, then the exact haversine cut through the coordinate registry's
+    vectorised kernel; candidates it has not seen yet are registered first.
+    Returns [(location_id, distance_km), ...] nearest first.
+    """
+    from .coordinates import coordinate_registry
+
+    candidates = locations_in_bbox(*bbox_around(lat, lng, radius_km), location_type=location_type)
+    coordinate_registry.add_many(row for row in candidates if row[0] not in coordinate_registry)
+    return coordinate_registry.within_radius(lat, lng, radius_km, [loc_id for loc_id, _, _ in candidates])
+
+
+def nearest(lat, lng, location_type=None, start_km=0.5, max_km=EARTH_RADIUS_KM * math.pi):
+    """
+    Nearest location by haversine, growing the search box until a hit is confirmed.
+    Returns (location_id, distance_km) or None.
+    """
+    radius = start_km
+    while True:
+        found = within_radius(lat, lng, radius, location_type)
+        if found:
+            return found[0]
+        if radius >= max_km:
+            return None
+        radius = min(radius * 4, max_km)
+
+
+def properties_in_bbox(south, west, north, east, min_price=None, max_price=None, min_size=None, max_size=None):
+    """
+    Same result as PropertyGeoIndex.search, straight from the DB.
+    Returns [(property_id, lat, lng, price), ...] ordered by id.
+    """
+    clause, params = _bbox_clause(south, west, north, east)
+    for column, op, value in (
+        ('p.price', '>=', min_price), ('p.price', '<=', max_price),
+        ('p.size', '>=', min_size), ('p.size', '<=', max_size),
+    ):
+        if value is not None:
+            clause += f" AND {column} {op} %s"
+            params.append(value)
+
+    sql = (
+        f"SELECT p.id, l.latitude, l.longitude, p.price FROM {RTREE_TABLE} r "
+        f"JOIN locations_location l ON l.id = r.id "
+        f"JOIN listing_property p ON p.location_id_id = l.id "
+        f"WHERE {clause} ORDER BY p.id"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(prop_id, lat, lng, float(price)) for prop_id, lat, lng, price in cursor.fetchall()]
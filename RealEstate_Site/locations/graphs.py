@@ -1,9 +1,15 @@
+import threading
 from typing import Optional
+from bisect import bisect_left, bisect_right, insort
+from math import inf
 from .models import Location, Facility, Connection
 from .queues import Queue
-from .priority_queues import PriorityQueue
+from .priority_queues import make_priority_queue
 from listing.models import Property
 from .utilis import calculate_haversine
+from .coordinates import coordinate_registry
+from .contraction import ContractedGraph
+from .disjoint_set import DisjointSet
 
 
 class LocationGraph:
@@ -14,31 +20,162 @@ class LocationGraph:
     def __init__(self):
         self.adj_list = {}
         self.nodes_data = {}
+        # Bumped on every edge change so caches derived from the graph can tell they are stale
+        self.version = 0
+        # Reduced view with degree-2 waypoint chains folded away; built by contract()
+        self.contracted = None
+        # Road-network components, so unreachable pairs are rejected without a search
+        self.components = DisjointSet()
+        # Priority queue used by the searches; None means priority_queues.DEFAULT_PRIORITY_QUEUE
+        self.queue_kind = None
+        # Held by edge writers and contracted rebuilds, so a rebuild never reads a half-applied change
+        self._lock = threading.RLock()
            
     def add_location(self, location_obj):
-        if location_obj.id not in self.adj_list:
+        if location_obj.id not in self.nodes_data:
             facility_record = Facility.objects.filter(location=location_obj).first()
             category = facility_record.type if facility_record else ""
             display_name = facility_record.name if facility_record else location_obj.name
 
-            self.adj_list[location_obj.id] = []
-            self.nodes_data[location_obj.id] = {
-                "name": display_name,
-                "type": location_obj.location_type,
+            self.add_node(location_obj.id, display_name, location_obj.location_type, category)
+        coordinate_registry.add(location_obj.id, location_obj.latitude, location_obj.longitude)
+
+    def add_node(self, location_id, name, location_type, category=""):
+        with self._lock:
+            self.adj_list.setdefault(location_id, [])
+            self.nodes_data[location_id] = {
+                "name": name,
+                "type": location_type,
                 "category": category
             }
+            self.components.add(location_id, location_type == 'facility')
         
     def add_edge(self, loc_id1, loc_id2, distance):
-        if loc_id1 not in self.adj_list: self.adj_list[loc_id1] = []
-        if loc_id2 not in self.adj_list: self.adj_list[loc_id2] = []
+        with self._lock:
+            if loc_id1 not in self.adj_list: self.adj_list[loc_id1] = []
+            if loc_id2 not in self.adj_list: self.adj_list[loc_id2] = []
 
-        if not any(neighbor[0] == loc_id2 for neighbor in self.adj_list[loc_id1]):
-            self.adj_list[loc_id1].append((loc_id2, distance))
-            
-        if not any(neighbor[0] == loc_id1 for neighbor in self.adj_list[loc_id2]):
-            self.adj_list[loc_id2].append((loc_id1, distance))
+            version = self.version
+            if not any(neighbor[0] == loc_id2 for neighbor in self.adj_list[loc_id1]):
+                self.adj_list[loc_id1].append((loc_id2, distance))
+                self.version += 1
+                
+            if not any(neighbor[0] == loc_id1 for neighbor in self.adj_list[loc_id2]):
+                self.adj_list[loc_id2].append((loc_id1, distance))
+                self.version += 1
+
+            if self.version != version:
+                self.components.union(loc_id1, loc_id2)
+                self._contracted_edges_added([(loc_id1, loc_id2, distance)])
+
+    def add_edges(self, edges):
+        """
+        Batch insert of (loc_id1, loc_id2, distance) triples; returns the edges that were new.
+        """
+        added = []
+        with self._lock:
+            for loc_id1, loc_id2, distance in edges:
+                neighbors1 = self.adj_list.setdefault(loc_id1, [])
+                neighbors2 = self.adj_list.setdefault(loc_id2, [])
+
+                if any(neighbor[0] == loc_id2 for neighbor in neighbors1):
+                    continue
+
+                neighbors1.append((loc_id2, distance))
+                if not any(neighbor[0] == loc_id1 for neighbor in neighbors2):
+                    neighbors2.append((loc_id1, distance))
+                self.components.union(loc_id1, loc_id2)
+                added.append((loc_id1, loc_id2, distance))
+
+            if added:
+                self.version += 1
+                self._contracted_edges_added(added)
+        return added
+
+    def _contracted_edges_added(self, edges):
+        """
+        Applies new edges to a copy of the contracted graph and swaps it in;
+        searches iterate the live one without the lock. Called with the lock held.
+        """
+        if self.contracted is None or self.contracted.dirty:
+            return
+        contracted = self.contracted.copy()
+        for loc_id1, loc_id2, distance in edges:
+            contracted.edge_added(loc_id1, loc_id2, distance)
+        self.contracted = contracted
+
+    def remove_edge(self, loc_id1, loc_id2):
+        with self._lock:
+            if loc_id1 in self.adj_list:
+                self.adj_list[loc_id1] = [n for n in self.adj_list[loc_id1] if n[0] != loc_id2]
+            if loc_id2 in self.adj_list:
+                self.adj_list[loc_id2] = [n for n in self.adj_list[loc_id2] if n[0] != loc_id1]
+            self.version += 1
+            # Removals can merge chains again or split a component; rare enough to simply rebuild on next use
+            self.components.mark_dirty()
+            if self.contracted is not None:
+                self.contracted.mark_dirty()
+
+    def reachable(self, from_id, to_id):
+        """
+        O(1) check that two locations are in the same road-network component.
+        """
+        if self.components.dirty:
+            self.components.build(self)
+        return self.components.connected(from_id, to_id)
+
+    def has_reachable_facility(self, start_id):
+        if self.components.dirty:
+            self.components.build(self)
+        own = 1 if self.nodes_data.get(start_id, {}).get('type') == 'facility' else 0
+        return self.components.facility_count(start_id) > own
+
+    def contract(self):
+        """
+        Builds the reduced graph that shortest-path and nearby-facility searches run on.
+        Returns its size stats.
+        """
+        with self._lock:
+            contracted = ContractedGraph(self)
+            contracted.build()
+            self.contracted = contracted
+        return contracted.stats()
+
+    def contracted_view(self):
+        """
+        The contracted graph searches should run on, or None before contract().
+        A stale one is replaced by a freshly built instance under the lock; searches that
+        already hold the old instance finish on it, later ones wait for the new one.
+        """
+        contracted = self.contracted
+        if contracted is None or not contracted.dirty:
+            return contracted
+
+        with self._lock:
+            if self.contracted.dirty:
+                fresh = ContractedGraph(self)
+                fresh.build()
+                self.contracted = fresh
+            return self.contracted
             
-    def bfs_nearby_facilities(self, start_id, max_distance):
+    def bfs_nearby_facilities(self, start_id, max_distance, candidates=None):
+        """
+        candidates, when given, is every facility that could possibly be within reach;
+        the search ends as soon as all of them have been visited.
+        Once contract() has run this is answered by ContractedGraph.bfs_nearby_facilities,
+        which reports shortest road distances rather than the first path in hop order.
+        """
+        remaining = set(candidates) - {start_id} if candidates is not None else None
+        if remaining is not None and not remaining:
+            return []
+
+        if start_id in self.nodes_data and not self.has_reachable_facility(start_id):
+            return []
+
+        contracted = self.contracted_view()
+        if contracted is not None:
+            return contracted.bfs_nearby_facilities(start_id, max_distance, remaining)
+
         q = Queue() 
         q.enqueue((start_id, 0))
         
@@ -61,6 +198,11 @@ class LocationGraph:
                     "category" : self.nodes_data[curr_id]['category']
                 })
 
+                if remaining is not None:
+                    remaining.discard(curr_id)
+                    if not remaining:
+                        break
+
             for neighbor_id, weight in self.adj_list.get(curr_id, []):
                 new_dist = current_total_dist + weight
                 
@@ -71,7 +213,14 @@ class LocationGraph:
     
     
     def dijkstra_shortest_path(self, from_id, to_id):
-        pq = PriorityQueue()
+        if not self.reachable(from_id, to_id):
+            return {"distance": float("inf"), "path": []}
+
+        contracted = self.contracted_view()
+        if contracted is not None:
+            return contracted.shortest_path(from_id, to_id)
+
+        pq = make_priority_queue(self.queue_kind)
         pq.push(from_id, 0) 
 
         distances = {node: float('inf') for node in self.adj_list}
@@ -113,6 +262,47 @@ class LocationGraph:
                     pq.push(neighbor_id, new_dist)
 
         return {"distance": float("inf"), "path": []}
+
+    def dijkstra_distances(self, from_id, targets=None, max_distance=None):
+        """
+        Single-source shortest distances. With targets given, the search stops
+        once every reachable target has been settled; with max_distance it never
+        goes further than that road distance.
+        Format: {location_id: distance}
+        """
+        pq = make_priority_queue(self.queue_kind)
+        pq.push(from_id, 0)
+
+        distances = {from_id: 0}
+        settled = set()
+        remaining = None
+        if targets is not None:
+            # Targets in other components would only make the search run to exhaustion
+            remaining = {target for target in targets if self.reachable(from_id, target)}
+
+        while not pq.is_empty():
+            curr_id, curr_dist = pq.pop()
+
+            if curr_id in settled or curr_dist > distances[curr_id]:
+                continue
+            settled.add(curr_id)
+
+            if remaining is not None:
+                remaining.discard(curr_id)
+                if not remaining:
+                    break
+
+            for neighbor_id, weight in self.adj_list.get(curr_id, []):
+                new_dist = curr_dist + weight
+
+                if max_distance is not None and new_dist > max_distance:
+                    continue
+
+                if new_dist < distances.get(neighbor_id, float('inf')):
+                    distances[neighbor_id] = new_dist
+                    pq.push(neighbor_id, new_dist)
+
+        return {node_id: distances[node_id] for node_id in settled}
     
     # def auto_connect_location(self,new_location, radius_km=5.0):
     #     other_locations = Location.objects.exclude(id=new_location.id)
@@ -138,38 +328,113 @@ class LocationGraph:
     #             self.add_edge(other.id,new_location.id,dist)
     
 
+# Two listings are similar when both price and size are within these fractions of one of them
+PRICE_TOLERANCE = 0.015
+SIZE_TOLERANCE = 0.01
+
+
 class RecomendationGraph:
+    """
+    Similarity graph kept up to date one property at a time. Candidates come from
+    sorted windows over price and size instead of comparing every pair.
+    Format: { prop_id : {similar_prop_id: number_of_similarities} }
+    """
     def __init__(self):
-        # format  { prop_id : [(similar_prop_id,number_of_similarities)]}
         self.adj_list = {}
+        # {prop_id: (price, size)} plus the same entries sorted by each field
+        self.attributes = {}
+        self.by_price = []
+        self.by_size = []
+        self.loaded = False
     
     def add_node(self,property_id):
         if property_id not in self.adj_list:
-            self.adj_list[property_id] = []
+            self.adj_list[property_id] = {}
         
     def add_edge(self,from_id,to_id,number_of_similarities):
         if from_id in self.adj_list and to_id in self.adj_list: 
-            self.adj_list[from_id].append((to_id,number_of_similarities))
-            self.adj_list[to_id].append((from_id,number_of_similarities))
-            
+            self.adj_list[from_id][to_id] = number_of_similarities
+            self.adj_list[to_id][from_id] = number_of_similarities
+
+    @staticmethod
+    def _similar(price1, size1, price2, size2):
+        """
+        Same test as the old pairwise loop, which checked both orders of every pair.
+        """
+        price_gap, size_gap = abs(price1 - price2), abs(size1 - size2)
+        return (
+            (price_gap <= PRICE_TOLERANCE * price1 and size_gap <= SIZE_TOLERANCE * size1)
+            or (price_gap <= PRICE_TOLERANCE * price2 and size_gap <= SIZE_TOLERANCE * size2)
+        )
+
+    @staticmethod
+    def _window(sorted_entries, value, tolerance):
+        """
+        Index range of entries whose value could be within tolerance of value, relative to either side.
+        """
+        low = value * (1 - tolerance)
+        high = value / (1 - tolerance) if tolerance < 1 else float('inf')
+        return bisect_left(sorted_entries, (low, -inf)), bisect_right(sorted_entries, (high, inf))
+
+    def _candidates(self, price, size):
+        price_lo, price_hi = self._window(self.by_price, price, PRICE_TOLERANCE)
+        size_lo, size_hi = self._window(self.by_size, size, SIZE_TOLERANCE)
+        # Both conditions must hold, so scanning the narrower window is enough
+        if price_hi - price_lo <= size_hi - size_lo:
+            return (prop_id for _, prop_id in self.by_price[price_lo:price_hi])
+        return (prop_id for _, prop_id in self.by_size[size_lo:size_hi])
+
+    def add_property(self, property_id, price, size):
+        if property_id in self.attributes:
+            self.remove_property(property_id)
+
+        price, size = float(price), float(size)
+        self.add_node(property_id)
+        for other_id in self._candidates(price, size):
+            other_price, other_size = self.attributes[other_id]
+            if self._similar(price, size, other_price, other_size):
+                self.add_edge(property_id, other_id, 2)
+
+        self.attributes[property_id] = (price, size)
+        insort(self.by_price, (price, property_id))
+        insort(self.by_size, (size, property_id))
+
+    def remove_property(self, property_id):
+        attributes = self.attributes.pop(property_id, None)
+        if attributes is None:
+            return False
+        price, size = attributes
+        del self.by_price[bisect_left(self.by_price, (price, property_id))]
+        del self.by_size[bisect_left(self.by_size, (size, property_id))]
+
+        for neighbor_id in self.adj_list.pop(property_id, {}):
+            self.adj_list[neighbor_id].pop(property_id, None)
+        return True
+
     def generate_similarity_graph(self,property_obj):
-        for prop1 in property_obj:
-            for prop2 in property_obj:
-                
-                if prop1.id == prop2.id:
-                    continue
-                    
-                similarities = 0
-                if abs(prop1.price - prop2.price) / prop1.price <= 0.015: similarities += 1
-                if abs(prop1.size - prop2.size) / prop1.size <= 0.01: similarities += 1
-                
-                if similarities > 1:
-                    self.add_node(prop1.id)
-                    self.add_node(prop2.id)
-                    self.add_edge(prop1.id,prop2.id,similarities)
+        for prop in property_obj:
+            self.add_property(prop.id, prop.price, prop.size)
         return self.adj_list
 
-    def bfs_traversal(self,start_node):
+    def load(self):
+        self.adj_list = {}
+        self.attributes = {}
+        self.by_price = []
+        self.by_size = []
+        for prop_id, price, size in Property.objects.values_list('id', 'price', 'size').iterator(chunk_size=5000):
+            self.add_property(prop_id, price, size)
+        self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def upsert_property(self, property_obj):
+        # Before the first load the DB is the source of truth, so there is nothing to keep current
+        if self.loaded:
+            self.add_property(property_obj.id, property_obj.price, property_obj.size)
+
+    def bfs_traversal(self,start_node, limit=None):
         q = Queue()
         visited = set()
         q.enqueue(start_node)
@@ -179,19 +444,19 @@ class RecomendationGraph:
         while not q.is_empty():
             curr_id = q.dequeue()
         
-            neighbors = self.adj_list.get(curr_id, [])
+            neighbors = self.adj_list.get(curr_id, {})
             
-            for neighbor_id, score in neighbors:
+            for neighbor_id, score in neighbors.items():
                 if neighbor_id not in visited:
                     visited.add(neighbor_id)
                     
                     all_recommendations.append((neighbor_id, score))
+                    if limit is not None and len(all_recommendations) >= limit:
+                        return [item[0] for item in all_recommendations]
                     q.enqueue(neighbor_id)
         
         return [item[0] for item in all_recommendations]
-            
-        
-                
 
 
-graph = LocationGraph()
\ No newline at end of file
+graph = LocationGraph()
+recommendation_graph = RecomendationGraph()
\ No newline at end of file
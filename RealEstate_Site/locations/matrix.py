@@ -0,0 +1,27 @@
+def _trees(origins, others):
+    """
+    One early-exit Dijkstra per distinct origin, read off at every other node.
+    Format: {origin: {other: distance_km}}
+    """
+    from .graphs import graph
+
+    wanted = set(others)
+    return {origin: graph.dijkstra_distances(origin, wanted) for origin in dict.fromkeys(origins)}
+
+
+def distance_matrix(sources, targets):
+    """
+    Road distances between every source and target, computed in-process on the request thread:
+    forking a threaded server per request can deadlock the child and pays for a pool each time.
+    Roads are undirected, so the trees are grown from whichever side has fewer distinct ids
+    and the matrix is read off transposed when that is the target side.
+    Returns [[distance_km or None, ...], ...] in source order.
+    """
+    if len(set(targets)) < len(set(sources)):
+        trees = _trees(targets, sources)
+        rows = [[trees[target].get(source) for target in targets] for source in sources]
+    else:
+        trees = _trees(sources, targets)
+        rows = [[trees[source].get(target) for target in targets] for source in sources]
+
+    return [[None if distance is None else round(distance, 2) for distance in row] for row in rows]
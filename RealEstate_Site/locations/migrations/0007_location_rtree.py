@@ -0,0 +1,34 @@
+from django.db import migrations
+
+RTREE_TABLE = 'locations_location_rtree'
+
+
+def create_rtree(apps, schema_editor):
+    # R*Tree is an SQLite module; other backends keep using the in-memory indexes only
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} "
+        "USING rtree(id, min_lat, max_lat, min_lng, max_lng)"
+    )
+    schema_editor.execute(
+        f"INSERT OR REPLACE INTO {RTREE_TABLE} (id, min_lat, max_lat, min_lng, max_lng) "
+        "SELECT id, latitude, latitude, longitude, longitude FROM locations_location"
+    )
+
+
+def drop_rtree(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {RTREE_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0006_alter_facility_type'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_rtree, drop_rtree),
+    ]
@@ -1,3 +1,4 @@
+import heapq
 from .min_heap import MinHeap
 
 class PriorityQueue:
@@ -14,4 +15,157 @@ class PriorityQueue:
         result = self.min_heap.extract_min()
         if result:
             return result[1], result[0]
-        return None
\ No newline at end of file
+        return None
+
+
+class HeapqPriorityQueue:
+    """
+    Same lazy semantics as PriorityQueue (a push never replaces an older entry),
+    on the C heapq module instead of the recursive MinHeap.
+    """
+    def __init__(self):
+        self.heap = []
+
+    def is_empty(self):
+        return not self.heap
+
+    def push(self, node_id, distance):
+        heapq.heappush(self.heap, (distance, node_id))
+
+    def pop(self):
+        if not self.heap:
+            return None
+        distance, node_id = heapq.heappop(self.heap)
+        return node_id, distance
+
+
+class IndexedDaryHeap:
+    """
+    d-ary heap holding each node at most once. Pushing a node that is already
+    queued lowers its key in place (decrease-key) instead of adding a stale entry.
+    Format: keys/nodes are parallel lists, position {node_id: index}
+    """
+    def __init__(self, arity=4):
+        self.arity = arity
+        self.keys = []
+        self.nodes = []
+        self.position = {}
+
+    def is_empty(self):
+        return not self.nodes
+
+    def push(self, node_id, distance):
+        index = self.position.get(node_id)
+        if index is None:
+            self.keys.append(distance)
+            self.nodes.append(node_id)
+            self._sift_up(len(self.nodes) - 1)
+        elif distance < self.keys[index]:
+            self.keys[index] = distance
+            self._sift_up(index)
+
+    def pop(self):
+        if not self.nodes:
+            return None
+        keys, nodes = self.keys, self.nodes
+        node_id, distance = nodes[0], keys[0]
+        del self.position[node_id]
+
+        last_key, last_node = keys.pop(), nodes.pop()
+        if nodes:
+            keys[0], nodes[0] = last_key, last_node
+            self._sift_down(0)
+        return node_id, distance
+
+    def _sift_up(self, index):
+        keys, nodes, position, arity = self.keys, self.nodes, self.position, self.arity
+        key, node_id = keys[index], nodes[index]
+        while index > 0:
+            parent = (index - 1) // arity
+            if keys[parent] <= key:
+                break
+            keys[index], nodes[index] = keys[parent], nodes[parent]
+            position[nodes[index]] = index
+            index = parent
+        keys[index], nodes[index] = key, node_id
+        position[node_id] = index
+
+    def _sift_down(self, index):
+        keys, nodes, position, arity = self.keys, self.nodes, self.position, self.arity
+        size = len(keys)
+        key, node_id = keys[index], nodes[index]
+        while True:
+            first = index * arity + 1
+            if first >= size:
+                break
+            last = min(first + arity, size)
+            child = first
+            child_key = keys[first]
+            for candidate in range(first + 1, last):
+                if keys[candidate] < child_key:
+                    child, child_key = candidate, keys[candidate]
+            if child_key >= key:
+                break
+            keys[index], nodes[index] = keys[child], nodes[child]
+            position[nodes[index]] = index
+            index = child
+        keys[index], nodes[index] = key, node_id
+        position[node_id] = index
+
+
+class BucketQueue:
+    """
+    Monotone bucket queue keyed on whole metres (Dial's algorithm): distances
+    land in bucket_m wide buckets and pops sweep the buckets in order.
+    Entries inside a bucket are heap-ordered, so pops stay exact.
+    Format: {bucket_index: [(distance, node_id), ...]}
+    """
+    def __init__(self, bucket_m=10):
+        self.scale = 1000.0 / bucket_m
+        self.buckets = {}
+        self.cursor = 0
+        self.size = 0
+
+    def is_empty(self):
+        return self.size == 0
+
+    def push(self, node_id, distance):
+        index = int(distance * self.scale)
+        bucket = self.buckets.get(index)
+        if bucket is None:
+            self.buckets[index] = [(distance, node_id)]
+        else:
+            heapq.heappush(bucket, (distance, node_id))
+        # Searches only push at or after the current minimum, but stay correct if one does not
+        if index < self.cursor:
+            self.cursor = index
+        self.size += 1
+
+    def pop(self):
+        if self.size == 0:
+            return None
+        buckets = self.buckets
+        while self.cursor not in buckets:
+            self.cursor += 1
+
+        bucket = buckets[self.cursor]
+        distance, node_id = heapq.heappop(bucket)
+        if not bucket:
+            del buckets[self.cursor]
+        self.size -= 1
+        return node_id, distance
+
+
+PRIORITY_QUEUES = {
+    "min_heap": PriorityQueue,
+    "heapq": HeapqPriorityQueue,
+    "dary": IndexedDaryHeap,
+    "bucket": BucketQueue,
+}
+
+# Picked with bench_priority_queues.py on a road-like graph
+DEFAULT_PRIORITY_QUEUE = "heapq"
+
+
+def make_priority_queue(kind=None):
+    return PRIORITY_QUEUES[kind or DEFAULT_PRIORITY_QUEUE]()
@@ -0,0 +1,75 @@
+import threading
+from collections import OrderedDict
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class VersionedLRUCache:
+    """
+    Thread-safe LRU cache whose entries are tagged with the graph version they
+    were computed against; an entry from an older version counts as a miss.
+    Concurrent misses on the same key share a single computation.
+    Format: {key: (version, value)}
+    """
+    def __init__(self, max_size=2048):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_or_compute(self, key, version, compute):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] == version:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            flight = self._in_flight.get((key, version))
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._in_flight[(key, version)] = flight
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except BaseException as e:
+            # Waiters re-raise whatever stopped the leader, rather than returning None
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop((key, version), None)
+                if flight.error is None:
+                    self._data[key] = (version, flight.value)
+                    self._data.move_to_end(key)
+                    while len(self._data) > self.max_size:
+                        self._data.popitem(last=False)
+            flight.event.set()
+
+        return flight.value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+route_cache = VersionedLRUCache()
+isochrone_cache = VersionedLRUCache(max_size=256)
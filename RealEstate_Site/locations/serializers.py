@@ -81,4 +81,11 @@ class BulkFacilitySerializer(serializers.ModelSerializer):
         # Facility 'id' will still auto-increment normally (which is what you want)
         # while its 'location' field points to your specific manual Location ID.
         facility = Facility.objects.create(location=location_obj, **validated_data)
-        return facility
\ No newline at end of file
+        return facility
+
+class BulkWayPointSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField(max_length=100)
+    lat = serializers.FloatField()
+    long = serializers.FloatField()
+    waypoint_type = serializers.ChoiceField(choices=WayPoint.NODE_TYPES)
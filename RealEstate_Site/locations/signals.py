@@ -1,36 +1,96 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Location
-from .utilis import calculate_haversine
+from .models import Location, Facility, Connection
 from .graphs import graph
+from .facility_table import nearest_facilities
+from .spatial_index import waypoint_index
+from .coordinates import coordinate_registry
+from .feature_knn import property_features
+from . import geo_rtree
 
 @receiver(post_save, sender=Location)
 def connect_to_nearest_waypoint(sender, instance, created, **kwargs):
     if created and instance.location_type in ['property']:
         
-        waypoints = Location.objects.filter(location_type='way_point')
-        
-        nearest_waypoint = None
-        min_distance = float('inf')
+        if waypoint_index.loaded or not geo_rtree.available():
+            nearest = waypoint_index.nearest(instance.latitude, instance.longitude)
+        else:
+            # Cold worker: one indexed query instead of loading every waypoint into memory
+            nearest = geo_rtree.nearest(instance.latitude, instance.longitude, 'way_point')
 
-        for wp in waypoints:
-            dist = calculate_haversine(
-                instance.latitude, instance.longitude,
-                wp.latitude, wp.longitude
-            )
-            
-            if dist < min_distance:
-                min_distance = dist
-                nearest_waypoint = wp
-
-        if nearest_waypoint:
+        if nearest:
+            nearest_waypoint_id, _ = nearest
             from .models import Connection 
             
             conn, _ = Connection.objects.get_or_create(
                 from_location=instance,
-                to_location=nearest_waypoint
+                to_location_id=nearest_waypoint_id
             )
             
             graph.add_location(instance)
-            graph.add_edge(instance.id, nearest_waypoint.id, conn.distance)
-            graph.add_edge(nearest_waypoint.id, instance.id, conn.distance)
+            graph.add_edge(instance.id, nearest_waypoint_id, conn.distance)
+            graph.add_edge(nearest_waypoint_id, instance.id, conn.distance)
+
+
+@receiver(post_save, sender=Location)
+def sync_geo_rtree_on_save(sender, instance, **kwargs):
+    geo_rtree.upsert(instance.id, instance.latitude, instance.longitude)
+
+@receiver(post_delete, sender=Location)
+def sync_geo_rtree_on_delete(sender, instance, **kwargs):
+    geo_rtree.delete(instance.id)
+
+@receiver(post_save, sender=Location)
+def update_registered_coordinates(sender, instance, created, **kwargs):
+    if not created and instance.id in coordinate_registry:
+        coordinate_registry.add(instance.id, instance.latitude, instance.longitude)
+
+@receiver(post_save, sender=Location)
+def sync_waypoint_index_on_save(sender, instance, **kwargs):
+    # insert() drops the old cell first, so a moved waypoint is found at its new position
+    if instance.location_type == 'way_point':
+        waypoint_index.insert(instance.id, instance.latitude, instance.longitude)
+    else:
+        waypoint_index.remove(instance.id)
+
+@receiver(post_delete, sender=Location)
+def remove_from_waypoint_index(sender, instance, **kwargs):
+    if instance.location_type == 'way_point':
+        waypoint_index.remove(instance.id)
+
+
+@receiver(post_save, sender=Facility)
+def add_facility_to_nearest_table(sender, instance, created, **kwargs):
+    if created:
+        graph.add_location(instance.location)
+        nearest_facilities.add_facility(instance.location_id, instance.name, instance.type)
+        # Counted in the feature vectors of properties saved from now on
+        if property_features.loaded:
+            property_features.add_facility(instance.id, instance.location.latitude, instance.location.longitude, instance.type)
+
+@receiver(post_delete, sender=Facility)
+def remove_facility_from_nearest_table(sender, instance, **kwargs):
+    still_present = Facility.objects.filter(location_id=instance.location_id, type=instance.type).exists()
+    nearest_facilities.remove_facility(instance.location_id, instance.type, still_present)
+    property_features.remove_facility(instance.id)
+
+@receiver(post_save, sender=Connection)
+def add_connection_to_graph(sender, instance, created, **kwargs):
+    if created:
+        # Searches read nodes_data for every node they reach, so both ends are registered first
+        for location in (instance.from_location, instance.to_location):
+            if location.id not in graph.nodes_data:
+                graph.add_location(location)
+        graph.add_edge(instance.from_location_id, instance.to_location_id, instance.distance)
+        nearest_facilities.edges_added([(instance.from_location_id, instance.to_location_id, instance.distance)])
+
+@receiver(post_delete, sender=Connection)
+def remove_connection_from_graph(sender, instance, **kwargs):
+    reverse_exists = Connection.objects.filter(
+        from_location_id=instance.to_location_id,
+        to_location_id=instance.from_location_id
+    ).exists()
+
+    if not reverse_exists:
+        graph.remove_edge(instance.from_location_id, instance.to_location_id)
+        nearest_facilities.edges_removed()
@@ -0,0 +1,236 @@
+import math
+import numpy as np
+from .utilis import haversine_one_to_many, EARTH_RADIUS_KM
+
+
+class GridIndex:
+    """
+    Uniform lat/lng grid for exact nearest-neighbour and radius queries.
+    Format: {(lat_cell, lng_cell): {item_id: (lat, lng, lat_rad, lng_rad)}}
+    """
+    def __init__(self, cell_size_deg=0.01):
+        self.cell_size = cell_size_deg
+        self.cells = {}
+        self.items = {}
+        self.min_cell = None
+        self.max_cell = None
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def __len__(self):
+        return len(self.items)
+
+    def insert(self, item_id, lat, lng):
+        if item_id in self.items:
+            self.remove(item_id)
+
+        cell = self._cell(lat, lng)
+        self.cells.setdefault(cell, {})[item_id] = (lat, lng, math.radians(lat), math.radians(lng))
+        self.items[item_id] = cell
+
+        if self.min_cell is None:
+            self.min_cell = cell
+            self.max_cell = cell
+        else:
+            self.min_cell = (min(self.min_cell[0], cell[0]), min(self.min_cell[1], cell[1]))
+            self.max_cell = (max(self.max_cell[0], cell[0]), max(self.max_cell[1], cell[1]))
+
+    def remove(self, item_id):
+        cell = self.items.pop(item_id, None)
+        if cell is None:
+            return False
+
+        bucket = self.cells[cell]
+        bucket.pop(item_id, None)
+        if not bucket:
+            del self.cells[cell]
+        return True
+
+    def _ring(self, center, r):
+        ci, cj = center
+        if r == 0:
+            yield center
+            return
+
+        for j in range(cj - r, cj + r + 1):
+            yield (ci - r, j)
+            yield (ci + r, j)
+        for i in range(ci - r + 1, ci + r):
+            yield (i, cj - r)
+            yield (i, cj + r)
+
+    def _ring_lower_bound(self, lat, lng, center, r):
+        """
+        Smallest possible distance (km) to any point outside the rings searched so far.
+        """
+        ci, cj = center
+        dlat = min(lat - (ci - r) * self.cell_size, (ci + r + 1) * self.cell_size - lat)
+        dlng = min(lng - (cj - r) * self.cell_size, (cj + r + 1) * self.cell_size - lng)
+
+        lat_bound = EARTH_RADIUS_KM * math.radians(dlat)
+        lng_angle = min(math.radians(dlng), math.pi / 2)
+        lng_bound = EARTH_RADIUS_KM * math.asin(math.cos(math.radians(lat)) * math.sin(lng_angle))
+
+        return min(lat_bound, lng_bound)
+
+    def nearest(self, lat, lng, exclude=None):
+        """
+        Exact nearest item by haversine distance.
+        Returns (item_id, distance_km) or None when the index is empty.
+        """
+        if not self.items:
+            return None
+
+        center = self._cell(lat, lng)
+        max_ring = max(
+            abs(center[0] - self.min_cell[0]), abs(center[0] - self.max_cell[0]),
+            abs(center[1] - self.min_cell[1]), abs(center[1] - self.max_cell[1])
+        )
+
+        lat_rad, lng_rad = math.radians(lat), math.radians(lng)
+        best_id = None
+        best_dist = float('inf')
+
+        for r in range(max_ring + 1):
+            # Far from the occupied area most rings are empty; scanning the buckets is cheaper
+            if (2 * r + 1) ** 2 > 4 * len(self.cells):
+                return self._closest(lat_rad, lng_rad, self.cells.values(), exclude)
+
+            ring_buckets = [self.cells[cell] for cell in self._ring(center, r) if cell in self.cells]
+            candidate = self._closest(lat_rad, lng_rad, ring_buckets, exclude)
+
+            if candidate and candidate[1] < best_dist:
+                best_id, best_dist = candidate
+
+            if best_id is not None and self._ring_lower_bound(lat, lng, center, r) >= best_dist:
+                break
+
+        if best_id is None:
+            return None
+        return best_id, best_dist
+
+    def _gather(self, buckets, exclude=None):
+        ids, lats, lngs = [], [], []
+        for bucket in buckets:
+            for item_id, (_, _, item_lat_rad, item_lng_rad) in bucket.items():
+                if item_id == exclude:
+                    continue
+                ids.append(item_id)
+                lats.append(item_lat_rad)
+                lngs.append(item_lng_rad)
+        return ids, lats, lngs
+
+    def _closest(self, lat_rad, lng_rad, buckets, exclude=None):
+        ids, lats, lngs = self._gather(buckets, exclude)
+        if not ids:
+            return None
+
+        dists = haversine_one_to_many(lat_rad, lng_rad, lats, lngs)
+        best = int(np.argmin(dists))
+        return ids[best], float(dists[best])
+
+    def within_radius(self, lat, lng, radius_km):
+        """
+        All items within radius_km of (lat, lng), nearest first.
+        Returns [(item_id, distance_km), ...]
+        """
+        if not self.items:
+            return []
+
+        # Bounding box of the spherical cap around (lat, lng)
+        angle = radius_km / EARTH_RADIUS_KM
+        lat_span = math.degrees(angle)
+        ratio = math.sin(angle) / max(math.cos(math.radians(lat)), 1e-12)
+        lng_span = 180.0 if angle >= math.pi / 2 or ratio >= 1 else math.degrees(math.asin(ratio))
+
+        low = self._cell(lat - lat_span, lng - lng_span)
+        high = self._cell(lat + lat_span, lng + lng_span)
+
+        if (high[0] - low[0] + 1) * (high[1] - low[1] + 1) > len(self.cells):
+            buckets = self.cells.values()
+        else:
+            buckets = [
+                self.cells[(i, j)]
+                for i in range(low[0], high[0] + 1)
+                for j in range(low[1], high[1] + 1)
+                if (i, j) in self.cells
+            ]
+
+        ids, lats, lngs = self._gather(buckets)
+        if not ids:
+            return []
+
+        dists = haversine_one_to_many(math.radians(lat), math.radians(lng), lats, lngs)
+        inside = np.nonzero(dists <= radius_km)[0]
+        inside = inside[np.argsort(dists[inside], kind='stable')]
+
+        return [(ids[i], float(dists[i])) for i in inside]
+
+    def within_bbox(self, south, west, north, east):
+        """
+        Ids of all items inside the box. west > east means the box crosses the antimeridian.
+        """
+        if not self.items or south > north:
+            return []
+        if west > east:
+            return self.within_bbox(south, west, north, 180.0) + self.within_bbox(south, -180.0, north, east)
+
+        low = self._cell(south, west)
+        high = self._cell(north, east)
+
+        if (high[0] - low[0] + 1) * (high[1] - low[1] + 1) > len(self.cells):
+            buckets = self.cells.values()
+        else:
+            buckets = [
+                self.cells[(i, j)]
+                for i in range(low[0], high[0] + 1)
+                for j in range(low[1], high[1] + 1)
+                if (i, j) in self.cells
+            ]
+
+        return [
+            item_id
+            for bucket in buckets
+            for item_id, (lat, lng, _, _) in bucket.items()
+            if south <= lat <= north and west <= lng <= east
+        ]
+
+
+class WaypointIndex(GridIndex):
+    """
+    Grid index over 'way_point' locations, loaded from the DB on first use.
+    """
+    def __init__(self, cell_size_deg=0.01):
+        super().__init__(cell_size_deg)
+        self.loaded = False
+
+    def load(self):
+        from .models import Location
+
+        self.cells = {}
+        self.items = {}
+        self.min_cell = None
+        self.max_cell = None
+
+        waypoints = Location.objects.filter(location_type='way_point').values_list('id', 'latitude', 'longitude')
+        for loc_id, lat, lng in waypoints.iterator(chunk_size=5000):
+            super().insert(loc_id, lat, lng)
+
+        self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def insert(self, item_id, lat, lng):
+        # Before the first load the DB is the source of truth, so there is nothing to keep current
+        if self.loaded:
+            super().insert(item_id, lat, lng)
+
+    def nearest(self, lat, lng, exclude=None):
+        self.ensure_loaded()
+        return super().nearest(lat, lng, exclude)
+
+
+waypoint_index = WaypointIndex()
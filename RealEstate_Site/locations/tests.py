@@ -1,3 +1,1034 @@
+import importlib
+import math
+import random
+import threading
+import numpy as np
+from types import SimpleNamespace
+from unittest import mock
+from django.db import connection
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from .graphs import LocationGraph, RecomendationGraph, recommendation_graph
+from .models import Connection, Facility, Location, WayPoint
+from .disjoint_set import DisjointSet
+from .priority_queues import PRIORITY_QUEUES, make_priority_queue
+from .feature_knn import FACILITY_CATEGORIES, FEATURES, PropertyFeatureIndex, raw_features
+from .bulk import ingest_connections, load_facilities, load_waypoints
+from .facility_table import NearestFacilityTable
+from .spatial_index import WaypointIndex
+from .loader import load_graph
+from .route_cache import VersionedLRUCache
+from .views import MAX_MATRIX_CELLS
+from .spatial_index import GridIndex
+from .utilis import calculate_haversine, convex_hull, haversine_many_to_many, haversine_one_to_many, haversine_pairwise
+from . import geo_rtree
+from .views import DEFAULT_RECOMMENDATIONS
+from listing.models import Property
+from listing.recommendations import PRECOMPUTED_K
+
+
+def road_graph(seed, junctions=40, roads=80, facilities=15):
+    """
+    Random road network: junctions joined by chains of 0-4 waypoints, with facilities hanging off it.
+    """
+    rng = random.Random(seed)
+    graph = LocationGraph()
+    for node_id in range(junctions):
+        graph.add_node(node_id, f"junction {node_id}", 'way_point')
+
+    next_id = junctions
+    for _ in range(roads):
+        start_id, end_id = rng.sample(range(junctions), 2)
+        prev_id = start_id
+        for _ in range(rng.randint(0, 4)):
+            graph.add_node(next_id, "waypoint", 'way_point')
+            graph.add_edge(prev_id, next_id, rng.uniform(0.01, 0.2))
+            prev_id = next_id
+            next_id += 1
+        graph.add_edge(prev_id, end_id, rng.uniform(0.01, 0.2))
+
+    for anchor_id in rng.sample(list(graph.adj_list), facilities):
+        graph.add_node(next_id, f"facility {next_id}", 'facility', 'school')
+        graph.add_edge(anchor_id, next_id, rng.uniform(0.01, 0.3))
+        next_id += 1
+    return graph
+
+
+def path_length(graph, path):
+    weights = {(loc_id, neighbor_id): weight for loc_id in graph.adj_list for neighbor_id, weight in graph.adj_list[loc_id]}
+    return sum(weights[step] for step in zip(path, path[1:]))
+
+
+class ContractedGraphTests(TestCase):
+    def test_shortest_paths_match_plain_dijkstra(self):
+        for seed in range(5):
+            graph = road_graph(seed)
+            nodes = list(graph.adj_list)
+            pairs = [tuple(random.Random(seed).sample(nodes, 2)) for _ in range(30)] + [(nodes[0], nodes[0])]
+            plain = {pair: graph.dijkstra_shortest_path(*pair) for pair in pairs}
+
+            graph.contract()
+            for pair, expected in plain.items():
+                found = graph.dijkstra_shortest_path(*pair)
+                self.assertEqual(found["distance"], expected["distance"], pair)
+                if expected["path"]:
+                    self.assertEqual((found["path"][0], found["path"][-1]), pair)
+                    self.assertAlmostEqual(path_length(graph, found["path"]), path_length(graph, expected["path"]))
+
+    def test_nearby_facilities_match_bounded_dijkstra(self):
+        graph = road_graph(7)
+        graph.contract()
+        for start_id in list(graph.adj_list)[:30]:
+            found = {item["location_id"]: item["distance"] for item in graph.bfs_nearby_facilities(start_id, 1.0)}
+            expected = {
+                loc_id: distance for loc_id, distance in graph.dijkstra_distances(start_id, max_distance=1.0).items()
+                if graph.nodes_data[loc_id]['type'] == 'facility' and loc_id != start_id
+            }
+            self.assertEqual(found.keys(), expected.keys())
+            for loc_id, distance in expected.items():
+                self.assertAlmostEqual(found[loc_id], distance)
+
+    def test_edge_changes_after_contraction(self):
+        graph = road_graph(3)
+        graph.contract()
+        rng = random.Random(3)
+        edges = [(loc_id, neighbor_id) for loc_id in graph.adj_list for neighbor_id, _ in graph.adj_list[loc_id] if loc_id < neighbor_id]
+        for loc_id1, loc_id2 in rng.sample(edges, 10):
+            graph.remove_edge(loc_id1, loc_id2)
+        nodes = list(graph.adj_list)
+        for _ in range(10):
+            graph.add_edge(*rng.sample(nodes, 2), rng.uniform(0.01, 0.2))
+
+        reference = LocationGraph()
+        reference.adj_list, reference.nodes_data = graph.adj_list, graph.nodes_data
+        reference.components.build(reference)
+        for _ in range(30):
+            pair = rng.sample(nodes, 2)
+            self.assertEqual(graph.dijkstra_shortest_path(*pair)["distance"], reference.dijkstra_shortest_path(*pair)["distance"])
+
+
+    def test_added_edges_never_change_the_instance_searches_hold(self):
+        graph = road_graph(4)
+        graph.contract()
+        held = graph.contracted
+        snapshot = ({node_id: dict(neighbors) for node_id, neighbors in held.adj.items()}, dict(held.members))
+
+        waypoints = list(held.members)
+        graph.add_edge(waypoints[0], waypoints[-1], 0.05)
+        graph.add_edges([(waypoints[1], waypoints[-2], 0.07), (waypoints[2], 0, 0.02)])
+
+        self.assertIsNot(graph.contracted, held)
+        self.assertEqual(({node_id: dict(neighbors) for node_id, neighbors in held.adj.items()}, held.members), snapshot)
+        self.assertIn(waypoints[0], graph.contracted.adj)
+        self.assertAlmostEqual(graph.dijkstra_shortest_path(waypoints[0], waypoints[-1])["distance"], 0.05)
+
+
+class DisjointSetTests(TestCase):
+    def test_union_tracks_size_and_facilities(self):
+        components = DisjointSet()
+        components.add(1, is_facility=True)
+        components.add(2)
+        components.add(3, is_facility=True)
+        components.add(4)
+
+        components.union(1, 2)
+        components.union(3, 4)
+        self.assertTrue(components.connected(1, 2))
+        self.assertFalse(components.connected(2, 3))
+
+        root = components.union(2, 4)
+        self.assertEqual(root, components.find(3))
+        self.assertEqual(components.size[root], 4)
+        self.assertEqual(components.facility_count(4), 2)
+        self.assertEqual(components.union(1, 3), root)
+
+    def test_unknown_ids(self):
+        components = DisjointSet()
+        components.add(1)
+        self.assertTrue(components.connected(9, 9))
+        self.assertFalse(components.connected(1, 9))
+        self.assertIsNone(components.component_id(9))
+        self.assertEqual(components.facility_count(9), 0)
+
+    def test_build_matches_graph_reachability(self):
+        graph = road_graph(5, junctions=60, roads=30)
+        components = DisjointSet()
+        components.build(graph)
+
+        members = components.components()
+        self.assertEqual(sorted(loc_id for group in members.values() for loc_id in group), sorted(graph.adj_list))
+        for root, group in members.items():
+            self.assertEqual(set(graph.dijkstra_distances(group[0])), set(group))
+            facilities = sum(graph.nodes_data[loc_id]['type'] == 'facility' for loc_id in group)
+            self.assertEqual(components.facilities[root], facilities)
+
+    def test_facility_registered_after_its_edge(self):
+        components = DisjointSet()
+        components.union(1, 2)
+        components.add(2, is_facility=True)
+        components.add(2, is_facility=True)
+        self.assertEqual(components.facility_count(1), 1)
+
+        graph = LocationGraph()
+        graph.add_node(1, "junction", 'way_point')
+        graph.add_edge(1, 2, 0.4)
+        graph.add_edge(2, 1, 0.4)
+        graph.add_node(2, "clinic", 'facility', 'hospital')
+        self.assertTrue(graph.has_reachable_facility(1))
+        self.assertEqual([item["location_id"] for item in graph.bfs_nearby_facilities(1, 1.0)], [2])
+
+    def test_graph_rebuilds_after_edge_removal(self):
+        graph = LocationGraph()
+        for loc_id in range(3):
+            graph.add_node(loc_id, f"location {loc_id}", 'way_point')
+        graph.add_edge(0, 1, 0.5)
+        graph.add_edge(1, 2, 0.5)
+        self.assertTrue(graph.reachable(0, 2))
+
+        graph.remove_edge(1, 2)
+        self.assertFalse(graph.reachable(0, 2))
+        self.assertEqual(graph.dijkstra_shortest_path(0, 2)["path"], [])
+
+
+class PriorityQueueTests(TestCase):
+    def drain(self, queue):
+        popped = []
+        while not queue.is_empty():
+            popped.append(queue.pop())
+        return popped
+
+    def test_pops_in_distance_order(self):
+        rng = random.Random(37)
+        entries = [(node_id, round(rng.uniform(0, 5), 4)) for node_id in range(300)]
+        for kind in PRIORITY_QUEUES:
+            queue = make_priority_queue(kind)
+            for node_id, distance in entries:
+                queue.push(node_id, distance)
+
+            popped = self.drain(queue)
+            self.assertEqual(sorted(popped, key=lambda item: (item[1], item[0])), sorted(entries, key=lambda item: (item[1], item[0])), kind)
+            self.assertEqual([distance for _, distance in popped], sorted(distance for _, distance in entries), kind)
+            self.assertIsNone(queue.pop(), kind)
+
+    def test_repeated_push(self):
+        for kind in PRIORITY_QUEUES:
+            queue = make_priority_queue(kind)
+            queue.push(1, 2.0)
+            queue.push(2, 1.5)
+            queue.push(1, 1.0)
+            queue.push(2, 3.0)
+            popped = self.drain(queue)
+            if kind == 'dary':
+                # Decrease-key: one entry per node at its lowest distance
+                self.assertEqual(popped, [(1, 1.0), (2, 1.5)])
+            else:
+                # Lazy: every push is popped, the searches skip the stale ones
+                self.assertEqual(popped, [(1, 1.0), (2, 1.5), (1, 2.0), (2, 3.0)], kind)
+
+    def test_bucket_queue_push_below_cursor(self):
+        queue = make_priority_queue('bucket')
+        queue.push(1, 0.5)
+        self.assertEqual(queue.pop(), (1, 0.5))
+        queue.push(2, 0.1)
+        queue.push(3, 0.7)
+        self.assertEqual(self.drain(queue), [(2, 0.1), (3, 0.7)])
+
+    def test_searches_agree_on_every_queue(self):
+        graph = road_graph(11)
+        starts = list(graph.adj_list)[:10]
+        expected = {start_id: graph.dijkstra_distances(start_id) for start_id in starts}
+        for kind in PRIORITY_QUEUES:
+            graph.queue_kind = kind
+            for start_id in starts:
+                found = graph.dijkstra_distances(start_id)
+                self.assertEqual(found.keys(), expected[start_id].keys(), kind)
+                for loc_id, distance in found.items():
+                    self.assertAlmostEqual(distance, expected[start_id][loc_id], msg=kind)
+
+
+class ConnectionSignalTests(TestCase):
+    def test_connection_registers_unseen_endpoints(self):
+        fresh = LocationGraph()
+        with mock.patch('locations.signals.graph', fresh):
+            waypoint = Location.objects.create(name="Junction", latitude=31.50, longitude=74.30, location_type='way_point')
+            school = Location.objects.create(name="School site", latitude=31.51, longitude=74.30, location_type='facility')
+            Connection.objects.create(from_location=waypoint, to_location=school)
+
+        self.assertEqual(fresh.nodes_data[waypoint.id]['type'], 'way_point')
+        self.assertEqual(fresh.nodes_data[school.id]['name'], "School site")
+        found = fresh.bfs_nearby_facilities(waypoint.id, 5.0)
+        self.assertEqual([item["location_id"] for item in found], [school.id])
+
+
+class BulkFacilityLoadTests(TestCase):
+    def test_loaded_facilities_count_in_feature_vectors(self):
+        features = PropertyFeatureIndex()
+        features.load()
+        rows = [
+            {'id': 9001, 'name': "Grammar School", 'type': 'school', 'location_name': "School site", 'latitude': 31.5, 'longitude': 74.3},
+            {'id': 9002, 'name': "City Hospital", 'type': 'hospital', 'location_name': "Hospital site", 'latitude': 31.501, 'longitude': 74.3},
+        ]
+        with mock.patch('locations.feature_knn.property_features', features), \
+                mock.patch('locations.signals.property_features', features), \
+                mock.patch('locations.graphs.graph', LocationGraph()):
+            load_facilities(rows)
+            counts = dict(zip(FACILITY_CATEGORIES, features.facility_counts(31.5, 74.3)))
+            self.assertEqual((counts['school'], counts['hospital']), (1, 1))
+
+            Facility.objects.get(location_id=9001).delete()
+            counts = dict(zip(FACILITY_CATEGORIES, features.facility_counts(31.5, 74.3)))
+            self.assertEqual((counts['school'], counts['hospital']), (0, 1))
+
+
+class WaypointIndexSignalTests(TestCase):
+    def test_moved_waypoint_is_found_at_its_new_position(self):
+        index = WaypointIndex()
+        index.load()
+        with mock.patch('locations.signals.waypoint_index', index):
+            near = Location.objects.create(name="Near", latitude=31.500, longitude=74.300, location_type='way_point')
+            far = Location.objects.create(name="Far", latitude=31.600, longitude=74.400, location_type='way_point')
+            self.assertEqual(index.nearest(31.501, 74.301)[0], near.id)
+
+            far.latitude, far.longitude = 31.5011, 74.3011
+            far.save()
+            self.assertEqual(index.nearest(31.501, 74.301)[0], far.id)
+            self.assertEqual(len(index.cells[index.items[far.id]]), 2)
+
+            far.location_type = 'property'
+            far.save()
+            self.assertEqual(index.nearest(31.501, 74.301)[0], near.id)
+            self.assertEqual(len(index), 1)
+
+
+class RecommendationViewTests(TestCase):
+    def setUp(self):
+        # The graph outlives each test's rolled-back rows; make the next use load from this test's data
+        recommendation_graph.loaded = False
+        self.client = APIClient()
+        rows = [
+            {'title': f"Listing {index}", 'price': 100000, 'size': 100, 'bedrooms': 1, 'bathrooms': 1,
+             'location_name': f"Location {index}", 'latitude': 31.4 + index * 1e-3, 'longitude': 74.3}
+            for index in range(30)
+        ]
+        self.client.post('/api/properties/create-bulk/', rows, format='json')
+        self.prop_id = Property.objects.order_by('id').values_list('id', flat=True).first()
+
+    def test_unknown_property_is_rejected_before_computing(self):
+        with mock.patch('listing.recommendations.compute') as compute:
+            response = self.client.get('/api/locations/recommendations/999999/')
+        self.assertEqual(response.status_code, 404)
+        compute.assert_not_called()
+
+    def test_default_and_capped_limits(self):
+        url = f'/api/locations/recommendations/{self.prop_id}/'
+        self.assertEqual(len(self.client.get(url).json()['recommendations']), DEFAULT_RECOMMENDATIONS)
+        self.assertEqual(len(self.client.get(url, {'limit': 500}).json()['recommendations']), min(29, PRECOMPUTED_K))
+        self.assertEqual(self.client.get(url, {'limit': 'x'}).status_code, 400)
+
+
+def store_facilities(graph):
+    """
+    Location + Facility rows for the graph's facility nodes, without the save signals.
+    """
+    facility_ids = [loc_id for loc_id, data in graph.nodes_data.items() if data['type'] == 'facility']
+    Location.objects.bulk_create([
+        Location(id=loc_id, name=graph.nodes_data[loc_id]['name'], latitude=31.5, longitude=74.3, location_type='facility')
+        for loc_id in facility_ids
+    ])
+    Facility.objects.bulk_create([
+        Facility(location_id=loc_id, name=graph.nodes_data[loc_id]['name'], type='school' if loc_id % 2 else 'park')
+        for loc_id in facility_ids
+    ])
+
+
+class NearestFacilityTableTests(TestCase):
+    def assertMatchesRebuild(self, table, graph):
+        fresh = NearestFacilityTable()
+        fresh.build(graph)
+        for loc_id in graph.adj_list:
+            found, expected = table.nearest_for(loc_id), fresh.nearest_for(loc_id)
+            self.assertEqual(found.keys(), expected.keys(), loc_id)
+            for category, label in expected.items():
+                self.assertAlmostEqual(found[category]["distance"], label["distance"], msg=(loc_id, category))
+
+    def test_labels_match_plain_dijkstra(self):
+        graph = road_graph(21)
+        store_facilities(graph)
+        table = NearestFacilityTable()
+        table.build(graph)
+
+        schools = set(Facility.objects.filter(type='school').values_list('location_id', flat=True))
+        for loc_id in list(graph.adj_list)[:20]:
+            distances = graph.dijkstra_distances(loc_id)
+            reachable = [distances[school_id] for school_id in schools if school_id in distances]
+            label = table.nearest_for(loc_id).get('school')
+            if not reachable:
+                self.assertIsNone(label)
+            else:
+                self.assertAlmostEqual(label["distance"], round(min(reachable), 2))
+
+    def test_added_edges_match_a_rebuild(self):
+        graph = road_graph(22)
+        store_facilities(graph)
+        table = NearestFacilityTable()
+        table.build(graph)
+
+        rng = random.Random(22)
+        nodes = list(graph.adj_list)
+        added = graph.add_edges([(*rng.sample(nodes, 2), rng.uniform(0.01, 0.1)) for _ in range(15)])
+        table.edges_added(added)
+        self.assertFalse(table.stale_categories)
+        self.assertMatchesRebuild(table, graph)
+
+    def test_removed_edges_mark_the_table_stale(self):
+        graph = road_graph(23)
+        store_facilities(graph)
+        table = NearestFacilityTable()
+        table.build(graph)
+
+        rng = random.Random(23)
+        edges = [(loc_id, neighbor_id) for loc_id in graph.adj_list for neighbor_id, _ in graph.adj_list[loc_id] if loc_id < neighbor_id]
+        for loc_id1, loc_id2 in rng.sample(edges, 20):
+            graph.remove_edge(loc_id1, loc_id2)
+        table.edges_removed()
+        self.assertEqual(table.stale_categories, set(table.labels))
+        self.assertMatchesRebuild(table, graph)
+        self.assertFalse(table.stale_categories)
+
+
+class FacilityBadgeTests(TestCase):
+    def setUp(self):
+        client = APIClient()
+        client.post('/api/properties/create/', {
+            'title': "Listing", 'price': 100000, 'size': 100, 'bedrooms': 1, 'bathrooms': 1,
+            'location_name': "Home", 'latitude': 31.5, 'longitude': 74.3
+        }, format='json')
+        self.prop = Property.objects.get()
+
+        graph = LocationGraph()
+        graph.add_node(self.prop.location_id_id, "Home", 'property')
+        graph.add_node(7001, "Grammar School", 'facility', 'school')
+        graph.add_edge(self.prop.location_id_id, 7001, 0.8)
+        graph.add_edge(7001, self.prop.location_id_id, 0.8)
+        store_facilities(graph)
+        self.table = NearestFacilityTable()
+        self.table.build(graph)
+
+    def test_badges_are_opt_in_on_lists(self):
+        with mock.patch('locations.facility_table.nearest_facilities', self.table):
+            plain = APIClient().get('/api/properties/get/').json()[0]
+            badged = APIClient().get('/api/properties/get/', {'facilities': 'true'}).json()[0]
+            detail = APIClient().get(f'/api/properties/view/{self.prop.id}/').json()['data']
+
+        self.assertNotIn('nearest_facilities', plain)
+        expected = {"location_id": 7001, "name": "Grammar School", "distance": 0.8}
+        self.assertEqual(badged['nearest_facilities'], {'school': expected})
+        self.assertEqual(detail['nearest_facilities'], {'school': expected})
+
+
+class IngestConnectionsTests(TestCase):
+    def setUp(self):
+        self.graph = LocationGraph()
+        patcher = mock.patch('locations.graphs.graph', self.graph)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.ids = [
+            Location.objects.create(name=f"Junction {index}", latitude=31.5 + index * 0.01, longitude=74.3, location_type='way_point').id
+            for index in range(4)
+        ]
+
+    def test_rows_are_validated_and_counted(self):
+        a, b, c, d = self.ids
+        Connection.objects.bulk_create([Connection(from_location_id=a, to_location_id=b, distance=1.11)])
+        created, errors = ingest_connections([
+            {'from_location': a, 'to_location': b},
+            {'from_location': b, 'to_location': c},
+            {'from_location': b, 'to_location': c},
+            {'from_location': c, 'to_location': d},
+            {'from_location': c, 'to_location': 999999},
+            {'from_location': 'x', 'to_location': d},
+            {'to_location': d},
+        ])
+
+        self.assertEqual(created, 2)
+        self.assertEqual(Connection.objects.count(), 3)
+        self.assertEqual(len(errors), 3)
+        # Malformed rows are reported as they are parsed, unknown ids once endpoints are fetched
+        self.assertEqual(errors[0]['error'], {'from_location': ["Incorrect type. Expected pk value, received str."]})
+        self.assertEqual(errors[1]['error'], {'from_location': ["This field is required."]})
+        self.assertEqual(errors[2]['error'], {'to_location': ['Invalid pk "999999" - object does not exist.']})
+
+    def test_new_edges_reach_the_graph(self):
+        a, b, c, _ = self.ids
+        ingest_connections([{'from_location': a, 'to_location': b}, {'from_location': b, 'to_location': c}])
+
+        self.assertEqual(self.graph.nodes_data[a]['type'], 'way_point')
+        self.assertAlmostEqual(self.graph.dijkstra_shortest_path(a, c)["distance"], round(1.11 * 2, 2), places=1)
+        self.assertAlmostEqual(
+            dict(self.graph.adj_list[a])[b], Connection.objects.get(from_location_id=a, to_location_id=b).distance
+        )
+        self.assertEqual(ingest_connections([{'from_location': a, 'to_location': b}]), (0, []))
+
+
+class ChunkedLoadTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch('locations.graphs.graph', LocationGraph())
+        self.graph = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_waypoints_load_in_chunks(self):
+        rows = [
+            {'id': 8000 + index, 'name': f"Waypoint {index}", 'lat': 31.5, 'long': 74.3 + index * 0.01, 'waypoint_type': 'waypoint'}
+            for index in range(5)
+        ]
+        chunks = load_waypoints(rows, chunk_size=2)
+
+        self.assertEqual([chunk['rows'] for chunk in chunks], [2, 2, 1])
+        self.assertEqual(Location.objects.filter(location_type='way_point').count(), 5)
+        self.assertEqual(WayPoint.objects.count(), 5)
+        self.assertEqual({loc_id for loc_id in self.graph.nodes_data}, {row['id'] for row in rows})
+
+    def test_facilities_load_in_chunks(self):
+        rows = [
+            {'id': 8100 + index, 'name': f"School {index}", 'type': 'school', 'location_name': f"Site {index}",
+             'latitude': 31.5, 'longitude': 74.3 + index * 0.01}
+            for index in range(3)
+        ]
+        chunks = load_facilities(rows, chunk_size=2)
+
+        self.assertEqual([chunk['rows'] for chunk in chunks], [2, 1])
+        self.assertEqual(sorted(Facility.objects.values_list('location_id', flat=True)), [row['id'] for row in rows])
+        self.assertEqual(self.graph.nodes_data[8100]['category'], 'school')
+
+    def test_bad_row_writes_nothing(self):
+        rows = [
+            {'id': 8200, 'name': "Waypoint", 'lat': 31.5, 'long': 74.3, 'waypoint_type': 'waypoint'},
+            {'id': 8200, 'name': "Again", 'lat': 31.5, 'long': 74.3, 'waypoint_type': 'waypoint'},
+        ]
+        with self.assertRaises(ValueError):
+            load_waypoints(rows)
+        with self.assertRaises(ValueError):
+            load_waypoints([rows[0], {'id': 8201, 'name': "No position", 'waypoint_type': 'waypoint'}])
+        self.assertFalse(Location.objects.exists())
+
+
+class LoadGraphTests(TestCase):
+    def test_three_queries_and_first_facility_wins(self):
+        Location.objects.bulk_create([
+            Location(id=1, name="Junction", latitude=31.50, longitude=74.30, location_type='way_point'),
+            Location(id=2, name="Campus", latitude=31.51, longitude=74.30, location_type='facility'),
+            Location(id=3, name="Home", latitude=31.52, longitude=74.30, location_type='property'),
+            Location(id=4, name="Island", latitude=32.00, longitude=75.00, location_type='way_point'),
+        ])
+        Facility.objects.bulk_create([
+            Facility(id=10, location_id=2, name="Primary School", type='school'),
+            Facility(id=11, location_id=2, name="Campus Park", type='park'),
+        ])
+        Connection.objects.bulk_create([
+            Connection(from_location_id=1, to_location_id=2, distance=1.1),
+            Connection(from_location_id=2, to_location_id=1, distance=1.1),
+            Connection(from_location_id=3, to_location_id=1, distance=2.2),
+        ])
+
+        graph = LocationGraph()
+        with self.assertNumQueries(3):
+            nodes, edges, queries, _ = load_graph(graph, chunk_size=2)
+
+        self.assertEqual((nodes, edges, queries), (4, 2, 3))
+        self.assertEqual(graph.nodes_data[2], {"name": "Primary School", "type": 'facility', "category": 'school'})
+        self.assertEqual(graph.nodes_data[3]["name"], "Home")
+        self.assertEqual(sorted(graph.adj_list[1]), [(2, 1.1), (3, 2.2)])
+        self.assertTrue(graph.reachable(3, 2))
+        self.assertFalse(graph.reachable(3, 4))
+        self.assertTrue(graph.has_reachable_facility(3))
+
+
+class VersionedLRUCacheTests(TestCase):
+    def test_hits_versions_and_eviction(self):
+        cache = VersionedLRUCache(max_size=2)
+        self.assertEqual(cache.get_or_compute('a', 1, lambda: 'a1'), 'a1')
+        self.assertEqual(cache.get_or_compute('a', 1, lambda: 'recomputed'), 'a1')
+        # An entry from an older graph version is a miss
+        self.assertEqual(cache.get_or_compute('a', 2, lambda: 'a2'), 'a2')
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+        cache.get_or_compute('b', 2, lambda: 'b2')
+        cache.get_or_compute('a', 2, lambda: 'unused')
+        cache.get_or_compute('c', 2, lambda: 'c2')
+        # 'b' was least recently used
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get_or_compute('b', 2, lambda: 'b again'), 'b again')
+        self.assertEqual(cache.get_or_compute('c', 2, lambda: 'unused'), 'c2')
+
+    def run_concurrently(self, cache, compute, callers=5):
+        release = threading.Event()
+        results = []
+
+        def leader_compute():
+            release.wait(5)
+            return compute()
+
+        def call():
+            try:
+                results.append(cache.get_or_compute('route', 1, leader_compute))
+            except BaseException as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        # Every caller is either computing or waiting on the one computation
+        while len(cache._in_flight) == 0 or cache.misses < callers:
+            pass
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_concurrent_misses_share_one_computation(self):
+        calls = []
+        cache = VersionedLRUCache()
+        results = self.run_concurrently(cache, lambda: calls.append(1) or 'path')
+        self.assertEqual(results, ['path'] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_failure_reaches_every_waiter(self):
+        class Cancelled(BaseException):
+            pass
+
+        def compute():
+            raise Cancelled()
+
+        cache = VersionedLRUCache()
+        results = self.run_concurrently(cache, compute)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(isinstance(result, Cancelled) for result in results))
+        self.assertEqual(len(cache), 0)
+
+
+class RoadQueryViewTests(TestCase):
+    """
+    A small square of roads with a long spur, from a house at 7001:
+    7001 -1.0- 7002 -1.0- 7004 -5.0- 7005, and 7001 -1.2- 7003 (a school).
+    """
+    def setUp(self):
+        self.client = APIClient()
+        coordinates = {7001: (31.50, 74.30), 7002: (31.50, 74.31), 7003: (31.51, 74.30),
+                       7004: (31.51, 74.31), 7005: (31.55, 74.35)}
+        locations = Location.objects.bulk_create([
+            Location(id=loc_id, name=f"Node {loc_id}", latitude=lat, longitude=lng,
+                     location_type={7001: 'property', 7003: 'facility'}.get(loc_id, 'way_point'))
+            for loc_id, (lat, lng) in coordinates.items()
+        ])
+        Facility.objects.bulk_create([Facility(location_id=7003, name="Corner School", type='school')])
+        self.prop_id = Property.objects.bulk_create([
+            Property(title="Corner House", price=100000, size=100, bedrooms=1, bathrooms=1, location_id_id=7001)
+        ])[0].id
+
+        self.graph = LocationGraph()
+        for location in locations:
+            self.graph.add_location(location)
+        for a, b, distance in [(7001, 7002, 1.0), (7002, 7004, 1.0), (7004, 7005, 5.0), (7001, 7003, 1.2)]:
+            self.graph.add_edge(a, b, distance)
+            self.graph.add_edge(b, a, distance)
+        self.isochrone_cache = VersionedLRUCache()
+        for patcher in (mock.patch('locations.graphs.graph', self.graph),
+                        mock.patch('locations.route_cache.isochrone_cache', self.isochrone_cache)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_matrix_translates_property_sources(self):
+        response = self.client.get('/api/locations/distance-matrix/',
+                                   {'sources': f"{self.prop_id},7002", 'targets': '7004,7005,7003'})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['sources'], [self.prop_id, 7002])
+        self.assertEqual(body['source_locations'], [7001, 7002])
+        self.assertEqual(body['distances'], [[2.0, 7.0, 1.2], [1.0, 6.0, 2.2]])
+
+        posted = self.client.post('/api/locations/distance-matrix/',
+                                  {'sources': [self.prop_id, 7002], 'targets': [7004, 7005, 7003]}, format='json')
+        self.assertEqual(posted.json()['distances'], body['distances'])
+
+    def test_oversized_matrix_is_rejected_before_searching(self):
+        sources = ','.join(str(i) for i in range(1, 102))
+        targets = ','.join(str(i) for i in range(1, MAX_MATRIX_CELLS // 101 + 2))
+        with mock.patch('locations.matrix.distance_matrix') as distance_matrix:
+            response = self.client.get('/api/locations/distance-matrix/', {'sources': sources, 'targets': targets})
+        self.assertEqual(response.status_code, 400)
+        distance_matrix.assert_not_called()
+        self.assertEqual(self.client.get('/api/locations/distance-matrix/', {'sources': '1,x', 'targets': '2'}).status_code, 400)
+
+    def test_isochrone_is_cut_to_the_requested_radius(self):
+        response = self.client.get('/api/locations/isochrone/', {'origin': self.prop_id, 'radius': 1.1})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['origin_location'], 7001)
+        self.assertEqual(body['nodes'], [[7001, 0.0], [7002, 1.0]])
+        self.assertEqual(body['facilities'], [])
+        self.assertEqual([prop['id'] for prop in body['properties']], [self.prop_id])
+        self.assertEqual(len(body['polygon']), 2)
+
+        # The cached 1.25 km bucket holds the school; the response above left it out
+        cached = self.isochrone_cache.get_or_compute((7001, 5), self.graph.version, lambda: self.fail("bucket not cached"))
+        self.assertIn(7003, [node_id for _, node_id, _, _ in cached['nodes']])
+
+    def test_isochrone_hull_and_facilities(self):
+        body = self.client.get('/api/locations/isochrone/', {'origin': 7001, 'radius': 2.5}).json()
+        self.assertEqual([node_id for node_id, _ in body['nodes']], [7001, 7002, 7003, 7004])
+        self.assertEqual(body['facilities'], [{'location_id': 7003, 'name': "Corner School", 'category': 'school', 'distance': 1.2}])
+        # The four corners of the square, counter-clockwise from the south-west
+        self.assertEqual(body['polygon'], [{'lat': 31.50, 'lng': 74.30}, {'lat': 31.50, 'lng': 74.31},
+                                           {'lat': 31.51, 'lng': 74.31}, {'lat': 31.51, 'lng': 74.30}])
+
+    def test_isochrone_rejects_bad_input(self):
+        self.assertEqual(self.client.get('/api/locations/isochrone/', {'origin': 7001, 'radius': 0}).status_code, 400)
+        self.assertEqual(self.client.get('/api/locations/isochrone/', {'origin': 7001, 'radius': 51}).status_code, 400)
+        self.assertEqual(self.client.get('/api/locations/isochrone/', {'origin': 999999}).status_code, 404)
+
+
+class GridIndexTests(TestCase):
+    def setUp(self):
+        rng = random.Random(34)
+        self.points = {item_id: (31.3 + rng.random() * 0.4, 74.1 + rng.random() * 0.4) for item_id in range(300)}
+        self.index = GridIndex(cell_size_deg=0.02)
+        for item_id, (lat, lng) in self.points.items():
+            self.index.insert(item_id, lat, lng)
+        self.queries = [(31.3 + rng.random() * 0.4, 74.1 + rng.random() * 0.4) for _ in range(30)]
+        # Far outside the occupied cells, where nearest() falls back to scanning the buckets
+        self.queries += [(30.0, 73.0), (33.5, 76.2)]
+
+    def distances(self, lat, lng):
+        return sorted((calculate_haversine(lat, lng, *point), item_id) for item_id, point in self.points.items())
+
+    def test_nearest_matches_brute_force(self):
+        for lat, lng in self.queries:
+            best_dist, best_id = self.distances(lat, lng)[0]
+            item_id, dist = self.index.nearest(lat, lng)
+            self.assertEqual(item_id, best_id)
+            self.assertAlmostEqual(dist, best_dist, places=6)
+            self.assertNotEqual(self.index.nearest(lat, lng, exclude=best_id)[0], best_id)
+
+    def test_within_radius_matches_brute_force(self):
+        for lat, lng in self.queries[:10]:
+            expected = [item_id for dist, item_id in self.distances(lat, lng) if dist <= 5.0]
+            found = self.index.within_radius(lat, lng, 5.0)
+            self.assertEqual([item_id for item_id, _ in found], expected)
+
+    def test_removed_and_moved_items(self):
+        for item_id in range(0, 300, 2):
+            self.index.remove(item_id)
+            del self.points[item_id]
+        self.index.insert(1, 31.5, 74.3)
+        self.points[1] = (31.5, 74.3)
+        self.assertEqual(len(self.index), 150)
+        self.assertEqual(self.index.nearest(31.5, 74.3), (1, 0.0))
+        for lat, lng in self.queries:
+            self.assertEqual(self.index.nearest(lat, lng)[0], self.distances(lat, lng)[0][1])
+        self.assertFalse(self.index.remove(0))
+
+    def test_bbox_across_the_antimeridian(self):
+        index = GridIndex()
+        for item_id, (lat, lng) in enumerate([(10, 179.5), (10, -179.5), (10, 0), (30, 179.5)]):
+            index.insert(item_id, lat, lng)
+        self.assertEqual(sorted(index.within_bbox(0, 179, 20, -179)), [0, 1])
+        self.assertEqual(index.within_bbox(0, -179, 20, 179), [2])
+        self.assertEqual(index.within_bbox(20, -180, 0, 180), [])
+
+
+class GeoRTreeTests(TestCase):
+    def rtree_row(self, location_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT min_lat, max_lat, min_lng, max_lng FROM {geo_rtree.RTREE_TABLE} WHERE id = %s", [location_id])
+            return cursor.fetchone()
+
+    def scattered(self, count, first_id=60000):
+        """
+        Locations with ids no other test uses, so coordinates cached by an earlier test never apply.
+        """
+        rng = random.Random(41)
+        locations = Location.objects.bulk_create([
+            Location(id=first_id + index, name=f"Point {index}", latitude=31.3 + rng.random() * 0.4,
+                     longitude=74.1 + rng.random() * 0.4, location_type='way_point')
+            for index in range(count)
+        ])
+        geo_rtree.upsert_many([(location.id, location.latitude, location.longitude) for location in locations])
+        return locations
+
+    def test_location_signals_keep_the_rtree_in_step(self):
+        self.assertTrue(geo_rtree.available())
+        location = Location.objects.create(name="Junction", latitude=31.5, longitude=74.3, location_type='way_point')
+        min_lat, max_lat, min_lng, max_lng = self.rtree_row(location.id)
+        # Stored as float32, rounded outwards
+        self.assertTrue(min_lat <= 31.5 <= max_lat and min_lng <= 74.3 <= max_lng)
+
+        location.latitude, location.longitude = 31.6, 74.4
+        location.save()
+        min_lat, max_lat, min_lng, max_lng = self.rtree_row(location.id)
+        self.assertTrue(min_lat <= 31.6 <= max_lat and min_lng <= 74.4 <= max_lng)
+
+        location_id = location.id
+        location.delete()
+        self.assertIsNone(self.rtree_row(location_id))
+
+    def test_migration_backfills_existing_locations(self):
+        location = Location.objects.bulk_create([Location(name="Old", latitude=31.5, longitude=74.3, location_type='way_point')])[0]
+        self.assertIsNone(self.rtree_row(location.id))
+
+        migration = importlib.import_module('locations.migrations.0007_location_rtree')
+        with connection.cursor() as cursor:
+            migration.create_rtree(None, SimpleNamespace(connection=connection, execute=cursor.execute))
+        self.assertIsNotNone(self.rtree_row(location.id))
+
+    def test_within_radius_and_nearest_match_haversine(self):
+        locations = self.scattered(200)
+        rng = random.Random(38)
+        for _ in range(10):
+            lat, lng = 31.3 + rng.random() * 0.4, 74.1 + rng.random() * 0.4
+            by_distance = sorted((calculate_haversine(lat, lng, loc.latitude, loc.longitude), loc.id) for loc in locations)
+
+            found = geo_rtree.within_radius(lat, lng, 4.0, 'way_point')
+            self.assertEqual([loc_id for loc_id, _ in found], [loc_id for dist, loc_id in by_distance if dist <= 4.0])
+            for (loc_id, dist), (expected, _) in zip(found, by_distance):
+                self.assertAlmostEqual(dist, expected, places=6)
+
+            self.assertEqual(geo_rtree.nearest(lat, lng, 'way_point')[0], by_distance[0][1])
+        self.assertEqual(geo_rtree.within_radius(31.5, 74.3, 50.0, 'facility'), [])
+
+    def test_nearest_across_the_antimeridian(self):
+        west, east = Location.objects.bulk_create([
+            Location(id=61000, name="West", latitude=10.0, longitude=-179.99, location_type='way_point'),
+            Location(id=61001, name="East", latitude=10.0, longitude=179.9, location_type='way_point'),
+        ])
+        geo_rtree.upsert_many([(loc.id, loc.latitude, loc.longitude) for loc in (west, east)])
+        loc_id, dist = geo_rtree.nearest(10.0, 179.97, 'way_point')
+        self.assertEqual(loc_id, west.id)
+        self.assertAlmostEqual(dist, calculate_haversine(10.0, 179.97, 10.0, -179.99), places=6)
+        self.assertEqual([loc_id for loc_id, _ in geo_rtree.within_radius(10.0, 179.97, 10.0)], [west.id, east.id])
+
+    def test_properties_in_bbox_matches_the_memory_index(self):
+        from listing.geo_index import PropertyGeoIndex
+
+        locations = self.scattered(80) + self.scattered(4, first_id=62000)
+        for location, lng in zip(locations[-4:], (179.5, 179.9, -179.8, -179.2)):
+            location.latitude, location.longitude = 10.0, lng
+        Location.objects.bulk_update(locations[-4:], ['latitude', 'longitude'])
+        geo_rtree.upsert_many([(loc.id, loc.latitude, loc.longitude) for loc in locations[-4:]])
+        rng = random.Random(42)
+        Property.objects.bulk_create([
+            Property(title=f"Listing {loc.id}", price=rng.randrange(50, 500) * 1000, size=rng.randrange(50, 300),
+                     bedrooms=1, bathrooms=1, location_id=loc)
+            for loc in locations
+        ])
+        index = PropertyGeoIndex()
+        index.load()
+
+        for box in ((31.4, 74.2, 31.6, 74.4), (31.0, 74.0, 32.0, 75.0), (0.0, 179.7, 20.0, -179.5)):
+            for filters in ({}, {'min_price': 150000, 'max_price': 350000}, {'min_size': 100, 'max_size': 200}):
+                self.assertEqual(geo_rtree.properties_in_bbox(*box, **filters), index.search(*box, **filters))
+        self.assertEqual(len(geo_rtree.properties_in_bbox(0.0, 179.7, 20.0, -179.5)), 2)
+
+
+class HaversineKernelTests(TestCase):
+    def setUp(self):
+        rng = random.Random(28)
+        self.first = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(40)]
+        self.second = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(40)]
+        # Same point, across the antimeridian, pole to pole and near-antipodal pairs
+        self.first += [(31.5, 74.3), (10.0, 179.9), (90.0, 0.0), (0.0, 0.0)]
+        self.second += [(31.5, 74.3), (10.0, -179.9), (-90.0, 0.0), (0.0, 179.999)]
+
+    @staticmethod
+    def radians(points):
+        return [math.radians(lat) for lat, _ in points], [math.radians(lng) for _, lng in points]
+
+    def assertClose(self, actual, expected):
+        # A micrometre, and relative error for the half-circumference pairs
+        self.assertLessEqual(abs(actual - expected), 1e-9 + 1e-12 * expected)
+
+    def test_one_to_many(self):
+        lats, lngs = self.radians(self.second)
+        for lat, lng in self.first:
+            distances = haversine_one_to_many(math.radians(lat), math.radians(lng), lats, lngs)
+            for distance, (other_lat, other_lng) in zip(distances, self.second):
+                self.assertClose(distance, calculate_haversine(lat, lng, other_lat, other_lng))
+
+    def test_pairwise(self):
+        distances = haversine_pairwise(*self.radians(self.first), *self.radians(self.second))
+        self.assertEqual(distances.shape, (len(self.first),))
+        for distance, (lat1, lng1), (lat2, lng2) in zip(distances, self.first, self.second):
+            self.assertClose(distance, calculate_haversine(lat1, lng1, lat2, lng2))
+        self.assertEqual(distances[-4], 0.0)
+
+    def test_many_to_many(self):
+        matrix = haversine_many_to_many(*self.radians(self.first), *self.radians(self.second[:7]))
+        self.assertEqual(matrix.shape, (len(self.first), 7))
+        for row, (lat1, lng1) in zip(matrix, self.first):
+            for distance, (lat2, lng2) in zip(row, self.second):
+                self.assertClose(distance, calculate_haversine(lat1, lng1, lat2, lng2))
+
+
+class ConvexHullTests(TestCase):
+    @staticmethod
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    def test_hull_encloses_every_point(self):
+        rng = random.Random(34)
+        for _ in range(20):
+            points = [(rng.randint(0, 30), rng.randint(0, 30)) for _ in range(rng.randint(3, 60))]
+            hull = convex_hull(points)
+            self.assertTrue(set(hull) <= set(points))
+            if len(hull) < 3:
+                continue
+            edges = list(zip(hull, hull[1:] + hull[:1]))
+            # Strictly counter-clockwise corners, and nothing outside any edge
+            for (a, b), c in zip(edges, hull[2:] + hull[:2]):
+                self.assertGreater(self.cross(a, b, c), 0)
+            for point in points:
+                self.assertTrue(all(self.cross(a, b, point) >= 0 for a, b in edges))
+            # Each vertex is a real corner: dropping it from the input changes the hull
+            for vertex in hull:
+                rest = [point for point in points if point != vertex]
+                self.assertNotEqual(sorted(convex_hull(rest)), sorted(hull))
+
+    def test_degenerate_inputs(self):
+        self.assertEqual(convex_hull([]), [])
+        self.assertEqual(convex_hull([(1, 1), (1, 1)]), [(1, 1)])
+        self.assertEqual(convex_hull([(2, 2), (0, 0), (1, 1)]), [(0, 0), (2, 2)])
+        square = [(0, 0), (2, 0), (2, 2), (0, 2), (1, 1), (1, 0), (0, 0)]
+        self.assertEqual(convex_hull(square), [(0, 0), (2, 0), (2, 2), (0, 2)])
+
+
+class SimilarityGraphTests(TestCase):
+    @staticmethod
+    def pairwise_edges(properties):
+        """
+        The threshold test of the original O(n²) generate_similarity_graph.
+        """
+        edges = set()
+        for id1, price1, size1 in properties:
+            for id2, price2, size2 in properties:
+                if id1 != id2 and abs(price1 - price2) / price1 <= 0.015 and abs(size1 - size2) / size1 <= 0.01:
+                    edges.add(frozenset((id1, id2)))
+        return edges
+
+    @staticmethod
+    def graph_edges(graph):
+        return {frozenset((a, b)) for a, neighbors in graph.adj_list.items() for b in neighbors}
+
+    def test_windows_find_the_same_neighbours_as_the_pairwise_test(self):
+        rng = random.Random(43)
+        # Tight price and size steps put many pairs right at the tolerance boundaries
+        properties = [(prop_id, float(100000 + 500 * rng.randrange(20)), float(100 + rng.randrange(6)))
+                      for prop_id in range(1, 301)]
+        properties += [(prop_id, float(rng.randrange(1, 10 ** 7)), float(rng.randrange(1, 5000))) for prop_id in range(301, 501)]
+        graph = RecomendationGraph()
+        for prop_id, price, size in properties:
+            graph.add_property(prop_id, price, size)
+        expected = self.pairwise_edges(properties)
+        self.assertGreater(len(expected), 1000)
+        self.assertEqual(self.graph_edges(graph), expected)
+
+        # Updates and removals leave the graph as if built from the remaining properties
+        for prop_id in range(1, 501, 5):
+            graph.remove_property(prop_id)
+        moved = [(prop_id, float(100000 + 500 * rng.randrange(20)), float(100 + rng.randrange(6))) for prop_id in range(2, 501, 7)]
+        for prop_id, price, size in moved:
+            graph.add_property(prop_id, price, size)
+        current = {prop_id: (prop_id, price, size) for prop_id, price, size in properties if prop_id % 5 != 1}
+        current.update((prop_id, (prop_id, price, size)) for prop_id, price, size in moved)
+        self.assertEqual(self.graph_edges(graph), self.pairwise_edges(list(current.values())))
+
+
+class FeatureKNNTests(TestCase):
+    def setUp(self):
+        rng = random.Random(44)
+        # Neighbourhoods of similar listings, so there is structure for IVF to find
+        centres = [(rng.randrange(5, 100) * 10000, rng.randrange(50, 400), rng.randrange(1, 6), 31.3 + rng.random() * 0.4,
+                    74.1 + rng.random() * 0.4) for _ in range(30)]
+        self.raw = {}
+        for prop_id in range(1, 1501):
+            price, size, bedrooms, lat, lng = rng.choice(centres)
+            self.raw[prop_id] = raw_features(
+                price * rng.uniform(0.9, 1.1), size * rng.uniform(0.9, 1.1), bedrooms + rng.randrange(-1, 2),
+                rng.randrange(1, 4), rng.randrange(1, 3), lat + rng.gauss(0, 0.01), lng + rng.gauss(0, 0.01),
+                [rng.randrange(4) for _ in FACILITY_CATEGORIES]
+            )
+        self.index = PropertyFeatureIndex()
+        self.index.build(list(self.raw), np.array(list(self.raw.values())))
+
+    def brute_force(self, prop_id, k, metric):
+        """
+        Nearest live properties computed straight from the raw rows, in float64.
+        """
+        ids = [other for other in self.raw if other != prop_id]
+        vectors = (np.array([self.raw[other] for other in ids]) - self.index.mean) / self.index.scale * self.index.weights
+        query = (np.array(self.raw[prop_id]) - self.index.mean) / self.index.scale * self.index.weights
+        if metric == 'cosine':
+            distances = 1.0 - vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+        else:
+            distances = np.linalg.norm(vectors - query, axis=1)
+        best = np.argsort(distances, kind='stable')[:k]
+        return [(ids[i], float(distances[i])) for i in best]
+
+    def assertMatchesBruteForce(self, prop_ids, k=10):
+        for metric in ('cosine', 'euclidean'):
+            for prop_id, found in zip(prop_ids, self.index.similar_batch(prop_ids, k, metric, exact=True)):
+                expected = self.brute_force(prop_id, k, metric)
+                self.assertEqual(len(found), len(expected))
+                # float32 storage can swap near-ties, so distances are compared in order and ids as a set
+                for (_, found_dist), (_, expected_dist) in zip(found, expected):
+                    self.assertAlmostEqual(found_dist, expected_dist, delta=1e-4 * max(1.0, expected_dist))
+                self.assertGreaterEqual(len({i for i, _ in found} & {i for i, _ in expected}), k - 1)
+
+    def test_exact_scan_matches_both_metrics(self):
+        self.assertMatchesBruteForce(list(range(1, 1501, 97)))
+        self.assertEqual(self.index.similar(999999, 5), [])
+        with self.assertRaises(ValueError):
+            self.index.similar(1, 5, metric='manhattan')
+
+    def test_ivf_recall_against_the_exact_scan(self):
+        queries = list(range(1, 1501, 15))
+        for metric in ('cosine', 'euclidean'):
+            exact = self.index.similar_batch(queries, 10, metric, exact=True)
+            approximate = self.index.similar_batch(queries, 10, metric, exact=False)
+            hits = sum(len({i for i, _ in a} & {i for i, _ in e}) for a, e in zip(approximate, exact))
+            self.assertGreaterEqual(hits / (10 * len(queries)), 0.9, metric)
+
+        # Rows added after the IVF build are filed under a centroid and found
+        twin = list(self.raw[7])
+        self.index.insert(5000, twin)
+        self.raw[5000] = twin
+        for metric in ('cosine', 'euclidean'):
+            nearest_id, distance = self.index.similar(7, 1, metric, exact=False)[0]
+            self.assertEqual((nearest_id, round(distance, 4)), (5000, 0.0))
+
+    def test_tombstones_and_compaction(self):
+        removed = list(range(1, 1501, 3))
+        for prop_id in removed:
+            self.assertTrue(self.index.remove_property(prop_id))
+            del self.raw[prop_id]
+        self.assertFalse(self.index.remove_property(1))
+        # A third is dead: still tombstoned in place
+        self.assertEqual((self.index.size, self.index.dead, len(self.index)), (1500, 500, 1000))
+        for found in self.index.similar_batch(list(range(2, 1501, 50)), 20, 'euclidean', exact=True):
+            self.assertFalse({prop_id for prop_id, _ in found} & set(removed))
+        self.assertMatchesBruteForce(list(range(2, 1501, 150)))
+
+        for prop_id in range(2, 800, 3):
+            self.index.remove_property(prop_id)
+            del self.raw[prop_id]
+        # Past half dead the matrix was rewritten with only the live rows; later removals tombstone again
+        self.assertLess(self.index.size, 1000)
+        self.assertEqual(self.index.size - self.index.dead, len(self.raw))
+        self.assertEqual(len(self.index.rows), len(self.raw))
+        self.assertEqual(self.index.vectors.shape[1], len(FEATURES))
+        self.assertMatchesBruteForce(list(range(3, 1501, 150)))
+
+        # Re-inserting an id moves it rather than duplicating it
+        self.index.insert(3, self.raw[6])
+        self.raw[3] = self.raw[6]
+        self.assertEqual(len(self.index), len(self.raw))
+        self.assertEqual(self.index.similar(6, 1, 'euclidean', exact=True)[0][0], 3)
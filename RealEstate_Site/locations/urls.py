@@ -1,10 +1,13 @@
 from django.urls import path
-from .views import get_nearby_facilities,get_shortest_path_distance, get_similar_recomendations,get_largest_sizes,get_top_cheepest,get_all_facilities,bulk_add_waypoints, bulk_connection_upload, bulk_add_facilities
+from .views import get_nearby_facilities,get_shortest_path_distance, get_similar_recomendations,get_largest_sizes,get_top_cheepest,get_all_facilities,bulk_add_waypoints, bulk_connection_upload, bulk_add_facilities, get_distance_matrix, get_isochrone, get_component_report
 
 
 urlpatterns = [
     path('nearby/<int:prop_id>/', get_nearby_facilities, name='nearby-facilities'),
     path('shortest-path/',get_shortest_path_distance, name= 'shortest-path'),
+    path('distance-matrix/',get_distance_matrix, name= 'distance-matrix'),
+    path('isochrone/',get_isochrone, name= 'isochrone'),
+    path('components/',get_component_report, name= 'component-report'),
     path('recommendations/<int:prop_id>/',get_similar_recomendations, name= 'similar-properties'),
     path('k-cheapest/',get_top_cheepest, name= 'cheap-properties'),
     path('k-largest/',get_largest_sizes, name= 'large-properties'),
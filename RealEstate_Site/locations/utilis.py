@@ -1,4 +1,6 @@
 import math
+import numpy as np
+
 def calculate_haversine(lat1, lon1, lat2, lon2):
     R = 6371.0 
     
@@ -14,3 +16,77 @@ def calculate_haversine(lat1, lon1, lat2, lon2):
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
     
     return R * c
+
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_one_to_many(lat_rad, lng_rad, lats_rad, lngs_rad):
+    """
+    Distances (km) from one point to many. All inputs in radians.
+    """
+    lats_rad = np.asarray(lats_rad, dtype=np.float64)
+    lngs_rad = np.asarray(lngs_rad, dtype=np.float64)
+
+    a = np.sin((lats_rad - lat_rad) / 2.0) ** 2 + \
+        math.cos(lat_rad) * np.cos(lats_rad) * \
+        np.sin((lngs_rad - lng_rad) / 2.0) ** 2
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_pairwise(lats1_rad, lngs1_rad, lats2_rad, lngs2_rad):
+    """
+    Element-wise distances (km) between two equally sized arrays of points (radians).
+    """
+    lats1_rad = np.asarray(lats1_rad, dtype=np.float64)
+    lats2_rad = np.asarray(lats2_rad, dtype=np.float64)
+
+    a = np.sin((lats2_rad - lats1_rad) / 2.0) ** 2 + \
+        np.cos(lats1_rad) * np.cos(lats2_rad) * \
+        np.sin((np.asarray(lngs2_rad) - np.asarray(lngs1_rad)) / 2.0) ** 2
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_many_to_many(lats1_rad, lngs1_rad, lats2_rad, lngs2_rad):
+    """
+    Distance matrix (km) of shape (len(points1), len(points2)). All inputs in radians.
+    """
+    lats1 = np.asarray(lats1_rad, dtype=np.float64)[:, None]
+    lngs1 = np.asarray(lngs1_rad, dtype=np.float64)[:, None]
+    lats2 = np.asarray(lats2_rad, dtype=np.float64)[None, :]
+    lngs2 = np.asarray(lngs2_rad, dtype=np.float64)[None, :]
+
+    a = np.sin((lats2 - lats1) / 2.0) ** 2 + \
+        np.cos(lats1) * np.cos(lats2) * \
+        np.sin((lngs2 - lngs1) / 2.0) ** 2
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def convex_hull(points):
+    """
+    Andrew's monotone chain. points: [(x, y), ...]
+    Returns the hull vertices counter-clockwise, without repeating the first one.
+    """
+    points = sorted(set(points))
+    if len(points) <= 2:
+        return points
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower = []
+    for p in points:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+
+    upper = []
+    for p in reversed(points):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+
+    return lower[:-1] + upper[:-1]
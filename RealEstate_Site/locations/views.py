@@ -1,12 +1,13 @@
-from rest_framework.decorators import api_view
+import math
+from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
 from listing.models import Property
 from listing.serializers import PropertySerializer
 from .models import Facility, Location, WayPoint,Connection
-from .serializers import FacilitySerializer, BulkFacilitySerializer, ConnectionBulkSerializer
-from django.db import transaction
+from .serializers import FacilitySerializer
 from django.shortcuts import get_object_or_404
+from users.permissions import IsAdminRole
 
 @api_view(['GET'])
 def get_nearby_facilities(request, prop_id):
@@ -22,14 +23,37 @@ def get_nearby_facilities(request, prop_id):
         if not graph:
             return Response({"error": "Graph not initialized"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
+        from .facility_table import nearest_facilities
+        nearest = nearest_facilities.nearest_for(start_location_id)
+
+        # nearest_only=true answers from the precomputed table without walking the graph
+        if request.query_params.get('nearest_only') == 'true':
+            return Response({
+                "property_name": target_property.title,
+                "nearest": nearest
+            }, status=status.HTTP_200_OK)
+
         max_dist = float(request.query_params.get('radius', 5.0))
-        nearby_facilities = graph.bfs_nearby_facilities(start_location_id, max_dist)
+
+        # Road distance is never shorter than straight-line distance, so only facilities
+        # inside the radius as the crow flies can be found; the search stops once all are seen
+        from . import geo_rtree
+        candidates = None
+        if geo_rtree.available():
+            start_location = target_property.location_id
+            candidates = {
+                loc_id for loc_id, _ in
+                geo_rtree.within_radius(start_location.latitude, start_location.longitude, max_dist + 1e-6, 'facility')
+            }
+
+        nearby_facilities = graph.bfs_nearby_facilities(start_location_id, max_dist, candidates)
 
         return Response({
             "property_name": target_property.title,
             "search_radius": {max_dist},
             "total_found": len(nearby_facilities),
-            "facilities": nearby_facilities
+            "facilities": nearby_facilities,
+            "nearest": nearest
         }, status=status.HTTP_200_OK)
 
     except Exception as e:
@@ -44,6 +68,40 @@ def get_all_facilities(request):
 
 
 
+def resolve_location_ids(raw_ids):
+    """
+    Ids that belong to a Property are translated to that property's Location ID;
+    anything else is taken to be a raw Location ID already. One query for the batch.
+    Format: {raw_id: location_id}
+    """
+    property_locations = dict(Property.objects.filter(id__in=set(raw_ids)).values_list('id', 'location_id'))
+    return {raw_id: property_locations.get(raw_id, raw_id) for raw_id in raw_ids}
+
+
+def _parse_id_list(value):
+    if isinstance(value, list):
+        return [int(item) for item in value]
+    return [int(item) for item in str(value).split(',') if item.strip()]
+
+
+def _coordinates_for(location_ids):
+    """
+    Coordinates from the in-memory node table; ids it has not seen yet are loaded once and registered.
+    Format: {location_id: {"location_id", "lat", "lng"}}
+    """
+    from .coordinates import coordinate_registry
+    missing_ids = [node_id for node_id in location_ids if node_id not in coordinate_registry]
+    if missing_ids:
+        coordinate_registry.add_many(Location.objects.filter(id__in=missing_ids).values_list('id', 'latitude', 'longitude'))
+
+    loc_map = {}
+    for node_id in location_ids:
+        coords = coordinate_registry.get(node_id)
+        if coords:
+            loc_map[node_id] = {"location_id": node_id, "lat": coords[0], "lng": coords[1]}
+    return loc_map
+
+
 @api_view(['GET'])
 def get_shortest_path_distance(request):
     from_id = request.query_params.get('from_id')
@@ -59,31 +117,8 @@ def get_shortest_path_distance(request):
         from_id = int(from_id)
         to_id = int(to_id)
 
-        # --- SMART LOGIC START ---
-        # 1. Try to interpret 'from_id' as a Property ID first
-        try:
-            # We look for a property with this ID (e.g., 77)
-            property_obj = Property.objects.get(id=from_id)
-            
-            # If found, we swap '77' for the actual Location ID (e.g., 12356291518)
-            # Using the same field access pattern found in your 'get_nearby_facilities' view:
-            if hasattr(property_obj, 'location_id'):
-                # Checks if it's an object or an ID. 
-                # If your model field is named 'location_id', this gets the object, then .id gets the int
-                if hasattr(property_obj.location_id, 'id'):
-                    from_id = property_obj.location_id.id
-                else:
-                    # Fallback if it was just an ID
-                    from_id = property_obj.location_id
-            elif hasattr(property_obj, 'location'):
-                 from_id = property_obj.location.id
-                 
-            print(f"DEBUG: Translated Property ID {request.query_params.get('from_id')} to Location ID {from_id}")
-
-        except Property.DoesNotExist:
-            # It wasn't a Property ID, so it must be a raw Location ID already.
-            pass
-        # --- SMART LOGIC END ---
+        # Try to interpret 'from_id' as a Property ID first and swap in its Location ID
+        from_id = resolve_location_ids([from_id])[from_id]
         
         from .graphs import graph
 
@@ -92,8 +127,19 @@ def get_shortest_path_distance(request):
                 {"error": "Graph is not initialized"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+        # Different components can never be joined, so skip the search entirely
+        if not graph.reachable(from_id, to_id):
+            return Response(
+                {"error": "No path exists between these locations"}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
             
-        result = graph.dijkstra_shortest_path(from_id, to_id)
+        from .route_cache import route_cache
+        result = route_cache.get_or_compute(
+            (from_id, to_id), graph.version,
+            lambda: graph.dijkstra_shortest_path(from_id, to_id)
+        )
         distance = result['distance']
         path_ids = result['path']
 
@@ -108,8 +154,7 @@ def get_shortest_path_distance(request):
             for i in range(len(path_ids) - 1)
         ]
         
-        loc_objs = Location.objects.filter(id__in=path_ids)
-        loc_map = {loc.id: {"location_id": loc.id,"lat": loc.latitude, "lng": loc.longitude} for loc in loc_objs}
+        loc_map = _coordinates_for(path_ids)
         
         # Ensure strict ordering of coordinates matching the path
         coordinates = []
@@ -136,29 +181,259 @@ def get_shortest_path_distance(request):
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
         
+MAX_MATRIX_CELLS = 10000
+
+@api_view(['GET', 'POST'])
+def get_distance_matrix(request):
+    """
+    GET ?sources=1,2&targets=3,4 or POST {"sources": [...], "targets": [...]}
+    Sources may be Property IDs, exactly like from_id in shortest-path/.
+    """
+    params = request.data if request.method == 'POST' else request.query_params
+
+    try:
+        sources = _parse_id_list(params.get('sources', ''))
+        targets = _parse_id_list(params.get('targets', ''))
+    except (TypeError, ValueError):
+        return Response({"error": "sources and targets must be lists of integer IDs"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not sources or not targets:
+        return Response({"error": "Please provide both sources and targets"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if len(sources) * len(targets) > MAX_MATRIX_CELLS:
+        return Response({"error": f"Matrix too large, at most {MAX_MATRIX_CELLS} cells"}, status=status.HTTP_400_BAD_REQUEST)
+
+    translated = resolve_location_ids(sources)
+    source_locations = [translated[source] for source in sources]
+
+    from .matrix import distance_matrix
+    distances = distance_matrix(source_locations, targets)
+
+    return Response({
+        "sources": sources,
+        "source_locations": source_locations,
+        "targets": targets,
+        "distances": distances,
+        "unit": "kilometers"
+    }, status=status.HTTP_200_OK)
+
+
+ISOCHRONE_BUCKET_KM = 0.25
+MAX_ISOCHRONE_KM = 50.0
+
+def _build_isochrone(origin_id, radius_km):
+    """
+    Everything within radius_km, each list sorted by distance so a smaller radius is a prefix.
+    Format: {"nodes": [(distance, node_id, lng, lat), ...], "facilities": [...], "properties": [...]}
+    """
+    from .graphs import graph
+
+    reachable = graph.dijkstra_distances(origin_id, max_distance=radius_km)
+    loc_map = _coordinates_for(list(reachable))
+
+    facilities = []
+    property_locations = []
+    for node_id, dist in reachable.items():
+        node = graph.nodes_data.get(node_id, {})
+        if node.get('type') == 'facility':
+            facilities.append({
+                "location_id": node_id,
+                "name": node['name'],
+                "category": node['category'],
+                "distance": dist
+            })
+        elif node.get('type') == 'property':
+            property_locations.append(node_id)
+
+    properties = [
+        {"id": prop_id, "title": title, "location_id": loc_id, "distance": reachable[loc_id]}
+        for prop_id, title, loc_id in Property.objects.filter(location_id__in=property_locations).values_list('id', 'title', 'location_id')
+    ]
+
+    nodes = sorted(
+        (dist, node_id, loc_map[node_id]["lng"], loc_map[node_id]["lat"]) if node_id in loc_map else (dist, node_id, None, None)
+        for node_id, dist in reachable.items()
+    )
+
+    return {
+        "nodes": nodes,
+        "facilities": sorted(facilities, key=lambda f: f["distance"]),
+        "properties": sorted(properties, key=lambda p: p["distance"])
+    }
+
+
+def _isochrone_within(isochrone, radius_km):
+    """
+    Cuts a cached bucket-sized isochrone down to the requested radius and rounds it for the response.
+    """
+    from .utilis import convex_hull
+
+    nodes = [node for node in isochrone["nodes"] if node[0] <= radius_km]
+    hull = convex_hull([(lng, lat) for _, _, lng, lat in nodes if lng is not None])
+
+    return {
+        "nodes": [[node_id, round(dist, 2)] for dist, node_id, _, _ in nodes],
+        "facilities": [
+            {**facility, "distance": round(facility["distance"], 2)}
+            for facility in isochrone["facilities"] if facility["distance"] <= radius_km
+        ],
+        "properties": [
+            {**prop, "distance": round(prop["distance"], 2)}
+            for prop in isochrone["properties"] if prop["distance"] <= radius_km
+        ],
+        "polygon": [{"lat": lat, "lng": lng} for lng, lat in hull]
+    }
+
+
+@api_view(['GET'])
+def get_isochrone(request):
+    """
+    ?origin=<property or location id>&radius=<km>
+    Everything reachable by road within the radius. Results are cached per 250 m bucket
+    (the radius rounded up) and cut down to the requested radius on the way out.
+    """
+    try:
+        origin = int(request.query_params.get('origin'))
+        radius = float(request.query_params.get('radius', 3.0))
+    except (TypeError, ValueError):
+        return Response({"error": "origin must be an integer and radius a number"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not 0 < radius <= MAX_ISOCHRONE_KM:
+        return Response({"error": f"radius must be between 0 and {MAX_ISOCHRONE_KM} km"}, status=status.HTTP_400_BAD_REQUEST)
+
+    from .graphs import graph
+    from .route_cache import isochrone_cache
+
+    origin_id = resolve_location_ids([origin])[origin]
+    if origin_id not in graph.adj_list:
+        return Response({"error": "Origin is not part of the road network"}, status=status.HTTP_404_NOT_FOUND)
+
+    bucket = math.ceil(radius / ISOCHRONE_BUCKET_KM)
+    bucket_radius = bucket * ISOCHRONE_BUCKET_KM
+    isochrone = isochrone_cache.get_or_compute(
+        (origin_id, bucket), graph.version,
+        lambda: _build_isochrone(origin_id, bucket_radius)
+    )
+
+    return Response({
+        "origin": origin,
+        "origin_location": origin_id,
+        "radius_km": radius,
+        **_isochrone_within(isochrone, radius),
+        "unit": "kilometers"
+    }, status=status.HTTP_200_OK)
+
+
+MAX_REPORTED_MEMBERS = 50
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminRole])
+def get_component_report(request):
+    """
+    Road-network components other than the main one, largest first.
+    Each lists up to MAX_REPORTED_MEMBERS of its locations.
+    """
+    from .graphs import graph
+
+    if graph.components.dirty:
+        graph.components.build(graph)
+
+    components = sorted(graph.components.components().values(), key=len, reverse=True)
+    main = components[0] if components else []
+
+    isolated = []
+    for members in components[1:]:
+        members.sort()
+        isolated.append({
+            "component_id": graph.components.component_id(members[0]),
+            "size": len(members),
+            "facilities": graph.components.facility_count(members[0]),
+            "locations": [
+                {
+                    "location_id": loc_id,
+                    "name": graph.nodes_data.get(loc_id, {}).get('name', 'Unknown'),
+                    "type": graph.nodes_data.get(loc_id, {}).get('type')
+                }
+                for loc_id in members[:MAX_REPORTED_MEMBERS]
+            ]
+        })
+
+    return Response({
+        "total_locations": len(graph.adj_list),
+        "total_components": len(components),
+        "main_component_size": len(main),
+        "isolated_locations": len(graph.adj_list) - len(main),
+        "isolated_components": isolated
+    }, status=status.HTTP_200_OK)
+
+        
+RECOMMENDATION_MODES = ('graph', 'knn', 'description')
+DEFAULT_RECOMMENDATIONS = 20
+# Score shown with each recommendation, per mode
+SCORE_FIELDS = {'knn': 'distance', 'description': 'similarity'}
+
+
 @api_view(['GET'])
 def get_similar_recomendations(request,prop_id):
+    """
+    ?mode=graph (default): BFS over the price/size similarity graph.
+    ?mode=knn: nearest neighbours in feature space, with ?metric=cosine|euclidean.
+    ?mode=description: listings whose description is most alike (MinHash estimate).
+    Lists are precomputed by the background refresher; "computed_at" says how old this one is.
+    Returns the best ?limit (default DEFAULT_RECOMMENDATIONS, at most PRECOMPUTED_K); graph mode
+    used to return the whole BFS component, which is no longer available past PRECOMPUTED_K.
+    """
+    from .feature_knn import METRICS
+    from listing.recommendations import (
+        stored_recommendations, compute, recommendation_refresher, PRECOMPUTED_K
+    )
+
+    mode = request.query_params.get('mode', 'graph')
+    metric = request.query_params.get('metric', 'cosine')
+    if mode not in RECOMMENDATION_MODES:
+        return Response({"error": f"mode must be one of {', '.join(RECOMMENDATION_MODES)}"}, status=status.HTTP_400_BAD_REQUEST)
+    if metric not in METRICS:
+        return Response({"error": f"metric must be one of {', '.join(METRICS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
     try:
-        target_property = Property.objects.get(id=prop_id)
-        all_properties = Property.objects.all()
-    except Property.DoesNotExist:
+        limit = request.query_params.get('limit')
+        limit = int(limit) if limit else DEFAULT_RECOMMENDATIONS
+    except ValueError:
+        return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+    limit = max(1, min(limit, PRECOMPUTED_K))
+
+    source = f'knn_{metric}' if mode == 'knn' else mode
+    hits, computed_at = stored_recommendations(prop_id, source)
+    computed_now = hits is None
+    if computed_now:
+        # Not stored yet (new listing, or no worker running): compute this once and queue it,
+        # but only for a listing that exists, so unknown ids cost one indexed lookup
+        if not Property.objects.filter(id=prop_id).exists():
+            return Response({"error": "Property not found"}, status=status.HTTP_404_NOT_FOUND)
+        hits = compute(source, prop_id)
+    hits = hits[:limit]
+
+    # The target and every recommendation in one query, kept in ranked order
+    found = Property.objects.select_related('location_id').in_bulk([prop_id] + [sid for sid, _ in hits])
+    target_property = found.get(prop_id)
+    if target_property is None:
         return Response({"error": "Property not found"}, status=status.HTTP_404_NOT_FOUND)
-    
-    from .graphs import RecomendationGraph
-    recommended = RecomendationGraph()
-    recommended.generate_similarity_graph(all_properties)
-    similar_ids = recommended.bfs_traversal(prop_id)
-    
-    results = []
-    for sid in similar_ids:
-        p = Property.objects.get(id=sid)
-        results.append(p)
-        
-    serialized = PropertySerializer(results,many=True)
+    if computed_now:
+        recommendation_refresher.mark([prop_id])
+
+    ranked = [(found[sid], score) for sid, score in hits if sid in found]
+    serialized = PropertySerializer([prop for prop, _ in ranked], many=True)
+    score_field = SCORE_FIELDS.get(mode)
+    if score_field:
+        for item, (_, score) in zip(serialized.data, ranked):
+            item[score_field] = round(score, 4)
 
     return Response({
         "target_property": target_property.title,
-        "recommendations": serialized.data
+        "recommendations": serialized.data,
+        "computed_at": computed_at,
+        "stale": computed_now or recommendation_refresher.is_pending(prop_id)
     }, status=status.HTTP_200_OK)
     
 @api_view(['GET'])
@@ -224,24 +499,18 @@ def get_largest_sizes(request):
 @api_view(['POST'])
 def bulk_add_waypoints(request):
     waypoint_data_list = request.data  
+
+    if not isinstance(waypoint_data_list, list):
+        return Response({"error": "Expected a list of waypoint objects"}, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        with transaction.atomic():  
-            for item in waypoint_data_list:
-                loc = Location.objects.create(
-                    id=item['id'],
-                    name=item['name'],
-                    latitude=item['lat'],
-                    longitude=item['long'],
-                    location_type='way_point'
-                )
-                
-                WayPoint.objects.create(
-                    location=loc,
-                    node_type=item['waypoint_type']
-                )
+        from .bulk import load_waypoints
+        chunks = load_waypoints(waypoint_data_list)
                 
-        return Response({"message": f"Successfully added {len(waypoint_data_list)} waypoints"}, status=201)
+        return Response({
+            "message": f"Successfully added {len(waypoint_data_list)} waypoints",
+            "chunks": chunks
+        }, status=201)
     
     except Exception as e:
         return Response({"error": str(e)}, status=400)
@@ -249,25 +518,12 @@ def bulk_add_waypoints(request):
 @api_view(['POST'])
 def bulk_connection_upload(request):
     data = request.data
-    errors = []
-    created_count = 0
-
-    for item in data:
-        serializer = ConnectionBulkSerializer(data=item)
-        if serializer.is_valid():
-            # get_or_create logic inside the loop
-            from_loc = serializer.validated_data['from_location']
-            to_loc = serializer.validated_data['to_location']
-            
-            obj, created = Connection.objects.get_or_create(
-                from_location=from_loc,
-                to_location=to_loc
-            )
-            if created:
-                created_count += 1
-        else:
-            # This will tell you exactly which ID (from or to) failed validation
-            errors.append({"data": item, "error": serializer.errors})
+
+    if not isinstance(data, list):
+        return Response({"error": "Expected a list of connection objects"}, status=status.HTTP_400_BAD_REQUEST)
+
+    from .bulk import ingest_connections
+    created_count, errors = ingest_connections(data)
 
     return Response({"created": created_count, "errors": errors}, status=201)
  
@@ -278,23 +534,14 @@ def bulk_add_facilities(request):
     if not isinstance(data, list):
         return Response({"error": "Expected a list of facility objects"}, status=status.HTTP_400_BAD_REQUEST)
 
-    created_facilities = []
-    
     try:
-        with transaction.atomic():
-            for item in data:
-                serializer = BulkFacilitySerializer(data=item)
-                if serializer.is_valid():
-                    new_facility = serializer.save()
-                    
-                    
-                    created_facilities.append(serializer.data)
-                else:
-                    raise ValueError(f"Error in {item.get('name')}: {serializer.errors}")
+        from .bulk import load_facilities
+        chunks = load_facilities(data)
 
         return Response({
-            "message": f"Successfully added {len(created_facilities)} facilities and updated road network.",
-            "count": len(created_facilities)
+            "message": f"Successfully added {len(data)} facilities and updated road network.",
+            "count": len(data),
+            "chunks": chunks
         }, status=status.HTTP_201_CREATED)
 
     except Exception as e:
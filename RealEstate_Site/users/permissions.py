@@ -3,4 +3,12 @@ from rest_framework import permissions
 class IsAdminRole(permissions.BasePermission):
 
     def has_permission(self, request, view):
-        return bool(request.user and request.user.is_authenticated and request.user.role == 'admin')
\ No newline at end of file
+        return bool(request.user and request.user.is_authenticated and request.user.role == 'admin')
+
+class IsAgentOrAdmin(permissions.BasePermission):
+
+    def has_permission(self, request, view):
+        return bool(
+            request.user and request.user.is_authenticated
+            and (request.user.is_agent or request.user.role == 'admin')
+        )
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import random
+
+# Add the project directory to the path
+sys.path.insert(0, os.path.join(os.getcwd(), 'RealEstate_Site'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'RealEstate_Site.settings')
+
+import django
+django.setup()
+
+from locations.graphs import LocationGraph
+from locations.loader import load_graph
+
+QUERIES = 100
+NEARBY_RADIUS_KM = 3.0
+
+# Synthetic fallback: GRID x GRID intersections, each road segment drawn as a chain of waypoints
+GRID = 40
+POINTS_PER_ROAD = 8
+FACILITY_EVERY = 25
+
+
+def graph_from_db():
+    graph = LocationGraph()
+    try:
+        load_graph(graph)
+    except Exception as e:
+        print(f"Could not load the location graph from the database ({e})")
+        return None
+    return graph if graph.adj_list else None
+
+
+def synthetic_graph():
+    random.seed(11)
+    graph = LocationGraph()
+    next_id = GRID * GRID
+
+    for i in range(GRID * GRID):
+        graph.add_node(i, f"junction {i}", 'way_point')
+
+    def road(a, b):
+        nonlocal next_id
+        prev = a
+        for _ in range(POINTS_PER_ROAD):
+            graph.add_node(next_id, f"point {next_id}", 'way_point')
+            graph.add_edge(prev, next_id, random.uniform(0.02, 0.08))
+            prev = next_id
+            next_id += 1
+        graph.add_edge(prev, b, random.uniform(0.02, 0.08))
+
+    for r in range(GRID):
+        for c in range(GRID):
+            if c + 1 < GRID:
+                road(r * GRID + c, r * GRID + c + 1)
+            if r + 1 < GRID:
+                road(r * GRID + c, (r + 1) * GRID + c)
+
+    road_nodes = list(graph.adj_list)
+    for anchor in road_nodes[::FACILITY_EVERY]:
+        graph.add_node(next_id, f"facility {next_id}", 'facility', random.choice(['school', 'hospital', 'park']))
+        graph.add_edge(anchor, next_id, random.uniform(0.05, 0.3))
+        next_id += 1
+
+    return graph
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    results = [fn(*item) for item in items]
+    return time.perf_counter() - start, results
+
+
+graph = graph_from_db()
+source = "database"
+if graph is None:
+    graph = synthetic_graph()
+    source = f"synthetic {GRID}x{GRID} road grid, {POINTS_PER_ROAD} waypoints per segment"
+
+node_ids = list(graph.adj_list)
+pairs = [(random.choice(node_ids), random.choice(node_ids)) for _ in range(QUERIES)]
+starts = [(random.choice(node_ids), NEARBY_RADIUS_KM) for _ in range(QUERIES)]
+
+full_path_time, full_paths = timed(graph.dijkstra_shortest_path, pairs)
+full_nearby_time, full_nearby = timed(graph.bfs_nearby_facilities, starts)
+
+build_start = time.perf_counter()
+stats = graph.contract()
+build_time = time.perf_counter() - build_start
+
+reduced_path_time, reduced_paths = timed(graph.dijkstra_shortest_path, pairs)
+reduced_nearby_time, reduced_nearby = timed(graph.bfs_nearby_facilities, starts)
+
+mismatches = sum(
+    1 for full, reduced in zip(full_paths, reduced_paths)
+    if full["distance"] != reduced["distance"]
+)
+
+
+def exact_nearby(start_id, max_distance):
+    # Bounded Dijkstra on the full graph: the contracted search must find exactly these
+    return {
+        node_id: dist for node_id, dist in graph.dijkstra_distances(start_id, max_distance=max_distance).items()
+        if graph.nodes_data[node_id]['type'] == 'facility' and node_id != start_id
+    }
+
+
+nearby_mismatches = sum(
+    1 for (start_id, radius), reduced in zip(starts, reduced_nearby)
+    if {f["location_id"]: round(f["distance"], 6) for f in reduced}
+    != {node_id: round(dist, 6) for node_id, dist in exact_nearby(start_id, radius).items()}
+)
+
+print(f"Graph source: {source}")
+print(f"  nodes: {stats['nodes']:,} -> {stats['reduced_nodes']:,} ({1 - stats['reduced_nodes'] / stats['nodes']:.0%} fewer)")
+print(f"  edges: {stats['edges']:,} -> {stats['reduced_edges']:,} ({1 - stats['reduced_edges'] / max(stats['edges'], 1):.0%} fewer)")
+print(f"  chains: {stats['chains']:,} holding {stats['contracted_nodes']:,} waypoints, built in {build_time * 1000:.1f} ms")
+print()
+print(f"{QUERIES} shortest-path queries:")
+print(f"  full graph:    {full_path_time * 1000:9.1f} ms")
+print(f"  reduced graph: {reduced_path_time * 1000:9.1f} ms  ({full_path_time / reduced_path_time:.1f}x)")
+print(f"  distance mismatches: {mismatches}")
+print()
+print(f"{QUERIES} nearby-facility searches within {NEARBY_RADIUS_KM} km:")
+print(f"  full graph:    {full_nearby_time * 1000:9.1f} ms")
+print(f"  reduced graph: {reduced_nearby_time * 1000:9.1f} ms  ({full_nearby_time / reduced_nearby_time:.1f}x)")
+print(f"  mismatches against exact road distance: {nearby_mismatches}")
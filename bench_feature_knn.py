@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import numpy as np
+
+# Add the project directory to the path
+sys.path.insert(0, os.path.join(os.getcwd(), 'RealEstate_Site'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'RealEstate_Site.settings')
+
+import django
+django.setup()
+
+from locations.feature_knn import PropertyFeatureIndex, FACILITY_CATEGORIES, raw_features
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+QUERIES = 200
+BATCH = 256
+K = 10
+NPROBES = [1, 4, 8, 16, 32]
+
+rng = np.random.default_rng(11)
+
+# Listings clustered around a handful of neighbourhoods, with price following size
+centres = rng.uniform([31.35, 74.15], [31.65, 74.45], size=(40, 2))
+home = rng.integers(0, len(centres), ROWS)
+lat = centres[home, 0] + rng.normal(0, 0.01, ROWS)
+lng = centres[home, 1] + rng.normal(0, 0.01, ROWS)
+size = rng.lognormal(7.5, 0.5, ROWS).astype(int) + 200
+price = size * rng.lognormal(9.5, 0.3, ROWS)
+bedrooms = np.clip(size // 600 + rng.integers(0, 2, ROWS), 1, 10)
+bathrooms = np.clip(bedrooms - rng.integers(0, 2, ROWS), 1, 10)
+floors = rng.integers(1, 4, ROWS)
+counts = rng.poisson(2, size=(ROWS, len(FACILITY_CATEGORIES)))
+
+print(f"Building feature index over {ROWS:,} listings...")
+raw = np.array([
+    raw_features(price[i], size[i], bedrooms[i], bathrooms[i], floors[i], lat[i], lng[i], counts[i])
+    for i in range(ROWS)
+])
+ids = list(range(1, ROWS + 1))
+
+index = PropertyFeatureIndex()
+start = time.perf_counter()
+index.build(ids, raw)
+print(f"  matrix built in {time.perf_counter() - start:.2f}s")
+
+query_ids = [int(i) for i in rng.choice(ids, QUERIES, replace=False)]
+
+
+def best_of(fn, repeats=3):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+for metric in ('cosine', 'euclidean'):
+    print(f"\n[{metric}] top {K}")
+
+    loop_time, exact = best_of(lambda: [index.similar(q, K, metric, exact=True) for q in query_ids], 1)
+    print(f"  exact, one query at a time:   {loop_time / QUERIES * 1000:8.2f} ms/query")
+
+    batch_ids = query_ids * (BATCH // QUERIES + 1)
+    batch_time, _ = best_of(lambda: index.similar_batch(batch_ids[:BATCH], K, metric, exact=True), 1)
+    print(f"  exact, batches of {BATCH}:       {batch_time / BATCH * 1000:8.2f} ms/query")
+
+    start = time.perf_counter()
+    index._ivf(metric)
+    print(f"  IVF built ({index.ivf[metric].n_lists} lists) in {time.perf_counter() - start:.2f}s")
+
+    for nprobe in NPROBES:
+        ivf_time, approx = best_of(
+            lambda: index.similar_batch(query_ids, K, metric, exact=False, nprobe=nprobe)
+        )
+        recall = np.mean([
+            len({pid for pid, _ in a} & {pid for pid, _ in e}) / len(e)
+            for a, e in zip(approx, exact)
+        ])
+        print(
+            f"  IVF nprobe={nprobe:<3}                {ivf_time / QUERIES * 1000:8.2f} ms/query"
+            f"   recall@{K} {recall:.3f}   ({loop_time / ivf_time:.1f}x vs exact)"
+        )
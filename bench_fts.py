@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import random
+import tempfile
+import importlib
+
+# Add the project directory to the path
+sys.path.insert(0, os.path.join(os.getcwd(), 'RealEstate_Site'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'RealEstate_Site.settings')
+
+import django
+django.setup()
+
+from django.db import connection
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+BATCH = 50_000
+REPEATS = 5
+QUERIES = ["garden", "marble kitchen", "corner plot park", "gulb", "renovated villa pool"]
+
+# Point the default connection at a throwaway SQLite file before it is first opened
+db_path = os.path.join(tempfile.mkdtemp(), 'bench_fts.sqlite3')
+connection.settings_dict['NAME'] = db_path
+
+from listing import fulltext
+from listing.views import SEARCH_DEFAULT_LIMIT
+migration = importlib.import_module('listing.migrations.0013_property_fts')
+
+random.seed(42)
+filler = [f"w{i}" for i in range(20_000)]
+keywords = ["garden", "marble", "kitchen", "corner", "plot", "park", "renovated", "villa", "pool", "furnished"]
+areas = ["Gulberg", "DHA Phase 5", "Bahria Town", "Model Town", "Johar Town", "Cantt"]
+
+
+def words(count):
+    picked = random.choices(filler, k=count)
+    for i in random.sample(range(count), min(2, count)):
+        picked[i] = random.choice(keywords)
+    return ' '.join(picked)
+
+
+print(f"Building {ROWS:,} listings in {db_path} ...")
+start = time.perf_counter()
+with connection.cursor() as cursor:
+    cursor.execute("CREATE TABLE locations_location (id INTEGER PRIMARY KEY, name TEXT)")
+    cursor.execute(
+        "CREATE TABLE listing_property (id INTEGER PRIMARY KEY, title TEXT, description TEXT, location_id_id INTEGER)"
+    )
+    cursor.executemany(
+        "INSERT INTO locations_location (id, name) VALUES (%s, %s)",
+        [(i + 1, area) for i, area in enumerate(areas)]
+    )
+    for first in range(1, ROWS + 1, BATCH):
+        cursor.executemany(
+            "INSERT INTO listing_property (id, title, description, location_id_id) VALUES (%s, %s, %s, %s)",
+            [
+                (prop_id, words(4), words(random.randint(20, 60)), random.randint(1, len(areas)))
+                for prop_id in range(first, min(first + BATCH, ROWS + 1))
+            ]
+        )
+print(f"  rows inserted in {time.perf_counter() - start:.1f}s")
+
+# The migration's own DDL: FTS table, sync triggers and backfill
+start = time.perf_counter()
+with connection.cursor() as cursor:
+    for statement in migration.CREATE_STATEMENTS:
+        cursor.execute(statement)
+print(f"  FTS5 index built in {time.perf_counter() - start:.1f}s")
+
+
+def icontains(text):
+    # What Property.objects.filter(Q(title__icontains=...) | Q(description__icontains=...)) runs on SQLite
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT id FROM listing_property WHERE title LIKE %s ESCAPE '\\' OR description LIKE %s ESCAPE '\\'",
+            [f"%{text}%", f"%{text}%"]
+        )
+        return cursor.fetchall()
+
+
+def timed(fn, text):
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best, len(result)
+
+
+print()
+print(f"{'query':<24} {'icontains':>18} {f'FTS5 top {SEARCH_DEFAULT_LIMIT} (endpoint)':>26}   speedup {'FTS5 every match':>24}   speedup")
+for text in QUERIES:
+    like_time, like_rows = timed(icontains, text)
+    fts_time, fts_rows = timed(lambda t: fulltext.search(t, SEARCH_DEFAULT_LIMIT), text)
+    all_time, all_rows = timed(lambda t: fulltext.search(t), text)
+    print(
+        f"{text:<24} {like_time * 1000:8.1f} ms ({like_rows:>7,}) {fts_time * 1000:14.1f} ms ({fts_rows:>7,})"
+        f"   {like_time / fts_time:6.1f}x {all_time * 1000:12.1f} ms ({all_rows:>7,})   {like_time / all_time:6.1f}x"
+    )
+print()
+print("icontains scans every row and returns all substring hits unranked; multi-word queries")
+print("only match that exact phrase. FTS5 matches whole words (the last as a prefix) anywhere in")
+print("title/description/location, but bm25 scores every match before the top N is kept, so a word")
+print("found in a large share of the listings costs about as much as the scan.")
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import math
+import time
+import random
+
+# Add the project directory to the path
+sys.path.insert(0, os.path.join(os.getcwd(), 'RealEstate_Site'))
+
+import numpy as np
+from locations.utilis import calculate_haversine, haversine_one_to_many, haversine_pairwise, haversine_many_to_many
+
+PAIRS = 1_000_000
+SCALAR_SAMPLE = 200_000
+
+random.seed(7)
+lats1 = [random.uniform(31.3, 31.7) for _ in range(PAIRS)]
+lngs1 = [random.uniform(74.1, 74.5) for _ in range(PAIRS)]
+lats2 = [random.uniform(31.3, 31.7) for _ in range(PAIRS)]
+lngs2 = [random.uniform(74.1, 74.5) for _ in range(PAIRS)]
+
+# Radians are precomputed once, the same way CoordinateRegistry stores them
+lats1_rad, lngs1_rad = np.radians(lats1), np.radians(lngs1)
+lats2_rad, lngs2_rad = np.radians(lats2), np.radians(lngs2)
+
+print(f"Benchmarking haversine over {PAIRS:,} pairs...")
+
+start = time.perf_counter()
+scalar = [calculate_haversine(lats1[i], lngs1[i], lats2[i], lngs2[i]) for i in range(SCALAR_SAMPLE)]
+scalar_per_million = (time.perf_counter() - start) * PAIRS / SCALAR_SAMPLE
+print(f"  scalar calculate_haversine:   {scalar_per_million * 1000:9.1f} ms / 1M pairs (extrapolated from {SCALAR_SAMPLE:,})")
+
+start = time.perf_counter()
+pairwise = haversine_pairwise(lats1_rad, lngs1_rad, lats2_rad, lngs2_rad)
+pairwise_time = time.perf_counter() - start
+print(f"  haversine_pairwise:           {pairwise_time * 1000:9.1f} ms / 1M pairs  ({scalar_per_million / pairwise_time:.0f}x)")
+
+start = time.perf_counter()
+one_to_many = haversine_one_to_many(lats1_rad[0], lngs1_rad[0], lats2_rad, lngs2_rad)
+one_to_many_time = time.perf_counter() - start
+print(f"  haversine_one_to_many:        {one_to_many_time * 1000:9.1f} ms / 1M pairs  ({scalar_per_million / one_to_many_time:.0f}x)")
+
+start = time.perf_counter()
+matrix = haversine_many_to_many(lats1_rad[:1000], lngs1_rad[:1000], lats2_rad[:1000], lngs2_rad[:1000])
+matrix_time = time.perf_counter() - start
+print(f"  haversine_many_to_many 1Kx1K: {matrix_time * 1000:9.1f} ms / 1M pairs  ({scalar_per_million / matrix_time:.0f}x)")
+
+max_error = max(abs(scalar[i] - pairwise[i]) for i in range(0, SCALAR_SAMPLE, 997))
+print(f"\nMax abs difference vs scalar: {max_error:.2e} km")
+assert math.isclose(matrix[3, 5], calculate_haversine(lats1[3], lngs1[3], lats2[5], lngs2[5]), abs_tol=1e-9)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import random
+
+# Add the project directory to the path
+sys.path.insert(0, os.path.join(os.getcwd(), 'RealEstate_Site'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'RealEstate_Site.settings')
+
+import django
+django.setup()
+
+from locations.graphs import LocationGraph
+from locations.loader import load_graph
+from locations.priority_queues import PRIORITY_QUEUES, DEFAULT_PRIORITY_QUEUE
+
+QUERIES = 60
+TREES = 20
+
+# Synthetic fallback: a jittered GRID x GRID street grid with a few diagonal shortcuts
+GRID = 120
+
+
+def graph_from_db():
+    graph = LocationGraph()
+    try:
+        load_graph(graph)
+    except Exception as e:
+        print(f"Could not load the location graph from the database ({e})")
+        return None
+    return graph if graph.adj_list else None
+
+
+def synthetic_graph():
+    random.seed(3)
+    graph = LocationGraph()
+    for i in range(GRID * GRID):
+        graph.add_node(i, f"junction {i}", 'way_point')
+
+    for r in range(GRID):
+        for c in range(GRID):
+            node = r * GRID + c
+            if c + 1 < GRID:
+                graph.add_edge(node, node + 1, random.uniform(0.05, 0.4))
+            if r + 1 < GRID:
+                graph.add_edge(node, node + GRID, random.uniform(0.05, 0.4))
+            if r + 1 < GRID and c + 1 < GRID and random.random() < 0.1:
+                graph.add_edge(node, node + GRID + 1, random.uniform(0.1, 0.5))
+    return graph
+
+
+graph = graph_from_db()
+source = "database"
+if graph is None:
+    graph = synthetic_graph()
+    source = f"synthetic {GRID}x{GRID} street grid"
+
+random.seed(19)
+node_ids = list(graph.adj_list)
+pairs = [(random.choice(node_ids), random.choice(node_ids)) for _ in range(QUERIES)]
+roots = [random.choice(node_ids) for _ in range(TREES)]
+
+print(f"Graph source: {source} ({len(node_ids):,} nodes)")
+print(f"{'queue':<10} {QUERIES} shortest paths   {TREES} full trees")
+
+baseline = None
+for kind in PRIORITY_QUEUES:
+    graph.queue_kind = kind
+
+    start = time.perf_counter()
+    paths = [graph.dijkstra_shortest_path(a, b)["distance"] for a, b in pairs]
+    path_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    trees = [graph.dijkstra_distances(root) for root in roots]
+    tree_time = time.perf_counter() - start
+
+    if baseline is None:
+        baseline = (paths, trees, path_time, tree_time)
+    assert paths == baseline[0], f"{kind} disagrees on shortest-path distances"
+    assert all(
+        all(abs(tree[node] - expected[node]) < 1e-9 for node in expected)
+        for tree, expected in zip(trees, baseline[1])
+    ), f"{kind} disagrees on distance trees"
+
+    marker = "  (default)" if kind == DEFAULT_PRIORITY_QUEUE else ""
+    print(
+        f"{kind:<10} {path_time * 1000:9.1f} ms ({baseline[2] / path_time:4.1f}x)"
+        f"   {tree_time * 1000:9.1f} ms ({baseline[3] / tree_time:4.1f}x){marker}"
+    )